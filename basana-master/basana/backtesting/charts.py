@@ -230,6 +230,25 @@ class CustomLineChart(LineChart):
                 ts.add_value(dt, value)
 
 
+class SeriesLineChart(LineChart):
+    def __init__(self, name: str):
+        self._name = name
+        self._lines: Dict[str, Tuple[Sequence[datetime], Sequence[Any], bool]] = {}
+
+    def get_title(self) -> str:
+        return self._name
+
+    def add_traces(self, figure: go.Figure, row: int):
+        for name, (x, y, markers) in self._lines.items():
+            scatter = go.Scatter(x=x, y=y, name=name, mode="markers") if markers else go.Scatter(x=x, y=y, name=name)
+            figure.add_trace(scatter, row=row, col=1)
+
+    def add_line(self, name: str, x: Sequence[datetime], y: Sequence[Any], markers: bool):
+        assert name not in self._lines
+        assert len(x) == len(y), "x and y should have the same length"
+        self._lines[name] = (list(x), list(y), markers)
+
+
 class LineCharts:
     """A set of line charts that show the evolution of pair prices and account balances over time.
 
@@ -241,6 +260,7 @@ class LineCharts:
         self._pair_charts: Dict[Pair, PairLineChart] = collections.OrderedDict()
         self._portfolio_charts: Dict[str, PortfolioValueLineChart] = collections.OrderedDict()
         self._custom_charts: Dict[str, CustomLineChart] = collections.OrderedDict()
+        self._series_charts: Dict[str, SeriesLineChart] = collections.OrderedDict()
 
     def add_balance(self, symbol: str):
         """Adds a chart with an account's balance.
@@ -293,6 +313,23 @@ class LineCharts:
             self._custom_charts[name] = chart
         chart.add_data_point_fn(line, get_data_point)
 
+    def add_series(self, name: str, line: str, x: Sequence[datetime], y: Sequence[Any], markers: bool = False):
+        """Adds a chart line from values that were already calculated.
+
+        Unlike the other charts, this one doesn't subscribe to any events, so it has no overhead while the backtest
+        runs.
+
+        :param name: The name of the chart.
+        :param line: The name of the line.
+        :param x: The datetimes.
+        :param y: The values.
+        :param markers: True to draw markers instead of a line.
+        """
+        if (chart := self._series_charts.get(name)) is None:
+            chart = SeriesLineChart(name)
+            self._series_charts[name] = chart
+        chart.add_line(line, x, y, markers)
+
     def show(self, show_legend: bool = True):  # pragma: no cover
         """Shows the chart using either the default renderer(s).
 
@@ -331,6 +368,7 @@ class LineCharts:
         charts.extend(self._balance_charts.values())
         charts.extend(self._portfolio_charts.values())
         charts.extend(self._custom_charts.values())
+        charts.extend(self._series_charts.values())
 
         figure = None
         if charts:
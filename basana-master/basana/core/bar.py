@@ -42,6 +42,9 @@ class Bar:
     :param volume: The volume traded.
     """
 
+    # Backtests over minute bars allocate millions of these.
+    __slots__ = ("datetime", "pair", "open", "high", "low", "close", "volume")
+
     def __init__(
             self, datetime: datetime.datetime, pair: pair.Pair,
             open: Decimal, high: Decimal, low: Decimal, close: Decimal, volume: Decimal
@@ -72,6 +75,25 @@ class Bar:
         #: The volume traded.
         self.volume = volume
 
+    @classmethod
+    def unchecked(
+            cls, datetime: datetime.datetime, pair: pair.Pair,
+            open: Decimal, high: Decimal, low: Decimal, close: Decimal, volume: Decimal
+    ) -> "Bar":
+        """Builds a bar without validating the prices.
+
+        Only for event sources that deliver bars that were already validated, like bars loaded into a dataset.
+        """
+        ret = cls.__new__(cls)
+        ret.datetime = datetime
+        ret.pair = pair
+        ret.open = open
+        ret.high = high
+        ret.low = low
+        ret.close = close
+        ret.volume = volume
+        return ret
+
 
 class BarEvent(event.Event):
     """An event for :class:`Bar` instances.
@@ -80,6 +102,8 @@ class BarEvent(event.Event):
     :param bar: The bar.
     """
 
+    __slots__ = ("bar", )
+
     def __init__(self, when: datetime.datetime, bar: Bar):
         super().__init__(when)
 
@@ -63,6 +63,8 @@ class Event:
         This is a base class and should not be used directly.
     """
 
+    __slots__ = ("when", )
+
     def __init__(self, when: datetime.datetime):
         assert not dt.is_naive(when), f"{when} should have timezone information set"
 
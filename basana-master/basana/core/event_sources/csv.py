@@ -14,13 +14,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Optional, Sequence
+from typing import IO, BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 import abc
 import codecs
 import contextlib
 import csv
+import datetime
+import heapq
+import io
+import itertools
+import pickle
+import tempfile
 
-from basana.core import event
+from basana.core import dt, errors, event
+from basana.core.event_sources import manifest
+
+
+#: The maximum number of events that :func:`load_sort_and_yield` keeps in memory while loading. Beyond that, events
+#: that are out of order are sorted in chunks on disk.
+MAX_EVENTS_IN_MEMORY = 100_000
+
+_SPILL_BLOCK_SIZE = 1000
 
 # This module is not using async io. Why ?
 # asyncio does not support asynchronous operations on the filesystem.
@@ -31,8 +45,8 @@ from basana.core import event
 # I decided not to support async io initially.
 
 
-@contextlib.contextmanager
-def open_file_with_detected_encoding(filename, default_encoding='utf-8'):
+def _detect_encoding(filename, default_encoding='utf-8') -> Tuple[str, int]:
+    # Returns the encoding and the size of the bom.
     with open(filename, 'rb') as file:
         raw = file.read(4)  # Read enough bytes to detect BOMs
 
@@ -43,19 +57,24 @@ def open_file_with_detected_encoding(filename, default_encoding='utf-8'):
         (codecs.BOM_UTF16_BE, "utf-16-be"),
         (codecs.BOM_UTF8, "utf-8-sig"),
     ]
-    encoding = default_encoding
-    offset = 0
     for bom, enc in boms:
         if raw.startswith(bom):
-            encoding = enc
-            offset = len(bom)
-            break
+            return enc, len(bom)
+    return default_encoding, 0
+
+
+@contextlib.contextmanager
+def open_file_with_detected_encoding(filename, default_encoding='utf-8'):
+    encoding, offset = _detect_encoding(filename, default_encoding=default_encoding)
 
     # Re-open the file with the detected encoding and skip the bom.
-    f = open(filename, 'r', encoding=encoding)
-    if offset:
-        f.seek(offset)
-    yield f
+    with open(filename, 'r', encoding=encoding) as f:
+        if offset:
+            f.seek(offset)
+        yield f
+
+
+ValuesParser = Callable[[Sequence[str]], Sequence[event.Event]]
 
 
 class RowParser(metaclass=abc.ABCMeta):
@@ -63,48 +82,346 @@ class RowParser(metaclass=abc.ABCMeta):
     def parse_row(self, row_dict: dict) -> Sequence[event.Event]:
         raise NotImplementedError()
 
+    def get_values_parser(self, fieldnames: Sequence[str]) -> Optional[ValuesParser]:
+        """Returns a function to parse rows as lists of values, or None if rows should be parsed as dicts.
 
-def load_sort_and_yield(csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict = {}):
-    events = []
+        Reading rows as lists is faster than as dicts, so parsers for fixed formats can override this.
 
-    # Load events.
-    with open_file_with_detected_encoding(csv_path) as f:
+        :param fieldnames: The column names, from the header.
+        """
+        return None
+
+    def events_follow_first_column(self, fieldnames: Sequence[str]) -> bool:
+        """Returns True if events are in the same order as the datetimes in the first column.
+
+        That is the case if rows yield at most one event, with a datetime that increases with the one in the first
+        column. Files that a manifest says are sorted are then not sorted again, and the index in the manifest is used
+        to seek. See :mod:`basana.core.event_sources.manifest`.
+
+        :param fieldnames: The column names, from the header.
+        """
+        return False
+
+
+def _parse_rows(f, row_parser: RowParser, dict_reader_kwargs: dict) -> Iterator[event.Event]:
+    if dict_reader_kwargs:
         dict_reader = csv.DictReader(f, **dict_reader_kwargs)
-        for row in dict_reader:
-            for ev in row_parser.parse_row(row):
-                events.append(ev)
+    else:
+        reader = csv.reader(f)
+        fieldnames = next(reader, None)
+        if fieldnames is None:
+            return
+        parse_values = row_parser.get_values_parser(fieldnames)
+        if parse_values is not None:
+            for values in reader:
+                # Empty rows are skipped, same as with DictReader.
+                if values:
+                    yield from parse_values(values)
+            return
+        dict_reader = csv.DictReader(f, fieldnames=fieldnames)
 
-    # Sort them for proper delivery.
-    events = sorted(events, key=lambda ev: ev.when)
+    for row in dict_reader:
+        yield from row_parser.parse_row(row)
 
-    for ev in events:
-        yield ev
 
+def _line_datetime(line: bytes, parse_values: ValuesParser) -> Optional[datetime.datetime]:
+    # The datetime for the first event in a line, or None if the line has no events.
+    values = next(csv.reader([line.decode("utf-8")]), None)
+    events = parse_values(values) if values else []
+    return events[0].when if events else None
+
+
+def _find_offset(f: BinaryIO, lo: int, hi: int, parse_values: ValuesParser, start: datetime.datetime) -> int:
+    # Binary search over byte offsets for a line to start reading from, so that all the events before it are earlier
+    # than start. lo and hi are line starts, and the events should be sorted.
+    while lo < hi:
+        mid = (lo + hi) // 2
+        # Move to the first line that begins at or after mid.
+        if mid > lo:
+            f.seek(mid - 1)
+            f.readline()
+        else:
+            f.seek(mid)
+        pos = f.tell()
+        if pos >= hi:
+            # The line that spans mid is the last one in the range. It'll be filtered while reading.
+            break
+
+        # Look for the next line with events, since rows can be skipped, like bars with no volume.
+        line_pos = pos
+        when = None
+        while line_pos < hi and when is None:
+            line = f.readline()
+            if not line:
+                break
+            when = _line_datetime(line, parse_values)
+            if when is None:
+                line_pos = f.tell()
 
-def load_and_yield(csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict = {}):
+        if when is not None and when < start:
+            lo = f.tell()
+        else:
+            hi = pos
+    return lo
 
-    # Load events.
+
+def _bracket(
+        f: BinaryIO, index: Sequence[Tuple[float, int]], lo: int, hi: int, parse_values: ValuesParser,
+        start: datetime.datetime
+) -> Tuple[int, int]:
+    # Narrows the range for _find_offset using the line offsets in a manifest index. Index entries are checked by
+    # parsing their lines, so the datetimes in the index don't need to match the ones for the events.
+    left, right = 0, len(index)
+    while left < right:
+        mid = (left + right) // 2
+        f.seek(index[mid][1])
+        when = _line_datetime(f.readline(), parse_values)
+        # Lines with no events are not known to be earlier than start, so they're safe upper bounds.
+        if when is not None and when < start:
+            left = mid + 1
+        else:
+            right = mid
+    if left > 0:
+        lo = max(lo, index[left - 1][1])
+    if left < len(index):
+        hi = min(hi, index[left][1])
+    return lo, hi
+
+
+def _manifest_applies(csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict) -> bool:
+    # Manifests are built from the datetimes in the first column, which tell the order of the events only for some
+    # parsers.
+    if dict_reader_kwargs:
+        return False
     with open_file_with_detected_encoding(csv_path) as f:
-        dict_reader = csv.DictReader(f, **dict_reader_kwargs)
-        for row in dict_reader:
-            for ev in row_parser.parse_row(row):
-                yield ev
+        fieldnames = next(csv.reader(f), None)
+    return fieldnames is not None and row_parser.events_follow_first_column(fieldnames)
+
+
+def _find_start(csv_path: str, row_parser: RowParser, start: datetime.datetime) -> Optional[Tuple[int, ValuesParser]]:
+    # Returns the offset to start reading rows from, and the parser for them, or None if seeking is not supported.
+    # Only UTF-8 files, that have single byte line terminators, with rows that can be parsed as values are supported.
+    encoding, offset = _detect_encoding(csv_path)
+    if encoding not in ("utf-8", "utf-8-sig"):
+        return None
+    with open(csv_path, "rb") as f:
+        f.seek(offset)
+        header = f.readline()
+        fieldnames = next(csv.reader([header.decode("utf-8")]), None)
+        if not fieldnames:
+            return None
+        parse_values = row_parser.get_values_parser(fieldnames)
+        if parse_values is None:
+            return None
+        lo, hi = offset + len(header), f.seek(0, io.SEEK_END)
+        file_manifest = manifest.load(csv_path) if row_parser.events_follow_first_column(fieldnames) else None
+        if file_manifest is not None and file_manifest.sorted and file_manifest.index:
+            lo, hi = _bracket(f, file_manifest.index, lo, hi, parse_values, start)
+        return _find_offset(f, lo, hi, parse_values, start), parse_values
+
+
+def _parse_values_from(csv_path: str, offset: int, parse_values: ValuesParser) -> Iterator[event.Event]:
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        f.seek(offset)
+        for values in csv.reader(f):
+            if values:
+                yield from parse_values(values)
+
+
+def _in_range(
+        events: Iterable[event.Event], start: Optional[datetime.datetime], end: Optional[datetime.datetime]
+) -> Iterator[event.Event]:
+    for ev in events:
+        if (start is None or ev.when >= start) and (end is None or ev.when < end):
+            yield ev
+
+
+def _read_prefix(
+        csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict, start: Optional[datetime.datetime],
+        end: Optional[datetime.datetime], count: int
+) -> Iterator[event.Event]:
+    # Parses the first events in the file again.
+    with open_file_with_detected_encoding(csv_path) as f:
+        yield from itertools.islice(_in_range(_parse_rows(f, row_parser, dict_reader_kwargs), start, end), count)
+
+
+def _spill(events: List[event.Event]) -> IO[bytes]:
+    # Writes events to a temporary file, in blocks, so they can be read back a few at a time.
+    ret = tempfile.TemporaryFile()
+    try:
+        for i in range(0, len(events), _SPILL_BLOCK_SIZE):
+            pickle.dump(events[i:i + _SPILL_BLOCK_SIZE], ret, protocol=pickle.HIGHEST_PROTOCOL)
+        ret.seek(0)
+    except BaseException:
+        ret.close()
+        raise
+    return ret
+
+
+def _read_spilled(f: IO[bytes]) -> Iterator[event.Event]:
+    with f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                break
+            yield from block
+
+
+def _save_manifest(csv_path: str):
+    try:
+        manifest.get(csv_path)
+    except errors.Error:
+        # The first column doesn't have ISO 8601 datetimes, or the file is not UTF-8 encoded.
+        pass
+
+
+def _event_datetime(ev: event.Event) -> datetime.datetime:
+    return ev.when
+
+
+def load_sort_and_yield(
+        csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict = {},
+        start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+        max_events_in_memory: int = MAX_EVENTS_IN_MEMORY, save_manifest: bool = False
+):
+    """Loads events from a CSV file and yields them sorted.
+
+    Events are read in chunks. While events are in order, chunks are discarded and the events get parsed again when
+    they're yielded, so sorted files take constant memory. Once events are out of order, chunks are sorted and written
+    to temporary files, and then merged. Events need to be picklable in that case.
+
+    If the file has an up to date manifest that says it is sorted, and the row parser says events follow the first
+    column, events are yielded as they're read instead. See :meth:`RowParser.events_follow_first_column`.
+
+    :param save_manifest: True to save a manifest next to sorted files that take more than one chunk, so they're parsed
+        only once the next time. Only for row parsers whose events follow the first column.
+    """
+    assert max_events_in_memory > 0, "Invalid max_events_in_memory"
+
+    # There is no need to sort files that are known to be sorted. See basana.core.event_sources.manifest.
+    manifest_applies = _manifest_applies(csv_path, row_parser, dict_reader_kwargs)
+    file_manifest = manifest.load(csv_path) if manifest_applies else None
+    if file_manifest is not None and file_manifest.sorted:
+        yield from load_and_yield(csv_path, row_parser, dict_reader_kwargs=dict_reader_kwargs, start=start, end=end)
+        return
+
+    sorted_count = 0  # The number of events, from the beginning of the file, that are known to be sorted.
+    in_order = True
+    last_when: Optional[datetime.datetime] = None
+    chunk: List[event.Event] = []
+    spilled: List[IO[bytes]] = []
+    try:
+        # Load events.
+        with open_file_with_detected_encoding(csv_path) as f:
+            for ev in _in_range(_parse_rows(f, row_parser, dict_reader_kwargs), start, end):
+                if in_order and last_when is not None and ev.when < last_when:
+                    in_order = False
+                last_when = ev.when
+                chunk.append(ev)
+                if len(chunk) == max_events_in_memory:
+                    if in_order:
+                        sorted_count += len(chunk)
+                    else:
+                        chunk.sort(key=_event_datetime)
+                        spilled.append(_spill(chunk))
+                    chunk = []
+        if save_manifest and manifest_applies and in_order and sorted_count:
+            _save_manifest(csv_path)
+
+        # Sort them for proper delivery.
+        runs: List[Iterable[event.Event]] = []
+        if sorted_count:
+            runs.append(_read_prefix(csv_path, row_parser, dict_reader_kwargs, start, end, sorted_count))
+        runs.extend(_read_spilled(spilled_file) for spilled_file in spilled)
+        if not in_order:
+            chunk.sort(key=_event_datetime)
+        runs.append(chunk)
+
+        if in_order:
+            for run in runs:
+                yield from run
+        else:
+            # The merge is stable, so events with the same datetime are yielded in the same order as in the file.
+            yield from heapq.merge(*runs, key=_event_datetime)
+    finally:
+        for spilled_file in spilled:
+            spilled_file.close()
+
+
+def load_and_yield(
+        csv_path: str, row_parser: RowParser, dict_reader_kwargs: dict = {},
+        start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None
+):
+    # Files are expected to be sorted, so the rows before start can be skipped, and reading can stop at end.
+    found = None
+    if start is not None and not dict_reader_kwargs:
+        found = _find_start(csv_path, row_parser, start)
+
+    if found is None:
+        # Load events.
+        with open_file_with_detected_encoding(csv_path) as f:
+            yield from _until(_in_range(_parse_rows(f, row_parser, dict_reader_kwargs), start, None), end)
+    else:
+        # The rows before the offset are earlier than start, but a few after it may be too.
+        yield from _until(_in_range(_parse_values_from(csv_path, *found), start, None), end)
+
+
+def _until(events: Iterator[event.Event], end: Optional[datetime.datetime]) -> Iterator[event.Event]:
+    for ev in events:
+        if end is not None and ev.when >= end:
+            break
+        yield ev
 
 
 class EventSource(event.EventSource, event.Producer):
-    def __init__(self, csv_path: str, row_parser: RowParser, sort: bool = True, dict_reader_kwargs: dict = {}):
+    """An event source for events loaded from a CSV file.
+
+    :param csv_path: The path to the CSV file.
+    :param row_parser: The parser for the rows.
+    :param sort: True to sort the events. If False, events should be sorted in the file.
+    :param dict_reader_kwargs: Arguments for the csv.DictReader.
+    :param start: If set, events before this datetime are skipped.
+    :param end: If set, events at or after this datetime are skipped.
+    :param save_manifest: True to save a manifest next to files that turn out to be sorted while sorting them. See
+        :func:`load_sort_and_yield`.
+
+    .. note::
+
+        For sorted files, reading starts at the first row that is not earlier than start, which is found using
+        binary search, and stops at end. Otherwise, all the rows are read, and the events outside the range are
+        filtered. Files are taken as sorted if sort is False, or if they have an up to date manifest that says so, for
+        row parsers whose events follow the first column. See :mod:`basana.core.event_sources.manifest`.
+    """
+
+    def __init__(
+            self, csv_path: str, row_parser: RowParser, sort: bool = True, dict_reader_kwargs: dict = {},
+            start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+            save_manifest: bool = False
+    ):
+        assert start is None or not dt.is_naive(start), f"{start} should have timezone information set"
+        assert end is None or not dt.is_naive(end), f"{end} should have timezone information set"
+
         super().__init__(producer=self)
         self._csv_path = csv_path
         self._row_parser = row_parser
         self._sort = sort
         self._dict_reader_kwargs = dict_reader_kwargs
+        self._start = start
+        self._end = end
+        self._save_manifest = save_manifest
         self._row_it = None
 
     async def initialize(self):
         if self._sort:
-            self._row_it = load_sort_and_yield(self._csv_path, self._row_parser, self._dict_reader_kwargs)
+            self._row_it = load_sort_and_yield(
+                self._csv_path, self._row_parser, self._dict_reader_kwargs, start=self._start, end=self._end,
+                save_manifest=self._save_manifest
+            )
         else:
-            self._row_it = load_and_yield(self._csv_path, self._row_parser, self._dict_reader_kwargs)
+            self._row_it = load_and_yield(
+                self._csv_path, self._row_parser, self._dict_reader_kwargs, start=self._start, end=self._end
+            )
 
     async def finalize(self):
         self._row_it = None
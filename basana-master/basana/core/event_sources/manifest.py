@@ -0,0 +1,189 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Manifests with facts about CSV files whose first column is a datetime, so they don't need to be read to get them.
+
+A manifest is a JSON file next to the CSV file, with the same name followed by ``.manifest.json``. It holds the
+checksum of the file, the number of rows, the time bounds, the most common period between rows, whether rows are
+sorted, and a sparse index with the byte offset of every :data:`INDEX_STEP` rows.
+
+Manifests are only used while the size and modification time of the file match the ones in the manifest.
+"""
+
+from typing import List, Optional, Tuple
+import codecs
+import collections
+import dataclasses
+import datetime
+import hashlib
+import json
+import math
+import os
+
+from basana.core import errors
+
+
+#: The version of the format.
+VERSION = 1
+
+#: The number of rows between entries in the index.
+INDEX_STEP = 10000
+
+_SUFFIX = ".manifest.json"
+
+
+@dataclasses.dataclass
+class Manifest:
+    #: The size of the file, in bytes.
+    size: int
+    #: The modification time of the file, in nanoseconds.
+    mtime_ns: int
+    #: The SHA-256 checksum of the file.
+    checksum: str
+    #: The number of rows, excluding the header and empty lines.
+    rows: int
+    #: The earliest datetime, as a POSIX timestamp. Naive datetimes are taken as UTC.
+    min_timestamp: Optional[float]
+    #: The latest datetime, as a POSIX timestamp. Naive datetimes are taken as UTC.
+    max_timestamp: Optional[float]
+    #: The most common number of seconds between consecutive rows, or None if there are less than two datetimes.
+    period: Optional[float]
+    #: True if rows are sorted by datetime.
+    sorted: bool
+    #: The number of times the datetime increases by more than the period between consecutive rows.
+    gaps: int
+    #: The datetime, as a POSIX timestamp, and the byte offset of every INDEX_STEP rows, beginning with the first one.
+    index: List[Tuple[float, int]]
+    version: int = VERSION
+
+
+def manifest_path(path: str) -> str:
+    """Returns the path to the manifest for a CSV file."""
+    return path + _SUFFIX
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _timestamp(value: bytes) -> float:
+    ret = datetime.datetime.fromisoformat(value.strip().strip(b'"').decode("utf-8"))
+    # Subtracting naive datetimes is faster than setting the timezone.
+    if ret.tzinfo is None:
+        return (ret - _EPOCH).total_seconds()
+    return ret.timestamp()
+
+
+def build(path: str, index_step: int = INDEX_STEP) -> Manifest:
+    """Builds the manifest for a CSV file by reading it.
+
+    :param path: The path to the CSV file. It should be UTF-8 encoded, have a header, and an ISO 8601 datetime in the
+        first column.
+    :param index_step: The number of rows between entries in the index.
+    :raises basana.core.errors.Error: If a datetime can't be parsed.
+    """
+    assert index_step > 0, "Invalid index step"
+
+    stat = os.stat(path)
+    checksum = hashlib.sha256()
+    rows = 0
+    min_timestamp = max_timestamp = previous = math.inf
+    is_sorted = True
+    deltas: collections.Counter = collections.Counter()
+    index = []
+    with open(path, "rb") as f:
+        header = f.readline()
+        if header.startswith(codecs.BOM_UTF16_LE) or header.startswith(codecs.BOM_UTF16_BE):
+            raise errors.Error(f"{path} is not UTF-8 encoded")
+        checksum.update(header)
+        offset = len(header)
+        for line in f:
+            checksum.update(line)
+            value = line.split(b",", 1)[0]
+            if line.strip():
+                try:
+                    timestamp = _timestamp(value)
+                except (ValueError, UnicodeDecodeError):
+                    raise errors.Error(f"Invalid datetime {value!r} at offset {offset} in {path}")
+                if rows % index_step == 0:
+                    index.append((timestamp, offset))
+                if rows == 0:
+                    min_timestamp = max_timestamp = timestamp
+                elif timestamp > previous:
+                    deltas[timestamp - previous] += 1
+                    max_timestamp = max(max_timestamp, timestamp)
+                elif timestamp < previous:
+                    is_sorted = False
+                    min_timestamp = min(min_timestamp, timestamp)
+                previous = timestamp
+                rows += 1
+            offset += len(line)
+
+    period = deltas.most_common(1)[0][0] if deltas else None
+    gaps = sum(count for delta, count in deltas.items() if period is not None and delta > period)
+    return Manifest(
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, checksum=checksum.hexdigest(), rows=rows,
+        min_timestamp=min_timestamp if rows else None, max_timestamp=max_timestamp if rows else None, period=period,
+        sorted=is_sorted, gaps=gaps, index=index
+    )
+
+
+def save(path: str, manifest: Manifest):
+    """Saves the manifest for a CSV file.
+
+    :param path: The path to the CSV file.
+    :param manifest: The manifest.
+    """
+    tmp_path = f"{manifest_path(path)}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(dataclasses.asdict(manifest), f)
+    os.replace(tmp_path, manifest_path(path))
+
+
+def load(path: str) -> Optional[Manifest]:
+    """Loads the manifest for a CSV file.
+
+    :param path: The path to the CSV file.
+    :returns: The manifest, or None if it is missing or out of date.
+    """
+    try:
+        with open(manifest_path(path), "r") as f:
+            values = json.load(f)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if values.get("version") != VERSION or values.get("size") != stat.st_size \
+            or values.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    values["index"] = [tuple(entry) for entry in values["index"]]
+    return Manifest(**values)
+
+
+def get(path: str) -> Manifest:
+    """Returns the manifest for a CSV file, building and saving it if it is missing or out of date.
+
+    If the manifest can't be saved, like when the directory is read only, it is returned anyway.
+
+    :param path: The path to the CSV file.
+    :raises basana.core.errors.Error: If a datetime can't be parsed.
+    """
+    ret = load(path)
+    if ret is None:
+        ret = build(path)
+        try:
+            save(path, ret)
+        except OSError:
+            pass
+    return ret
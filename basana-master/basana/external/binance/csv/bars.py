@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import Optional
 import datetime
 
 from basana.core import pair
@@ -32,11 +33,17 @@ class BarSource(csv.EventSource):
     def __init__(
             self, pair: pair.Pair, csv_path: str, period: str,
             sort: bool = False, tzinfo: datetime.tzinfo = datetime.timezone.utc,
-            dict_reader_kwargs: dict = {}
+            dict_reader_kwargs: dict = {}, start: Optional[datetime.datetime] = None,
+            end: Optional[datetime.datetime] = None
     ):
         # The datetime in the files are the beginning of the period but we need to generate the event at the period's
         # end.
         timedelta = period_to_timedelta.get(period)
         assert timedelta is not None, "Invalid period"
         self.row_parser = RowParser(pair, tzinfo=tzinfo, timedelta=timedelta)
-        super().__init__(csv_path, self.row_parser, sort=sort, dict_reader_kwargs=dict_reader_kwargs)
+        # Bars are filtered using the beginning of the period, and events using the end.
+        super().__init__(
+            csv_path, self.row_parser, sort=sort, dict_reader_kwargs=dict_reader_kwargs,
+            start=None if start is None else self.row_parser.event_datetime(start),
+            end=None if end is None else self.row_parser.event_datetime(end)
+        )
@@ -0,0 +1,368 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ingests the monthly kline archives from https://data.binance.vision into one CSV file per symbol and interval.
+
+Usage: ``python -m basana.external.binance.tools.ingest_klines -i data/spot/monthly/klines -o data -t 1h 4h``
+
+Archives, like ``BTCUSDT-1h-2023-01.zip``, are read without unzipping them, from anywhere under the input directory.
+New archives are parsed in a process pool, and each output file is written as soon as its archives are. Rows are
+validated and deduplicated, and gaps are reported. Only months that were not ingested before are appended to the
+output files, which are named like ``BTCUSDT1H.csv`` and have datetime,open,high,low,close,volume columns. The
+archives that were ingested into each file are tracked in a state file next to it, and a manifest is built for it
+(see :mod:`basana.core.event_sources.manifest`).
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import collections
+import csv
+import dataclasses
+import datetime
+import io
+import json
+import math
+import os
+import re
+import zipfile
+
+from basana.core.event_sources import manifest
+from basana.external.binance.tools.download_bars import period_to_step
+
+
+#: The version of the state files.
+STATE_VERSION = 1
+
+# Monthly bars don't have a fixed length, and their output file name would clash with the one for 1m bars.
+INTERVALS = [interval for interval in period_to_step if interval != "1M"]
+
+_ARCHIVE_RE = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<interval>\w+)-(?P<month>\d{4}-\d{2})\.zip$")
+
+# Timestamps are in milliseconds, or in microseconds in recent archives.
+_MICROSECONDS_THRESHOLD = 10 ** 14
+
+# A row with the beginning of the period, as a POSIX timestamp in seconds, open, high, low, close and volume.
+Row = Tuple[int, str, str, str, str, str]
+
+
+@dataclasses.dataclass(frozen=True)
+class Archive:
+    #: The path to the archive.
+    path: str
+    #: The symbol, like BTCUSDT.
+    symbol: str
+    #: The interval, like 1h.
+    interval: str
+    #: The month, in YYYY-MM format.
+    month: str
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+@dataclasses.dataclass
+class ParsedArchive:
+    #: The valid rows, in the order they appear in the archive.
+    rows: List[Row]
+    #: The number of rows that failed validation.
+    invalid: int
+
+
+@dataclasses.dataclass
+class Report:
+    symbol: str
+    interval: str
+    #: The path to the output file.
+    path: str
+    #: The months that were ingested.
+    months: List[str] = dataclasses.field(default_factory=list)
+    #: The number of rows that were written.
+    rows: int = 0
+    #: The number of rows skipped because there was a row for the same period.
+    duplicates: int = 0
+    #: The number of rows that failed validation.
+    invalid: int = 0
+    #: The missing periods, as (first missing, first present) pairs of timestamps.
+    gaps: List[Tuple[int, int]] = dataclasses.field(default_factory=list)
+    #: True if the output file was rebuilt instead of appended to.
+    rebuilt: bool = False
+
+
+def find_archives(
+        input_dir: str, symbols: Optional[Sequence[str]] = None, intervals: Optional[Sequence[str]] = None
+) -> Dict[Tuple[str, str], List[Archive]]:
+    """Finds monthly kline archives.
+
+    :param input_dir: The directory to look in, including subdirectories.
+    :param symbols: The symbols to include, like BTCUSDT. Defaults to all of them.
+    :param intervals: The intervals to include, like 1h. Defaults to all of them.
+    :returns: The archives for each symbol and interval, sorted by month.
+    """
+    ret: Dict[Tuple[str, str], List[Archive]] = {}
+    for dir_path, _, filenames in os.walk(input_dir):
+        for filename in filenames:
+            match = _ARCHIVE_RE.match(filename)
+            if match is None or match["interval"] not in INTERVALS:
+                continue
+            if symbols is not None and match["symbol"] not in symbols:
+                continue
+            if intervals is not None and match["interval"] not in intervals:
+                continue
+            archive = Archive(os.path.join(dir_path, filename), match["symbol"], match["interval"], match["month"])
+            ret.setdefault((archive.symbol, archive.interval), []).append(archive)
+    for archives in ret.values():
+        archives.sort(key=lambda archive: archive.month)
+    return ret
+
+
+def _parse_values(values: List[str], step: int) -> Optional[Row]:
+    # Returns None if the row is invalid.
+    try:
+        timestamp = int(values[0])
+        open, high, low, close, volume = (float(value) for value in values[1:6])
+    except (IndexError, ValueError):
+        return None
+    timestamp //= 1000000 if timestamp >= _MICROSECONDS_THRESHOLD else 1000
+    if timestamp % step != 0:
+        return None
+    if not all(map(math.isfinite, (open, high, low, close, volume))):
+        return None
+    if high < low or high < open or high < close or low > open or low > close or low < 0 or volume < 0:
+        return None
+    return (timestamp, values[1], values[2], values[3], values[4], values[5])
+
+
+def parse_archive(archive: Archive) -> ParsedArchive:
+    """Parses the klines in an archive.
+
+    :param archive: The archive.
+    """
+    step = period_to_step[archive.interval]
+    rows = []
+    invalid = 0
+    with zipfile.ZipFile(archive.path) as zip_file:
+        for member in zip_file.namelist():
+            if not member.endswith(".csv"):
+                continue
+            with zip_file.open(member) as f:
+                for i, values in enumerate(csv.reader(io.TextIOWrapper(f, encoding="utf-8"))):
+                    if not values:
+                        continue
+                    # Some archives have a header.
+                    if i == 0 and not values[0].isdigit():
+                        continue
+                    row = _parse_values(values, step)
+                    if row is None:
+                        invalid += 1
+                    else:
+                        rows.append(row)
+    return ParsedArchive(rows, invalid)
+
+
+def output_path(output_dir: str, symbol: str, interval: str) -> str:
+    """Returns the path to the output file for a symbol and interval, like ``data/BTCUSDT1H.csv``."""
+    return os.path.join(output_dir, f"{symbol}{interval.upper()}.csv")
+
+
+def state_path(path: str) -> str:
+    """Returns the path to the state file for an output file."""
+    return os.path.splitext(path)[0] + ".ingest.json"
+
+
+def _load_state(path: str) -> Optional[dict]:
+    # The state is only valid if the output file is there and it was not truncated.
+    try:
+        with open(state_path(path), "r") as f:
+            ret = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ret.get("version") != STATE_VERSION or not os.path.exists(path) or os.path.getsize(path) < ret["size"]:
+        return None
+    return ret
+
+
+def _save_state(path: str, state: dict):
+    tmp_path = state_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_path(path))
+
+
+def _format_row(row: Row) -> bytes:
+    begin = datetime.datetime.fromtimestamp(row[0], tz=datetime.timezone.utc).replace(tzinfo=None)
+    return (",".join((str(begin), ) + row[1:]) + "\n").encode("utf-8")
+
+
+def _find_gaps(timestamps: List[int], step: int, previous: Optional[int]) -> List[Tuple[int, int]]:
+    ret = []
+    for timestamp in timestamps:
+        if previous is not None and timestamp - previous > step:
+            ret.append((previous + step, timestamp))
+        previous = timestamp
+    return ret
+
+
+def _plan(archives: List[Archive], state: Optional[dict], rebuild: bool) -> Tuple[List[Archive], bool]:
+    # Returns the archives to ingest, and whether the output file needs to be rebuilt.
+    if state is None or rebuild:
+        return archives, True
+    ingested = state["archives"]
+    new = [
+        archive for archive in archives
+        if ingested.get(archive.name) != os.path.getsize(archive.path)
+    ]
+    last_month = max((archive.month for archive in archives if archive.name in ingested), default="")
+    # Months before the last one, or months that changed, can't be appended.
+    if any(archive.name in ingested or archive.month <= last_month for archive in new):
+        return archives, True
+    return new, False
+
+
+def _ingest(
+        path: str, archives: List[Archive], parsed: Iterable[ParsedArchive], state: Optional[dict], rebuild: bool,
+        report: Report
+):
+    step = period_to_step[report.interval]
+    last_timestamp = None if rebuild or state is None else state["last_timestamp"]
+
+    # Deduplicate, keeping the first row for each period, and sort.
+    rows: Dict[int, Row] = {}
+    for parsed_archive in parsed:
+        report.invalid += parsed_archive.invalid
+        for row in parsed_archive.rows:
+            if row[0] in rows or (last_timestamp is not None and row[0] <= last_timestamp):
+                report.duplicates += 1
+            else:
+                rows[row[0]] = row
+    timestamps = sorted(rows.keys())
+    report.gaps = _find_gaps(timestamps, step, last_timestamp)
+    report.rows = len(timestamps)
+    report.months = [archive.month for archive in archives]
+    report.rebuilt = rebuild
+
+    if rebuild:
+        tmp_path = path + ".tmp"
+        # Files are written in binary mode, so sizes in the state match the ones on disk.
+        with open(tmp_path, "wb") as f:
+            f.write(b"datetime,open,high,low,close,volume\n")
+            f.writelines(_format_row(rows[timestamp]) for timestamp in timestamps)
+        os.replace(tmp_path, path)
+        new_state: dict = {"version": STATE_VERSION, "archives": {}, "last_timestamp": None, "rows": 0}
+    else:
+        assert state is not None
+        with open(path, "r+b") as f:
+            # Drop anything written after the last successful run.
+            f.truncate(state["size"])
+            f.seek(state["size"])
+            f.writelines(_format_row(rows[timestamp]) for timestamp in timestamps)
+        new_state = state
+
+    new_state["archives"].update({archive.name: os.path.getsize(archive.path) for archive in archives})
+    if timestamps:
+        new_state["last_timestamp"] = timestamps[-1]
+    new_state["rows"] += len(timestamps)
+    new_state["size"] = os.path.getsize(path)
+    _save_state(path, new_state)
+    manifest.save(path, manifest.build(path))
+
+
+def ingest(
+        input_dir: str, output_dir: str, symbols: Optional[Sequence[str]] = None,
+        intervals: Optional[Sequence[str]] = None, max_workers: Optional[int] = None, rebuild: bool = False
+) -> List[Report]:
+    """Ingests monthly kline archives.
+
+    :param input_dir: The directory where the archives are, including subdirectories.
+    :param output_dir: The directory for the output files.
+    :param symbols: The symbols to include, like BTCUSDT. Defaults to all of them.
+    :param intervals: The intervals to include, like 1h. Defaults to all of them.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param rebuild: True to rebuild the output files from all the archives.
+    :returns: A report for each symbol and interval.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for (symbol, interval), archives in sorted(find_archives(input_dir, symbols, intervals).items()):
+        path = output_path(output_dir, symbol, interval)
+        state = _load_state(path)
+        pending, job_rebuild = _plan(archives, state, rebuild)
+        jobs.append((path, pending, state, job_rebuild, Report(symbol, interval, path)))
+
+    # Archives for every symbol and interval are parsed in the same pool. Jobs are submitted in order, with a few
+    # archives per worker in flight, and each output file is written, and its rows released, once its archives are
+    # parsed.
+    max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+    submitted: Deque[Tuple[List[Future], tuple]] = collections.deque()
+
+    def write_oldest() -> int:
+        futures, (path, pending, state, job_rebuild, report) = submitted.popleft()
+        _ingest(path, pending, (future.result() for future in futures), state, job_rebuild, report)
+        return len(futures)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = 0
+        for job in jobs:
+            if job[1]:
+                submitted.append(([executor.submit(parse_archive, archive) for archive in job[1]], job))
+                in_flight += len(job[1])
+            while in_flight >= max_in_flight:
+                in_flight -= write_oldest()
+        while submitted:
+            write_oldest()
+    return [report for _, _, _, _, report in jobs]
+
+
+def _format_timestamp(timestamp: int) -> str:
+    return str(datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).replace(tzinfo=None))
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Ingests monthly kline archives from data.binance.vision.")
+    parser.add_argument("-i", "--input-dir", required=True, help="The directory where the .zip archives are.")
+    parser.add_argument("-o", "--output-dir", required=True, help="The directory for the CSV files.")
+    parser.add_argument("-s", "--symbols", nargs="+", help="The symbols to include, like BTCUSDT. Defaults to all.")
+    parser.add_argument(
+        "-t", "--intervals", nargs="+", choices=INTERVALS, help="The intervals to include, like 1h. Defaults to all."
+    )
+    parser.add_argument("-w", "--workers", type=int, default=None, help="The number of worker processes.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the CSV files from all the archives.")
+    args = parser.parse_args(args=params)
+
+    reports = ingest(
+        args.input_dir, args.output_dir, symbols=args.symbols, intervals=args.intervals, max_workers=args.workers,
+        rebuild=args.rebuild
+    )
+    if not reports:
+        print(f"No archives found in {args.input_dir}")
+    for report in reports:
+        if not report.months:
+            print(f"{report.path}: up to date")
+            continue
+        print(
+            f"{report.path}: {'rebuilt with' if report.rebuilt else 'appended'} {report.rows} rows from "
+            f"{len(report.months)} months ({report.months[0]} to {report.months[-1]}). "
+            f"{report.duplicates} duplicates, {report.invalid} invalid rows, {len(report.gaps)} gaps"
+        )
+        for begin, end in report.gaps[:5]:
+            print(f"  Missing bars from {_format_timestamp(begin)} until {_format_timestamp(end)}")
+        if len(report.gaps) > 5:
+            print(f"  ... and {len(report.gaps) - 5} more gaps")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
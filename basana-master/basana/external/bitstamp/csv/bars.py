@@ -14,7 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Union
+from typing import Optional, Union
 import datetime
 import enum
 
@@ -42,7 +42,8 @@ class BarSource(csv.EventSource):
     def __init__(
             self, pair: pair.Pair, csv_path: str, period: Union[str, BarPeriod],
             sort: bool = False, tzinfo: datetime.tzinfo = datetime.timezone.utc,
-            dict_reader_kwargs: dict = {}
+            dict_reader_kwargs: dict = {}, start: Optional[datetime.datetime] = None,
+            end: Optional[datetime.datetime] = None
     ):
         # TODO: Deprecate at v2.
         if isinstance(period, BarPeriod):
@@ -56,4 +57,9 @@ class BarSource(csv.EventSource):
         timedelta = period_to_timedelta.get(period)
         assert timedelta is not None, "Invalid period"
         self.row_parser = RowParser(pair, tzinfo=tzinfo, timedelta=timedelta)
-        super().__init__(csv_path, self.row_parser, sort=sort, dict_reader_kwargs=dict_reader_kwargs)
+        # Bars are filtered using the beginning of the period, and events using the end.
+        super().__init__(
+            csv_path, self.row_parser, sort=sort, dict_reader_kwargs=dict_reader_kwargs,
+            start=None if start is None else self.row_parser.event_datetime(start),
+            end=None if end is None else self.row_parser.event_datetime(end)
+        )
@@ -15,13 +15,33 @@
 # limitations under the License.
 
 from decimal import Decimal
-from typing import Sequence
+from typing import Optional, Sequence
 import datetime
 
-from basana.core import pair, event, bar
+from basana.core import bar, dt, event, pair
 from basana.core.event_sources import csv
 
 
+#: The columns in the file.
+COLUMNS = ("datetime", "open", "high", "low", "close", "volume")
+
+#: The format for the datetime column.
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _check_columns(values: Sequence[str]):
+    if len(values) < len(COLUMNS):
+        raise ValueError(f"Expected {len(COLUMNS)} columns but got {len(values)} in {values}")
+
+
+def _check_datetime(value: str):
+    # datetime.fromisoformat is faster than strptime, but it accepts many other formats, so the separators are checked
+    # first.
+    if len(value) != 19 or value[4] != "-" or value[7] != "-" or value[10] != " " or value[13] != ":" \
+            or value[16] != ":":
+        raise ValueError(f"time data {value!r} does not match format {DATETIME_FORMAT!r}")
+
+
 class RowParser(csv.RowParser):
     def __init__(
             self, pair: pair.Pair, tzinfo: datetime.tzinfo, timedelta: datetime.timedelta
@@ -30,6 +50,15 @@ class RowParser(csv.RowParser):
         self.tzinfo = tzinfo
         self.timedelta = timedelta
 
+    def event_datetime(self, bar_datetime: datetime.datetime) -> datetime.datetime:
+        """Returns the datetime for the event of a bar.
+
+        :param bar_datetime: The beginning of the period. If naive, it is assumed to be in the parser timezone.
+        """
+        if dt.is_naive(bar_datetime):
+            bar_datetime = bar_datetime.replace(tzinfo=self.tzinfo)
+        return bar_datetime + self.timedelta
+
     def parse_row(self, row_dict: dict) -> Sequence[event.Event]:
         # File format:
         #
@@ -41,13 +70,55 @@ class RowParser(csv.RowParser):
         if volume == 0:
             return []
 
-        dt = datetime.datetime.strptime(row_dict["datetime"], "%Y-%m-%d %H:%M:%S").replace(tzinfo=self.tzinfo)
+        begin = datetime.datetime.strptime(row_dict["datetime"], DATETIME_FORMAT).replace(tzinfo=self.tzinfo)
         return [
             bar.BarEvent(
-                dt + self.timedelta,
+                begin + self.timedelta,
                 bar.Bar(
-                    dt, self.pair, Decimal(row_dict["open"]), Decimal(row_dict["high"]), Decimal(row_dict["low"]),
+                    begin, self.pair, Decimal(row_dict["open"]), Decimal(row_dict["high"]), Decimal(row_dict["low"]),
                     Decimal(row_dict["close"]), volume
                 )
             )
         ]
+
+    def events_follow_first_column(self, fieldnames: Sequence[str]) -> bool:
+        # Rows yield at most one bar, and events are a fixed timedelta after the datetime in the first column.
+        return tuple(fieldnames[:len(COLUMNS)]) == COLUMNS
+
+    def get_values_parser(self, fieldnames: Sequence[str]) -> Optional[csv.ValuesParser]:
+        # Only the first columns are used, so files with extra columns, like the ones built from Binance klines, are
+        # supported too.
+        if tuple(fieldnames[:len(COLUMNS)]) != COLUMNS:
+            return None
+
+        pair = self.pair
+        tzinfo = self.tzinfo
+        timedelta = self.timedelta
+        parse_datetime = datetime.datetime.fromisoformat
+        check_columns = _check_columns
+        check_datetime = _check_datetime
+
+        # Parsing the UTC offset along with the datetime is faster than setting the timezone afterwards.
+        if tzinfo is datetime.timezone.utc:
+            def parse_values(values: Sequence[str]) -> Sequence[event.Event]:
+                check_columns(values)
+                volume = Decimal(values[5])
+                # Skip bars with no volume.
+                if not volume:
+                    return []
+                check_datetime(values[0])
+                begin = parse_datetime(values[0] + "+00:00")
+                open, high, low, close = map(Decimal, values[1:5])
+                return [bar.BarEvent(begin + timedelta, bar.Bar(begin, pair, open, high, low, close, volume))]
+        else:
+            def parse_values(values: Sequence[str]) -> Sequence[event.Event]:
+                check_columns(values)
+                volume = Decimal(values[5])
+                # Skip bars with no volume.
+                if not volume:
+                    return []
+                check_datetime(values[0])
+                begin = parse_datetime(values[0]).replace(tzinfo=tzinfo)
+                open, high, low, close = map(Decimal, values[1:5])
+                return [bar.BarEvent(begin + timedelta, bar.Bar(begin, pair, open, high, low, close, volume))]
+        return parse_values
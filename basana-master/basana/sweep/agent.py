@@ -0,0 +1,52 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List, Optional
+import argparse
+import logging
+import os
+
+from basana.sweep import executors
+
+
+#: The environment variable used for the authentication key, if not set from the command line.
+AUTHKEY_ENV_VAR = "BASANA_SWEEP_AUTHKEY"
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Runs backtests for a sweep coordinator.")
+    parser.add_argument("-a", "--address", help="The coordinator address, in host:port format.", required=True)
+    parser.add_argument(
+        "-k", "--authkey", help=f"The authentication key. Defaults to the {AUTHKEY_ENV_VAR} environment variable.",
+        default=os.environ.get(AUTHKEY_ENV_VAR)
+    )
+    parser.add_argument("-d", "--data-dir", help="The directory where CSV files are located.", default="data")
+    parser.add_argument("-w", "--workers", help="The number of worker processes.", type=int, default=None)
+    args = parser.parse_args(args=params)
+    if not args.authkey:
+        parser.error("An authentication key is required")
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s %(levelname)s] %(message)s")
+    try:
+        executors.run_agent(
+            executors.parse_address(args.address), args.authkey.encode(), args.data_dir, max_workers=args.workers
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
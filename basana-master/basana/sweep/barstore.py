@@ -0,0 +1,182 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A binary, columnar, format for bars that gets memory mapped instead of parsed.
+
+Usage: ``python -m basana.sweep.barstore --period 1m data/*.csv``
+
+A store is a directory, next to the CSV file it was converted from and with the same name but a ``.bars`` extension,
+with a ``header.json`` file and one ``.npy`` file per column. See :data:`basana.sweep.datasets.COLUMNS`. Loading a store
+only maps the files into memory, so it takes milliseconds regardless of the number of bars.
+
+:func:`basana.sweep.datasets.load_csv` uses the store for a CSV file if it is up to date.
+"""
+
+from typing import Any, Dict, List, Optional
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from basana.core import errors, pair
+from basana.sweep import datasets
+
+
+#: The version of the format.
+VERSION = 1
+
+HEADER_FILENAME = "header.json"
+
+
+def store_path(csv_path: str) -> str:
+    """Returns the path to the store for a CSV file."""
+    return os.path.splitext(csv_path)[0] + ".bars"
+
+
+def _source_info(csv_path: str, tzinfo: datetime.tzinfo) -> Dict[str, Any]:
+    # Used to tell if a store is out of date.
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "tz": str(tzinfo)}
+
+
+def write(dataset: datasets.Dataset, path: str, period: Optional[str] = None, source: Optional[Dict[str, Any]] = None):
+    """Writes a dataset to a store.
+
+    The store is written to a temporary directory first, so readers never see it half written.
+
+    :param dataset: The dataset.
+    :param path: The path to the store directory. It is replaced if it exists.
+    :param period: The period of the bars, if known.
+    :param source: Information about where the bars came from, used to tell if the store is out of date.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path)
+    try:
+        for column in datasets.COLUMNS:
+            np.save(
+                os.path.join(tmp_path, f"{column}.npy"),
+                np.ascontiguousarray(getattr(dataset, column), dtype=datasets.COLUMN_DTYPES[column])
+            )
+        header = {"version": VERSION, "length": len(dataset), "period": period, "source": source}
+        with open(os.path.join(tmp_path, HEADER_FILENAME), "w") as f:
+            json.dump(header, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Returns the header of a store.
+
+    :param path: The path to the store directory.
+    :raises basana.core.errors.Error: If the store is missing, or it was written with a different version.
+    """
+    header_path = os.path.join(path, HEADER_FILENAME)
+    if not os.path.exists(header_path):
+        raise errors.Error(f"{path} is not a bar store")
+    with open(header_path, "r") as f:
+        ret = json.load(f)
+    if ret.get("version") != VERSION:
+        raise errors.Error(f"{path} has version {ret.get('version')}. Expected version {VERSION}")
+    return ret
+
+
+def load(path: str) -> datasets.Dataset:
+    """Memory maps a store, without reading the bars.
+
+    :param path: The path to the store directory.
+    :raises basana.core.errors.Error: If the store is missing or corrupt.
+    """
+    header = read_header(path)
+    length = header["length"]
+    columns = []
+    for column in datasets.COLUMNS:
+        # Empty files can't be memory mapped.
+        values = np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r" if length else None)
+        if values.shape != (length, ) or values.dtype != datasets.COLUMN_DTYPES[column]:
+            raise errors.Error(f"{path} is corrupt. Unexpected {column} column")
+        columns.append(values)
+    return datasets.Dataset(*columns)
+
+
+def is_up_to_date(csv_path: str, tzinfo: datetime.tzinfo = datetime.timezone.utc) -> bool:
+    """Returns True if there is a store for a CSV file, and it was converted from the current version of the file.
+
+    :param csv_path: The path to the CSV file.
+    :param tzinfo: The timezone for the datetimes in the CSV file.
+    """
+    try:
+        header = read_header(store_path(csv_path))
+    except errors.Error:
+        return False
+    return header.get("source") == _source_info(csv_path, tzinfo)
+
+
+def convert_csv(
+        csv_path: str, period: Optional[str] = None, tzinfo: datetime.tzinfo = datetime.timezone.utc
+) -> str:
+    """Converts a CSV file with datetime,open,high,low,close,volume columns to a store, next to it.
+
+    :param csv_path: The path to the CSV file.
+    :param period: The period of the bars, if known.
+    :param tzinfo: The timezone for the datetimes in the CSV file.
+    :returns: The path to the store.
+    """
+    ret = store_path(csv_path)
+    source = _source_info(csv_path, tzinfo)
+    dataset = datasets.load_csv(csv_path, tzinfo=tzinfo, use_store=False)
+    write(dataset, ret, period=period, source=source)
+    return ret
+
+
+class BarSource(datasets.BarSource):
+    """An event source for bars in a store, that are read straight from the memory map.
+
+    :param pair: The trading pair.
+    :param path: The path to the store directory.
+    :param period: The period of the bars, used to generate the events at the end of the period. Defaults to the one
+        in the store header.
+    """
+
+    def __init__(self, pair: pair.Pair, path: str, period: Optional[str] = None):
+        period = period or read_header(path).get("period")
+        if period is None:
+            raise errors.Error(f"The period is not set in {path}")
+        super().__init__(pair, load(path), period)
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Converts CSV files with bars to a memory mappable format.")
+    parser.add_argument("csv_files", nargs="+", help="CSV files with datetime,open,high,low,close,volume columns.")
+    parser.add_argument("-p", "--period", help="The period of the bars, like 1m or 1d.")
+    args = parser.parse_args(args=params)
+
+    for csv_path in args.csv_files:
+        begin = time.perf_counter()
+        path = convert_csv(csv_path, period=args.period)
+        length = read_header(path)["length"]
+        print(f"{csv_path} -> {path}. {length} bars in {time.perf_counter() - begin:.2f}s")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,103 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+
+from basana.core.logs import StructuredMessage
+from basana.sweep import datasets
+
+
+logger = logging.getLogger(__name__)
+
+BacktestFunction = Callable[..., Awaitable[Optional[Dict[str, Any]]]]
+Metrics = Tuple[float, ...]
+
+#: The metrics, in the order they're returned by :func:`run_batch`.
+METRICS = ("profit", "sharpe", "max_drawdown")
+
+
+def split(parameter_sets: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Groups parameter sets by (symbol, filename) and splits each group into batches.
+
+    Parameter sets are consumed lazily. Batches are returned as soon as they are full, and the remaining partial
+    batches at the end, in the order their groups first appear. Parameter sets keep their relative order.
+
+    :param parameter_sets: The parameter sets.
+    :param batch_size: The maximum number of parameter sets per batch.
+    """
+    assert batch_size > 0, "Invalid batch size"
+
+    groups: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+    for params in parameter_sets:
+        group = groups.setdefault((params.get("symbol"), params.get("filename")), [])
+        group.append(params)
+        if len(group) == batch_size:
+            yield list(group)
+            group.clear()
+
+    for group in groups.values():
+        if group:
+            yield group
+
+
+def to_metrics(result: Dict[str, Any]) -> Metrics:
+    return tuple(float(result[metric]) for metric in METRICS)
+
+
+def from_metrics(metrics: Metrics) -> Dict[str, float]:
+    return dict(zip(METRICS, metrics))
+
+
+async def run_batch_async(
+        backtest_function: BacktestFunction, parameter_sets: Sequence[Dict[str, Any]],
+        dataset: Optional[datasets.SharedDatasetHandle] = None, durations: Optional[List[float]] = None
+) -> List[Optional[Metrics]]:
+    ret: List[Optional[Metrics]] = []
+    for params in parameter_sets:
+        if dataset is not None:
+            params = {**params, "dataset": dataset}
+        begin = time.perf_counter()
+        # A failure should not take the rest of the batch down.
+        try:
+            result = await backtest_function(**params)
+            ret.append(None if result is None else to_metrics(result))
+        except Exception as e:
+            logger.exception(StructuredMessage("Backtest failed", error=e, params=params))
+            ret.append(None)
+        if durations is not None:
+            durations.append(time.perf_counter() - begin)
+    return ret
+
+
+def run_batch(
+        backtest_function: BacktestFunction, parameter_sets: Sequence[Dict[str, Any]],
+        dataset: Optional[datasets.SharedDatasetHandle] = None, durations: Optional[List[float]] = None
+) -> List[Optional[Metrics]]:
+    """Runs backtests for a batch of parameter sets, sequentially, using a single event loop.
+
+    This is meant to be executed in a worker process. Only the metrics are returned, in the order defined by
+    :data:`METRICS`, to keep the payload that is sent back to the parent process small.
+
+    :param backtest_function: The backtest coroutine function. It must be picklable.
+    :param parameter_sets: The parameter sets.
+    :param dataset: An optional handle to a shared dataset that will be passed to every backtest.
+    :param durations: An optional list where the wall clock time, in seconds, for each backtest will be appended.
+    :returns: The metrics for each parameter set, or None if the backtest failed or returned no result.
+    """
+    return asyncio.run(run_batch_async(backtest_function, parameter_sets, dataset=dataset, durations=durations))
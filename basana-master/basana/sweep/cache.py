@@ -0,0 +1,228 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import hashlib
+import importlib
+import inspect
+import os
+import sqlite3
+import sys
+
+from basana.core import errors
+from basana.core.event_sources import manifest
+from basana.sweep import datasets, results
+
+
+# Besides the modules from the backtest function's own package, changes to any module in these packages invalidate
+# results too. Bars, indicators and the exchange, with its fee defaults, all shape the results, and they're not always
+# referenced from the backtest function's module.
+DEFAULT_PACKAGES = ("basana", )
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the SHA-256 checksum of a file.
+
+    :param path: The path to the file.
+    """
+    ret = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            ret.update(chunk)
+    return ret.hexdigest()
+
+
+def data_checksum(path: str) -> str:
+    """Returns the SHA-256 checksum of a data file.
+
+    For CSV files, the checksum is taken from the manifest of the file, which is built if it's missing or out of date,
+    so files are only read once while they don't change. See :mod:`basana.core.event_sources.manifest`.
+
+    :param path: The path to the file.
+    """
+    if datasets.extension(path) == ".csv":
+        try:
+            return manifest.get(path).checksum
+        except errors.Error:
+            pass
+    return file_checksum(path)
+
+
+def _referenced_modules(module: ModuleType) -> List[ModuleType]:
+    ret = []
+    for value in vars(module).values():
+        if isinstance(value, ModuleType):
+            ret.append(value)
+        elif inspect.isclass(value) or inspect.isfunction(value):
+            referenced = sys.modules.get(value.__module__)
+            if referenced is not None:
+                ret.append(referenced)
+    return ret
+
+
+def _package_checksums(package: str) -> Dict[str, str]:
+    # Every source file in the package, whether it's imported or not.
+    module = importlib.import_module(package)
+    paths = getattr(module, "__path__", None)
+    if paths is None:
+        assert module.__file__ is not None, f"Can't find the source file for {package}"
+        return {package: file_checksum(module.__file__)}
+
+    ret = {}
+    for path in paths:
+        for dir_path, dir_names, filenames in os.walk(path):
+            dir_names.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    file_path = os.path.join(dir_path, filename)
+                    ret[f"{package}:{os.path.relpath(file_path, path)}"] = file_checksum(file_path)
+    return ret
+
+
+def code_checksum(function: Callable, packages: Sequence[str] = DEFAULT_PACKAGES) -> str:
+    """Returns a checksum of the source code a function depends on.
+
+    The source of the function's module is included, along with every module it references, directly or
+    indirectly, that belongs to the same top level package. Every source file in the given packages is included too.
+
+    :param function: The function.
+    :param packages: Additional packages to include.
+    """
+    module = inspect.getmodule(function)
+    assert module is not None, f"Can't find the module for {function}"
+    root = module.__name__.split(".")[0]
+
+    def include(module: ModuleType) -> bool:
+        return getattr(module, "__file__", None) is not None \
+            and (module.__name__ == root or module.__name__.startswith(root + "."))
+
+    checksums: Dict[str, str] = {}
+    pending = [module]
+    while pending:
+        module = pending.pop()
+        if module.__name__ in checksums:
+            continue
+        assert module.__file__ is not None, f"Can't find the source file for {module.__name__}"
+        checksums[module.__name__] = file_checksum(module.__file__)
+        pending.extend(referenced for referenced in _referenced_modules(module) if include(referenced))
+    for package in packages:
+        checksums.update(_package_checksums(package))
+
+    return hashlib.sha256(results.dumps(checksums).encode()).hexdigest()
+
+
+class ResultCache:
+    """A content-addressed cache for backtest results, with LRU eviction.
+
+    Results are keyed by the source code the backtest function depends on, the checksum of the data file, additional
+    settings and the parameter set, so changing any of them results in a cache miss.
+
+    :param path: The path to the database file. It will be created if it doesn't exist.
+    :param backtest_function: The backtest function.
+    :param data_dir: The directory where data files are located. The data file is taken from the filename parameter.
+    :param settings: Additional settings that affect the results.
+    :param max_entries: The maximum number of results to keep. Least recently used results get evicted first.
+    :param packages: Packages whose source code is part of the key, besides the backtest function's own. See
+        :func:`code_checksum`.
+    """
+
+    def __init__(
+            self, path: str, backtest_function: Callable, data_dir: str, settings: Dict[str, Any] = {},
+            max_entries: int = 1000000, packages: Sequence[str] = DEFAULT_PACKAGES
+    ):
+        assert max_entries > 0, "Invalid max_entries"
+
+        self._code_checksum = code_checksum(backtest_function, packages=packages)
+        self._data_dir = data_dir
+        self._settings = settings
+        self._max_entries = max_entries
+        self._data_checksums: Dict[str, str] = {}
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, result TEXT, last_used INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        # A logical clock used to track usage. Wall clock time is not fine grained enough on some platforms.
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM cache").fetchone()[0]
+
+    def key(self, params: Dict[str, Any]) -> str:
+        """Returns the cache key for a parameter set."""
+        filename = params["filename"]
+        checksum = self._data_checksums.get(filename)
+        if checksum is None:
+            # Resampled datasets are keyed by the source file. The period is part of the filename parameter.
+            checksum = data_checksum(datasets.source_path(os.path.join(self._data_dir, filename)))
+            self._data_checksums[filename] = checksum
+
+        key = {
+            "code": self._code_checksum,
+            "data": checksum,
+            "settings": self._settings,
+            "params": results.params_key(params),
+        }
+        return hashlib.sha256(results.dumps(key).encode()).hexdigest()
+
+    def get(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns the cached result for a parameter set, or None if there is none."""
+        ret = self._lookup(self.key(params))
+        self._conn.commit()
+        return ret
+
+    def put(self, params: Dict[str, Any], result: Dict[str, Any]):
+        """Caches the result for a parameter set, evicting the least recently used results if necessary."""
+        key = self.key(params)
+        if self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key, )).fetchone() is None:
+            self._count += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache (key, result, last_used) VALUES (?, ?, ?)",
+            (key, results.dumps(result), self._tick())
+        )
+        excess = self._count - self._max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)", (excess, )
+            )
+            self._count -= excess
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT result FROM cache WHERE key = ?", (key, )).fetchone()
+        ret = None
+        if row is not None:
+            self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (self._tick(), key))
+            ret = results.loads(row[0])
+        return ret
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "ResultCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,282 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long running sweep server that keeps a warm process pool.
+
+Usage: ``python -m basana.sweep.daemon --preload samples.aspis_1``
+
+Worker processes, strategy modules, datasets and precalculated indicators stay loaded across sweeps, so running a
+sweep only pays for the backtests. Datasets are loaded again when their files change. Sweeps are sent from the command
+line with ``python -m basana.sweep --strategy samples.aspis_1 --daemon <address>``, or from a notebook using a
+:class:`DaemonExecutor` as the executor for a :class:`basana.sweep.runner.MassBacktest`.
+
+Workers import strategy modules once, so the daemon has to be restarted to pick up changes to the code.
+"""
+
+from concurrent.futures import Future
+from multiprocessing import connection
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import functools
+import logging
+import os
+import pickle
+import signal
+import socket
+import tempfile
+import threading
+
+from basana.core import errors
+from basana.core.logs import StructuredMessage
+from basana.sweep import agent, executors
+
+
+logger = logging.getLogger(__name__)
+
+#: The default address, a Unix socket in the temporary directory.
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "basana-sweep.sock")
+
+
+class Server:
+    """Runs tasks sent by :class:`DaemonExecutor` clients on a :class:`basana.sweep.executors.LocalExecutor`.
+
+    Results are sent back to each client as soon as tasks complete. Pending tasks are cancelled if their client
+    disconnects.
+
+    :param address: The address to listen on.
+    :param authkey: The key clients use to authenticate.
+    :param data_dir: The directory where CSV files are located.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param preload: Modules to import before starting workers, typically the ones with the backtest functions.
+    """
+
+    def __init__(
+            self, address: executors.Address, authkey: bytes, data_dir: str, max_workers: Optional[int] = None,
+            preload: Sequence[str] = ()
+    ):
+        if isinstance(address, str) and os.path.exists(address):
+            _remove_stale_socket(address)
+        self._authkey = authkey
+        self._executor = executors.LocalExecutor(data_dir, max_workers=max_workers, preload=preload)
+        # Loading datasets and indicators is not thread safe.
+        self._submit_lock = threading.Lock()
+        self._listener = connection.Listener(address, authkey=authkey)
+        self._closed = threading.Event()
+
+    @property
+    def address(self) -> executors.Address:
+        """The address the server is listening on."""
+        return self._listener.address
+
+    def serve_forever(self):
+        """Accepts clients until :meth:`close` is called, and then releases the process pool."""
+        logger.info(StructuredMessage(
+            "Sweep daemon ready", address=self.address, workers=self._executor.max_workers
+        ))
+        try:
+            while not self._closed.is_set():
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError, connection.AuthenticationError):
+                    continue
+                threading.Thread(target=self._serve, args=(conn, ), daemon=True).start()
+        finally:
+            self._listener.close()
+            self._executor.close()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        # Closing the listener doesn't interrupt a blocking accept, but a connection does.
+        try:
+            connection.Client(self.address, authkey=self._authkey).close()
+        except OSError:
+            pass
+
+    def _serve(self, conn: connection.Connection):
+        send_lock = threading.Lock()
+        lock = threading.Lock()
+        futures: Dict[int, Future] = {}
+
+        def send(message: Any):
+            with send_lock:
+                try:
+                    conn.send(message)
+                except (OSError, EOFError):
+                    # The client is gone.
+                    pass
+
+        def on_done(task_id: int, future: Future):
+            with lock:
+                futures.pop(task_id, None)
+            if future.cancelled():
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                send((task_id, None, repr(e)))
+            else:
+                send((task_id, result, None))
+
+        with conn:
+            send(self._executor.max_workers)
+            try:
+                while not self._closed.is_set():
+                    if not conn.poll(1):
+                        continue
+                    task_id, payload = conn.recv()
+                    # Tasks are unpickled here, instead of in recv, so an unknown backtest function fails the task and
+                    # not the connection.
+                    try:
+                        task = pickle.loads(payload)
+                        with self._submit_lock:
+                            future = self._executor.submit(task)
+                    except Exception as e:
+                        send((task_id, None, repr(e)))
+                        continue
+                    with lock:
+                        futures[task_id] = future
+                    future.add_done_callback(functools.partial(on_done, task_id))
+            except (OSError, EOFError):
+                pass
+            finally:
+                # There's no one left to send results to.
+                with lock:
+                    pending = list(futures.values())
+                for future in pending:
+                    future.cancel()
+
+
+class DaemonExecutor:
+    """Runs tasks on a sweep daemon. See :class:`Server`.
+
+    The daemon reads CSV files from its own data directory, and the backtest function has to be importable by its
+    workers.
+
+    :param address: The daemon address.
+    :param authkey: The key used to authenticate with the daemon.
+    """
+
+    def __init__(self, address: executors.Address = DEFAULT_ADDRESS, authkey: bytes = b""):
+        self._conn = connection.Client(address, authkey=authkey)
+        #: The number of worker processes in the daemon.
+        self.max_workers: int = self._conn.recv()
+        self._lock = threading.Lock()
+        self._futures: Dict[int, Future] = {}
+        self._next_id = 0
+        self._closed = threading.Event()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def submit(self, task: executors.Task) -> Future:
+        """Submits a task for execution.
+
+        Returns a future with the metrics for each parameter set, or None for those that failed, and the
+        :class:`basana.sweep.telemetry.TaskStats` for the task.
+        """
+        payload = pickle.dumps(task)
+        ret: Future = Future()
+        ret.set_running_or_notify_cancel()
+        with self._lock:
+            if self._closed.is_set():
+                raise errors.Error("The connection to the sweep daemon was closed")
+            task_id = self._next_id
+            self._next_id += 1
+            self._futures[task_id] = ret
+            self._conn.send((task_id, payload))
+        return ret
+
+    def close(self):
+        self._closed.set()
+        self._reader.join()
+        self._conn.close()
+
+    def __enter__(self) -> "DaemonExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read(self):
+        try:
+            while not self._closed.is_set():
+                if not self._conn.poll(1):
+                    continue
+                task_id, result, error = self._conn.recv()
+                with self._lock:
+                    future = self._futures.pop(task_id)
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(error))
+        except (OSError, EOFError):
+            logger.error(StructuredMessage("Lost the connection to the sweep daemon"))
+        finally:
+            with self._lock:
+                self._closed.set()
+                pending: List[Future] = list(self._futures.values())
+                self._futures = {}
+            for future in pending:
+                future.set_exception(RuntimeError("The connection to the sweep daemon was closed"))
+
+
+def _remove_stale_socket(path: str):
+    # A socket file left behind by a daemon that didn't shut down cleanly.
+    with socket.socket(socket.AF_UNIX) as s:
+        try:
+            s.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise errors.Error(f"A sweep daemon is already listening on {path}")
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Runs a sweep daemon with a warm process pool.")
+    parser.add_argument(
+        "-a", "--address", default=DEFAULT_ADDRESS,
+        help="The path to a Unix socket, or a host:port address, to listen on."
+    )
+    parser.add_argument(
+        "-k", "--authkey", default=os.environ.get(agent.AUTHKEY_ENV_VAR),
+        help=f"The authentication key. Defaults to the {agent.AUTHKEY_ENV_VAR} environment variable."
+    )
+    parser.add_argument("-d", "--data-dir", help="The directory where CSV files are located.", default="data")
+    parser.add_argument("-w", "--workers", help="The number of worker processes.", type=int, default=None)
+    parser.add_argument(
+        "-p", "--preload", action="append", default=[],
+        help="A module to import in workers before they start, like samples.aspis_1. Can be repeated."
+    )
+    args = parser.parse_args(args=params)
+    if not args.authkey:
+        parser.error("An authentication key is required")
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s %(levelname)s] %(message)s")
+    server = Server(
+        executors.parse_address(args.address), args.authkey.encode(), args.data_dir, max_workers=args.workers,
+        preload=args.preload
+    )
+    # Terminating the daemon shuts it down cleanly, same as Ctrl-C.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
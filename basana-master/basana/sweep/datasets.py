@@ -0,0 +1,449 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Tuple
+import dataclasses
+import datetime
+import math
+import os
+
+import numpy as np
+
+from basana.core import bar, dt, event, pair
+from basana.core.event_sources import csv
+from basana.external.bitstamp.csv.bars import period_to_timedelta
+from basana.external.common.csv.bars import RowParser
+
+
+#: The columns of a dataset, in the order they're laid out in memory.
+COLUMNS = ("datetime", "open", "high", "low", "close", "volume")
+
+# All columns take 8 bytes per bar. Timestamps are int64 and prices/volumes are float64.
+COLUMN_DTYPES = {
+    "datetime": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+}
+ITEM_SIZE = 8
+
+#: File extensions for Parquet and Arrow files, with their pyarrow format. See :mod:`basana.sweep.parquet`.
+ARROW_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "ipc",
+    ".feather": "ipc",
+    ".ipc": "ipc",
+}
+
+
+class Dataset:
+    """Bars stored in columnar format.
+
+    :param datetime: The beginning of each period, as POSIX timestamps (in seconds).
+    :param open: The opening prices.
+    :param high: The highest traded prices.
+    :param low: The lowest traded prices.
+    :param close: The closing prices.
+    :param volume: The traded volumes.
+    """
+
+    def __init__(
+            self, datetime: np.ndarray, open: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+            volume: np.ndarray
+    ):
+        assert all(len(column) == len(datetime) for column in (open, high, low, close, volume)), \
+            "All columns should have the same length"
+
+        self.datetime = datetime
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    def slice(self, start: int = 0, stop: Optional[int] = None) -> "Dataset":
+        """Returns a dataset with a range of the bars, without copying them.
+
+        :param start: The index of the first bar to include.
+        :param stop: The index of the bar to stop at, or None to include the bars up to the end.
+        """
+        return Dataset(*[getattr(self, column)[start:stop] for column in COLUMNS])
+
+
+def validate(dataset: Dataset):
+    """Checks the prices in a dataset the same way :class:`basana.core.bar.Bar` does, but for all the bars at once.
+
+    :param dataset: The dataset.
+    :raises basana.core.bar.InvalidBar: If prices in a bar are inconsistent.
+    """
+    open, high, low, close = dataset.open, dataset.high, dataset.low, dataset.close
+    checks = [
+        (high < low, "high < low"),
+        (high < open, "high < open"),
+        (high < close, "high < close"),
+        (low > open, "low > open"),
+        (low > close, "low > close"),
+    ]
+    for invalid, description in checks:
+        if invalid.any():
+            i = int(np.argmax(invalid))
+            when = datetime.datetime.fromtimestamp(int(dataset.datetime[i]), tz=datetime.timezone.utc)
+            raise bar.InvalidBar(f"{description} on {when}")
+
+
+def load_bars(bars: List[bar.Bar]) -> Dataset:
+    """Builds a dataset from a list of bars.
+
+    :param bars: The bars, in the order they should be delivered.
+    """
+    return Dataset(
+        np.array([dt.to_utc_timestamp(b.datetime) for b in bars], dtype=COLUMN_DTYPES["datetime"]),
+        *[
+            np.array([float(getattr(b, column)) for b in bars], dtype=COLUMN_DTYPES[column])
+            for column in COLUMNS[1:]
+        ]
+    )
+
+
+def load_csv(csv_path: str, tzinfo: datetime.tzinfo = datetime.timezone.utc, use_store: bool = True) -> Dataset:
+    """Loads a dataset from a CSV file with datetime,open,high,low,close,volume columns.
+
+    :param csv_path: The path to the CSV file.
+    :param tzinfo: The timezone for the datetimes in the file.
+    :param use_store: True to memory map the bars from the store for the CSV file, if it is up to date, instead of
+        parsing the file. See :mod:`basana.sweep.barstore`.
+    """
+    if use_store:
+        # Imported here since the store is built on top of this module.
+        from basana.sweep import barstore
+
+        if barstore.is_up_to_date(csv_path, tzinfo=tzinfo):
+            return barstore.load(barstore.store_path(csv_path))
+
+    # The pair is not stored in the dataset. It gets set when the dataset is bound to a BarSource.
+    row_parser = RowParser(pair.Pair("", ""), tzinfo=tzinfo, timedelta=datetime.timedelta(0))
+    return load_bars([bar_event.bar for bar_event in csv.load_and_yield(csv_path, row_parser)])
+
+
+def extension(path: str) -> str:
+    """Returns the file extension, in lower case."""
+    return os.path.splitext(path)[1].lower()
+
+
+def source_path(path: str) -> str:
+    """Returns the path to the file that a dataset is loaded from, without the period for resampled datasets.
+
+    :param path: The path to the file, optionally followed by ``@`` and a period. See :mod:`basana.sweep.resample`.
+    """
+    # Imported here since resampling is built on top of this module.
+    from basana.sweep import resample
+
+    return resample.split_path(path)[0]
+
+
+def load_file(path: str, tzinfo: datetime.tzinfo = datetime.timezone.utc) -> Dataset:
+    """Loads a dataset from a CSV, Parquet or Arrow file, depending on the extension.
+
+    :param path: The path to the file. If followed by ``@`` and a period, like ``BTCUSDT1M.csv@4h``, bars are
+        aggregated into that period. See :mod:`basana.sweep.resample`.
+    :param tzinfo: The timezone for naive datetimes in the file.
+    """
+    # Imported here since resampling is built on top of this module.
+    from basana.sweep import resample
+
+    path, period = resample.split_path(path)
+    if period is not None:
+        return resample.load(path, period, tzinfo=tzinfo)
+    if extension(path) in ARROW_FORMATS:
+        # pyarrow is an optional dependency.
+        from basana.sweep import parquet
+
+        return parquet.load(path, tzinfo=tzinfo)
+    return load_csv(path, tzinfo=tzinfo)
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedDatasetHandle:
+    """A picklable reference to a :class:`SharedDataset`, used to attach to it from other processes."""
+
+    #: The name of the shared memory block.
+    name: str
+    #: The number of bars.
+    length: int
+    #: The index of the first bar to use.
+    start: int = 0
+    #: The index of the bar to stop at, or None to use the bars up to the end.
+    stop: Optional[int] = None
+    #: Indicators calculated over the whole dataset, as (indicator key, shared memory block name) pairs.
+    #: See :mod:`basana.sweep.indicators`.
+    indicators: Tuple[Tuple[str, str], ...] = ()
+
+    def window(self, start: int = 0, stop: Optional[int] = None) -> "SharedDatasetHandle":
+        """Returns a handle to a window of the dataset.
+
+        :param start: The index of the first bar to use.
+        :param stop: The index of the bar to stop at, or None to use the bars up to the end.
+        """
+        return dataclasses.replace(self, start=start, stop=stop)
+
+    def prefix(self, fraction: float) -> "SharedDatasetHandle":
+        """Returns a handle to the first fraction of the bars. At least one bar is included.
+
+        :param fraction: The fraction of the bars to include.
+        """
+        assert 0 < fraction <= 1, "Invalid fraction"
+        stop = max(1, math.ceil(self.length * fraction))
+        return self.window(0, None if stop >= self.length else stop)
+
+
+class SharedDataset(Dataset):
+    """A dataset backed by a shared memory block.
+
+    Use :meth:`create` to copy a dataset into shared memory, and :func:`attach` to access it from other processes
+    without copying it.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, length: int, owner: bool):
+        self._shm = shm
+        self._length = length
+        self._owner = owner
+        super().__init__(*[
+            np.ndarray((length, ), dtype=COLUMN_DTYPES[column], buffer=shm.buf, offset=i * length * ITEM_SIZE)
+            for i, column in enumerate(COLUMNS)
+        ])
+
+    @classmethod
+    def create(cls, dataset: Dataset) -> "SharedDataset":
+        """Copies a dataset into a new shared memory block.
+
+        The shared memory block gets released when :meth:`release` is called on the returned dataset.
+        """
+        # Zero sized shared memory blocks are not allowed.
+        size = max(len(dataset) * len(COLUMNS) * ITEM_SIZE, 1)
+        ret = cls(shared_memory.SharedMemory(create=True, size=size), len(dataset), True)
+        for column in COLUMNS:
+            getattr(ret, column)[:] = getattr(dataset, column)
+        return ret
+
+    @property
+    def handle(self) -> SharedDatasetHandle:
+        return SharedDatasetHandle(name=self._shm.name, length=self._length)
+
+    def release(self):
+        # The arrays reference the shared memory buffer and need to be released before closing it.
+        for column in COLUMNS:
+            setattr(self, column, None)
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# Datasets attached in the current process, by shared memory block name.
+_attached: Dict[str, SharedDataset] = {}
+
+
+def attach(handle: SharedDatasetHandle) -> Dataset:
+    """Attaches to a shared dataset.
+
+    Datasets are attached only once per process and reused in subsequent calls. If the handle refers to a window of
+    the dataset, a view over those bars is returned.
+
+    :param handle: The handle of the shared dataset.
+    """
+    ret = _attached.get(handle.name)
+    if ret is None:
+        ret = SharedDataset(shared_memory.SharedMemory(name=handle.name), handle.length, False)
+        _attached[handle.name] = ret
+    if handle.start != 0 or handle.stop is not None:
+        return ret.slice(handle.start, handle.stop)
+    return ret
+
+
+def detach(names: Iterable[str]):
+    """Detaches from shared datasets that were attached in the current process, so their memory can be released.
+
+    :param names: The names of the shared memory blocks. Datasets that are not attached are ignored.
+    """
+    for name in names:
+        dataset = _attached.pop(name, None)
+        if dataset is not None:
+            try:
+                dataset.release()
+            except BufferError:
+                # Some view is still around. The block gets closed when it is garbage collected.
+                pass
+
+
+class SharedDatasets:
+    """Loads CSV, Parquet or Arrow files into shared memory, once per file. See :func:`load_file`.
+
+    Files are loaded again if their size or modification time changes. The datasets they replace are kept until
+    :meth:`release_stale` is called, since tasks in flight may still be using them.
+
+    Datasets are released when :meth:`close` is called, or when exiting the context if used as a context manager.
+
+    :param data_dir: The directory where the files are located.
+    :param tzinfo: The timezone for the datetimes in the files.
+    """
+
+    def __init__(self, data_dir: str, tzinfo: datetime.tzinfo = datetime.timezone.utc):
+        self._data_dir = data_dir
+        self._tzinfo = tzinfo
+        # Filename -> (size and modification time of the file, dataset).
+        self._datasets: Dict[str, Tuple[Tuple[int, int], SharedDataset]] = {}
+        self._stale: List[SharedDataset] = []
+
+    def load(self, filename: str) -> SharedDatasetHandle:
+        """Loads a file, if it wasn't loaded before or it changed, and returns the handle to the shared dataset.
+
+        :param filename: The name of the file, relative to the data directory.
+        """
+        return self.get(filename).handle
+
+    def get(self, filename: str) -> SharedDataset:
+        """Loads a file, if it wasn't loaded before or it changed, and returns the shared dataset.
+
+        :param filename: The name of the file, relative to the data directory.
+        """
+        path = os.path.join(self._data_dir, filename)
+        stat = os.stat(source_path(path))
+        file_key = (stat.st_size, stat.st_mtime_ns)
+        entry = self._datasets.get(filename)
+        if entry is not None and entry[0] == file_key:
+            return entry[1]
+
+        if entry is not None:
+            self._stale.append(entry[1])
+        dataset = SharedDataset.create(load_file(path, tzinfo=self._tzinfo))
+        self._datasets[filename] = (file_key, dataset)
+        return dataset
+
+    def release_stale(self) -> List[str]:
+        """Releases the datasets for files that changed since they were loaded.
+
+        Should be called when no task is using them.
+
+        :returns: The names of the shared memory blocks that were released.
+        """
+        ret = [dataset.handle.name for dataset in self._stale]
+        for dataset in self._stale:
+            dataset.release()
+        self._stale = []
+        return ret
+
+    def close(self):
+        self.release_stale()
+        for _, dataset in self._datasets.values():
+            dataset.release()
+        self._datasets = {}
+
+    def __enter__(self) -> "SharedDatasets":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _lazy_decimal(column: str) -> property:
+    # The Decimal is kept in the slot that bar.Bar uses for the attribute, which is left empty until first access.
+    slot = bar.Bar.__dict__[column]
+
+    def fget(self: "DatasetBar") -> Decimal:
+        try:
+            return slot.__get__(self)
+        except AttributeError:
+            # Values are converted using the shortest representation that round-trips, which matches the original
+            # value for prices and volumes with up to 15 significant digits.
+            ret = Decimal(str(getattr(self._dataset, column)[self._index]))
+            slot.__set__(self, ret)
+            return ret
+
+    def fset(self: "DatasetBar", value: Decimal):
+        slot.__set__(self, value)
+
+    return property(fget, fset)
+
+
+class DatasetBar(bar.Bar):
+    """A :class:`basana.core.bar.Bar` that references a row in a :class:`Dataset`.
+
+    Prices and volume are converted to Decimal on first access, so strategies only pay for the ones they use. Bars are
+    not validated, since datasets are built from bars that already were. See :func:`validate`.
+
+    :param datetime: The beginning of the period.
+    :param pair: The trading pair.
+    :param dataset: The dataset.
+    :param index: The index of the bar in the dataset.
+    """
+
+    __slots__ = ("_dataset", "_index")
+
+    open = _lazy_decimal("open")
+    high = _lazy_decimal("high")
+    low = _lazy_decimal("low")
+    close = _lazy_decimal("close")
+    volume = _lazy_decimal("volume")
+
+    def __init__(self, datetime: datetime.datetime, pair: pair.Pair, dataset: Dataset, index: int):
+        self.datetime = datetime
+        self.pair = pair
+        self._dataset = dataset
+        self._index = index
+
+    def __reduce__(self):
+        # Pickle a plain bar instead of the whole dataset.
+        return bar.Bar.unchecked, (
+            self.datetime, self.pair, self.open, self.high, self.low, self.close, self.volume
+        )
+
+
+class BarSource(event.EventSource, event.Producer):
+    """An event source for bars stored in a :class:`Dataset`. See :class:`DatasetBar`.
+
+    :param pair: The trading pair.
+    :param dataset: The dataset.
+    :param period: The period of the bars, used to generate the events at the end of the period.
+    """
+
+    def __init__(self, pair: pair.Pair, dataset: Dataset, period: str):
+        super().__init__(producer=self)
+        timedelta = period_to_timedelta.get(period)
+        assert timedelta is not None, "Invalid period"
+
+        self._pair = pair
+        self._dataset = dataset
+        self._timedelta = timedelta
+        self._next = 0
+
+    def pop(self) -> Optional[event.Event]:
+        ret = None
+        if self._next < len(self._dataset):
+            ret = self._build_event(self._next)
+            self._next += 1
+        return ret
+
+    def _build_event(self, i: int) -> bar.BarEvent:
+        dataset = self._dataset
+        begin = datetime.datetime.fromtimestamp(int(dataset.datetime[i]), tz=datetime.timezone.utc)
+        return bar.BarEvent(begin + self._timedelta, DatasetBar(begin, self._pair, dataset, i))
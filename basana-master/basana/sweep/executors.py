@@ -0,0 +1,478 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import connection
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+import collections
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+
+from basana.core import errors
+from basana.core.logs import StructuredMessage
+from basana.sweep import batches, datasets, indicators, telemetry
+
+
+logger = logging.getLogger(__name__)
+
+#: A (host, port) tuple, or the path to a Unix socket.
+Address = Union[str, Tuple[str, int]]
+
+
+@dataclasses.dataclass(frozen=True)
+class Task:
+    """A batch of backtests that share a dataset."""
+
+    #: The backtest function. It gets pickled by reference, so it has to be importable wherever the task runs.
+    backtest_function: batches.BacktestFunction
+    #: The parameter sets. All of them should use the same filename.
+    parameter_sets: List[Dict[str, Any]]
+    #: The fraction of the bars to use, starting from the first one.
+    fraction: float = 1
+    #: The index of the first bar to use. Can't be combined with fraction.
+    start: int = 0
+    #: The index of the bar to stop at, or None to use the bars up to the end. Can't be combined with fraction.
+    stop: Optional[int] = None
+    #: The strategy name, used to precalculate indicators. See :data:`basana.sweep.indicators.STRATEGIES`.
+    strategy: Optional[str] = None
+
+
+# The maximum number of released shared memory blocks to tell workers about.
+_MAX_RELEASED = 64
+
+
+def _run_task(
+        backtest_function: batches.BacktestFunction, parameter_sets: List[Dict[str, Any]],
+        dataset: datasets.SharedDatasetHandle, submitted_at: float, released: Tuple[str, ...] = ()
+) -> Tuple[List[Optional[batches.Metrics]], telemetry.TaskStats]:
+    # Runs in a worker process. Blocks that the parent released are detached, so their memory can be reclaimed.
+    datasets.detach(released)
+    indicators.detach(released)
+    queue_wait = max(0.0, time.time() - submitted_at)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    durations: List[float] = []
+    results = batches.run_batch(backtest_function, parameter_sets, dataset, durations=durations)
+    stats = telemetry.TaskStats(
+        queue_wait=queue_wait,
+        wall_time=time.perf_counter() - wall_start,
+        cpu_time=time.process_time() - cpu_start,
+        bars=len(datasets.attach(dataset)) * len(parameter_sets),
+        payload_size=len(pickle.dumps(results)),
+        worker=f"{socket.gethostname()}:{os.getpid()}",
+        durations=durations,
+    )
+    return results, stats
+
+
+class LocalExecutor:
+    """Runs tasks in a local process pool.
+
+    Datasets, and the indicators required by each strategy, are loaded once into shared memory, and again if the
+    files change. The ones they replace are released once no task is in flight. Resources are released when
+    :meth:`close` is called, or when exiting the context if used as a context manager.
+
+    :param data_dir: The directory where CSV files are located.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param preload: Modules to import before starting workers, typically the one with the backtest function. If set,
+        and the platform supports it, workers get forked from a server process where these were already imported, so
+        they don't pay for the imports, and don't inherit the state of this process.
+    """
+
+    def __init__(self, data_dir: str, max_workers: Optional[int] = None, preload: Sequence[str] = ()):
+        #: The number of worker processes.
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self._shared_datasets = datasets.SharedDatasets(data_dir)
+        self._shared_indicators: Dict[str, indicators.SharedIndicators] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Shared memory blocks released recently, that workers may still be attached to.
+        self._released: collections.deque = collections.deque(maxlen=_MAX_RELEASED)
+        mp_context = None
+        if preload and "forkserver" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("forkserver")
+            mp_context.set_forkserver_preload([__name__] + list(preload))
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp_context)
+
+    def submit(self, task: Task) -> Future:
+        """Submits a task for execution.
+
+        Returns a future with the metrics for each parameter set, or None for those that failed, and the
+        :class:`basana.sweep.telemetry.TaskStats` for the task.
+        """
+        with self._lock:
+            idle = self._in_flight == 0
+        if idle:
+            self._release_stale()
+
+        if task.strategy is None:
+            handle = self._shared_datasets.load(task.parameter_sets[0]["filename"])
+        else:
+            shared_indicators = self._shared_indicators.get(task.strategy)
+            if shared_indicators is None:
+                shared_indicators = indicators.SharedIndicators(self._shared_datasets, task.strategy)
+                self._shared_indicators[task.strategy] = shared_indicators
+            handle = shared_indicators.load(task.parameter_sets)
+        if task.start != 0 or task.stop is not None:
+            assert task.fraction == 1, "A window can't be combined with a fraction"
+            handle = handle.window(task.start, task.stop)
+        else:
+            handle = handle.prefix(task.fraction)
+        with self._lock:
+            self._in_flight += 1
+        ret = self._pool.submit(
+            _run_task, task.backtest_function, task.parameter_sets, handle, time.time(), tuple(self._released)
+        )
+        ret.add_done_callback(self._on_done)
+        return ret
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _release_stale(self):
+        released = self._shared_datasets.release_stale()
+        if released:
+            for shared_indicators in self._shared_indicators.values():
+                self._released.extend(shared_indicators.release_stale(released))
+            self._released.extend(released)
+
+    def close(self):
+        # Workers need to be done before releasing the shared memory they are using.
+        self._pool.shutdown()
+        for shared_indicators in self._shared_indicators.values():
+            shared_indicators.close()
+        self._shared_indicators = {}
+        self._shared_datasets.close()
+
+    def __enter__(self) -> "LocalExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Broker:
+    # Hands out tasks to agents and collects their results. Lives in the coordinator process.
+
+    def __init__(self, lease_timeout: float, max_attempts: int):
+        self._lease_timeout = lease_timeout
+        self._max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._pending: collections.deque = collections.deque()
+        self._tasks: Dict[int, Tuple[Task, Future]] = {}
+        self._attempts: Dict[int, int] = {}
+        # Task id -> submission time, and time when it was last leased.
+        self._submitted: Dict[int, float] = {}
+        self._leased: Dict[int, float] = {}
+        # Task id -> (agent id, lease deadline).
+        self._leases: Dict[int, Tuple[str, float]] = {}
+        self._next_id = 0
+
+    def add_task(self, task: Task) -> Future:
+        ret: Future = Future()
+        ret.set_running_or_notify_cancel()
+        with self._cond:
+            task_id = self._next_id
+            self._next_id += 1
+            self._tasks[task_id] = (task, ret)
+            self._attempts[task_id] = 0
+            self._submitted[task_id] = time.monotonic()
+            self._pending.append(task_id)
+            self._cond.notify()
+        return ret
+
+    def get_task(self, agent_id: str, timeout: float) -> Optional[Tuple[int, Task]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._expire_leases()
+                if self._pending:
+                    task_id = self._pending.popleft()
+                    self._attempts[task_id] += 1
+                    self._leased[task_id] = time.monotonic()
+                    self._leases[task_id] = (agent_id, time.monotonic() + self._lease_timeout)
+                    return task_id, self._tasks[task_id][0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(remaining, self._lease_timeout))
+
+    def renew(self, agent_id: str, task_ids: List[int]):
+        with self._cond:
+            deadline = time.monotonic() + self._lease_timeout
+            for task_id in task_ids:
+                lease = self._leases.get(task_id)
+                if lease is not None and lease[0] == agent_id:
+                    self._leases[task_id] = (agent_id, deadline)
+
+    def put_result(self, agent_id: str, task_id: int, result: Optional[Tuple[List[Any], Any]], error: Optional[str]):
+        with self._cond:
+            # Results for tasks that were reassigned to other agents are ignored.
+            lease = self._leases.get(task_id)
+            if lease is None or lease[0] != agent_id:
+                return
+            del self._leases[task_id]
+
+            if error is not None and self._attempts[task_id] < self._max_attempts:
+                logger.warning(StructuredMessage("Task failed. Retrying", agent=agent_id, task=task_id, error=error))
+                self._pending.append(task_id)
+                self._cond.notify()
+                return
+
+            task, future = self._tasks.pop(task_id)
+            del self._attempts[task_id]
+            # Agents only pull tasks when they have a free worker, so the wait ends when the task is leased. Using the
+            # coordinator clock for both ends avoids skew between hosts.
+            queue_wait = self._leased.pop(task_id) - self._submitted.pop(task_id)
+        if error is None:
+            assert result is not None
+            metrics, stats = result
+        else:
+            # The backtests in the task are recorded as failed, instead of aborting the sweep.
+            logger.error(StructuredMessage("Task failed", agent=agent_id, task=task_id, error=error))
+            metrics = [None] * len(task.parameter_sets)
+            stats = telemetry.TaskStats(queue_wait=0, wall_time=0, cpu_time=0, bars=0, payload_size=0, worker=agent_id)
+        future.set_result((metrics, dataclasses.replace(stats, queue_wait=queue_wait)))
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for task_id, (agent_id, deadline) in list(self._leases.items()):
+            if deadline < now:
+                logger.warning(StructuredMessage("Agent is not responding. Reassigning task", agent=agent_id))
+                del self._leases[task_id]
+                self._pending.appendleft(task_id)
+
+
+class _BrokerClient:
+    # The agent side of the connection to the broker. Calls are serialized since the connection is shared by threads.
+
+    def __init__(self, address: Address, authkey: bytes):
+        self._conn = connection.Client(address, authkey=authkey)
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args: Any) -> Any:
+        with self._lock:
+            self._conn.send((method, args))
+            ret, error = self._conn.recv()
+        if error is not None:
+            raise errors.Error(error)
+        return ret
+
+    def close(self):
+        self._conn.close()
+
+
+class QueueExecutor:
+    """Publishes tasks to a work queue served from this process, and runs them on agents.
+
+    Agents, started with ``python -m basana.sweep.agent`` on this or other hosts, pull tasks from the queue, run them,
+    and push the results back. Every agent needs the same code and its own copy of the CSV files. Tasks are reassigned
+    if an agent stops responding, and retried on other agents if they fail. Backtests in tasks that fail every attempt
+    get None as their result.
+
+    :param address: The address to listen on.
+    :param authkey: The key agents use to authenticate.
+    :param max_workers: The expected number of worker processes across all agents. Used to size batches.
+    :param lease_timeout: The number of seconds after which a task is reassigned if its agent stops responding.
+    :param max_attempts: The number of times a task is attempted before it fails.
+    """
+
+    # The broker methods agents are allowed to call.
+    _methods = ("get_task", "renew", "put_result")
+
+    def __init__(
+            self, address: Address, authkey: bytes, max_workers: Optional[int] = None, lease_timeout: float = 60,
+            max_attempts: int = 3
+    ):
+        #: The expected number of worker processes across all agents.
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self._authkey = authkey
+        self._broker = _Broker(lease_timeout, max_attempts)
+        self._listener = connection.Listener(address, authkey=authkey)
+        self._closed = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def address(self) -> Address:
+        """The address the queue is being served on."""
+        return self._listener.address
+
+    def submit(self, task: Task) -> Future:
+        """Submits a task for execution.
+
+        Returns a future with the metrics for each parameter set, or None for those that failed, and the
+        :class:`basana.sweep.telemetry.TaskStats` for the task.
+        """
+        return self._broker.add_task(task)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        # Closing the listener doesn't interrupt a blocking accept, but a connection does.
+        try:
+            connection.Client(self.address, authkey=self._authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+
+    def __enter__(self) -> "QueueExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, connection.AuthenticationError):
+                continue
+            threading.Thread(target=self._serve, args=(conn, ), daemon=True).start()
+
+    def _serve(self, conn: connection.Connection):
+        with conn:
+            while not self._closed.is_set():
+                try:
+                    if not conn.poll(1):
+                        continue
+                    message = conn.recv()
+                    method, args = message if isinstance(message, tuple) and len(message) == 2 else (None, ())
+                    if method not in self._methods:
+                        conn.send((None, f"Invalid method {method!r}"))
+                        continue
+                    conn.send((getattr(self._broker, method)(*args), None))
+                except (OSError, EOFError):
+                    return
+
+
+def parse_address(address: str) -> Address:
+    """Parses an address in host:port format, or the path to a Unix socket."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _connect(
+        address: Address, authkey: bytes, retry_after: float, stop_event: threading.Event
+) -> Optional[_BrokerClient]:
+    while not stop_event.is_set():
+        try:
+            return _BrokerClient(address, authkey)
+        except (OSError, EOFError):
+            logger.info(StructuredMessage("Waiting for the coordinator", address=address))
+            stop_event.wait(retry_after)
+    return None
+
+
+def run_agent(
+        address: Address, authkey: bytes, data_dir: str, max_workers: Optional[int] = None, poll_interval: float = 5,
+        heartbeat_interval: float = 15, stop_event: Optional[threading.Event] = None
+):
+    """Pulls tasks from a :class:`QueueExecutor`, runs them in a local process pool and pushes the results back.
+
+    The agent waits for the coordinator if it is not available, and reconnects if the connection is lost. It runs until
+    stop_event is set.
+
+    :param address: The coordinator address.
+    :param authkey: The key used to authenticate with the coordinator.
+    :param data_dir: The directory where CSV files are located.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param poll_interval: How long to wait, in seconds, for tasks before checking if the agent should stop.
+    :param heartbeat_interval: How often, in seconds, to tell the coordinator that tasks are still running.
+    :param stop_event: An event to stop the agent.
+    """
+    stop_event = stop_event or threading.Event()
+    agent_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+    lock = threading.Lock()
+    running: Set[int] = set()
+
+    client: Optional[_BrokerClient] = None
+    with LocalExecutor(data_dir, max_workers=max_workers) as executor:
+        slots = threading.Semaphore(executor.max_workers)
+
+        def heartbeat(client: _BrokerClient, connection_lost: threading.Event):
+            while not connection_lost.wait(heartbeat_interval):
+                with lock:
+                    task_ids = list(running)
+                try:
+                    client.call("renew", agent_id, task_ids)
+                except (OSError, EOFError):
+                    connection_lost.set()
+
+        def on_done(client: _BrokerClient, connection_lost: threading.Event, task_id: int, future: Future):
+            result, error = None, None
+            try:
+                result = future.result()
+            except Exception as e:
+                error = repr(e)
+            try:
+                client.call("put_result", agent_id, task_id, result, error)
+            except (OSError, EOFError):
+                # The coordinator will reassign the task.
+                connection_lost.set()
+            finally:
+                with lock:
+                    running.discard(task_id)
+                slots.release()
+
+        while not stop_event.is_set():
+            if client is not None:
+                # The connection was lost. Tasks that were running on it will be reassigned by the coordinator.
+                client.close()
+            client = _connect(address, authkey, poll_interval, stop_event)
+            if client is None:
+                break
+            logger.info(StructuredMessage("Connected to the coordinator", address=address, agent=agent_id))
+            connection_lost = threading.Event()
+            threading.Thread(target=heartbeat, args=(client, connection_lost), daemon=True).start()
+
+            while not stop_event.is_set() and not connection_lost.is_set():
+                if not slots.acquire(timeout=poll_interval):
+                    continue
+                try:
+                    item = client.call("get_task", agent_id, poll_interval)
+                except (OSError, EOFError):
+                    item = None
+                    connection_lost.set()
+                if item is None:
+                    slots.release()
+                    continue
+
+                task_id, task = item
+                with lock:
+                    running.add(task_id)
+                try:
+                    future = executor.submit(task)
+                except Exception as e:
+                    # Like when the CSV file is missing. The coordinator will retry the task, maybe on other agents.
+                    future = Future()
+                    future.set_exception(e)
+                future.add_done_callback(functools.partial(on_done, client, connection_lost, task_id))
+            connection_lost.set()
+
+    # Closed once the executor is done, so the results of the tasks that were running can be pushed back.
+    if client is not None:
+        client.close()
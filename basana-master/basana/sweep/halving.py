@@ -0,0 +1,107 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+
+from basana.core.logs import StructuredMessage
+
+
+logger = logging.getLogger(__name__)
+
+#: Evaluates parameter sets using a fraction of the data, and returns the results in the same order.
+EvaluateFunction = Callable[[List[Dict[str, Any]], float], Sequence[Optional[Dict[str, Any]]]]
+
+
+def rung_fractions(rungs: int, eta: int) -> List[float]:
+    """Returns the fraction of the data used in each rung. The last rung always uses all of it.
+
+    :param rungs: The number of rungs.
+    :param eta: The factor by which the data grows, and the candidates shrink, from one rung to the next.
+    """
+    assert rungs > 0, "Invalid number of rungs"
+    assert eta > 1, "Invalid eta"
+    return [1 / eta ** (rungs - 1 - i) for i in range(rungs)]
+
+
+def _score(result: Optional[Dict[str, Any]], metric: str) -> Optional[float]:
+    ret = None
+    if result is not None:
+        ret = float(result[metric])
+        # NaN shows up, for example, when there were no trades on a short prefix. Those rank last, but are not
+        # discarded, so a group where nothing traded yet still gets promoted.
+        if math.isnan(ret):
+            ret = -math.inf
+    return ret
+
+
+def select_top(
+        parameter_sets: Sequence[Dict[str, Any]], results: Sequence[Optional[Dict[str, Any]]], eta: int, metric: str,
+        group_by: Sequence[str]
+) -> List[Dict[str, Any]]:
+    """Selects the top 1/eta parameter sets of each group, based on a metric.
+
+    Parameter sets without a result are discarded, and the ones with a metric that is NaN rank last.
+    """
+    groups: Dict[Tuple[Any, ...], List[Tuple[float, int]]] = {}
+    group_sizes: Dict[Tuple[Any, ...], int] = {}
+    for i, (params, result) in enumerate(zip(parameter_sets, results)):
+        group = tuple(params.get(key) for key in group_by)
+        group_sizes[group] = group_sizes.get(group, 0) + 1
+        score = _score(result, metric)
+        if score is not None:
+            groups.setdefault(group, []).append((score, i))
+
+    selected: List[int] = []
+    for group, scores in groups.items():
+        keep = max(1, math.ceil(group_sizes[group] / eta))
+        # Sort by score, in descending order, breaking ties using the original order.
+        scores.sort(key=lambda score_and_index: (-score_and_index[0], score_and_index[1]))
+        selected.extend(i for _, i in scores[:keep])
+    return [parameter_sets[i] for i in sorted(selected)]
+
+
+def successive_halving(
+        parameter_sets: Sequence[Dict[str, Any]], evaluate: EvaluateFunction, rungs: int = 3, eta: int = 3,
+        metric: str = "sharpe", group_by: Sequence[str] = ("symbol", "filename")
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Searches a parameter space using successive halving.
+
+    All candidates are evaluated on a short prefix of the data, and only the top 1/eta of them are promoted to the
+    next rung, where they're evaluated on a prefix eta times longer. The last rung uses all the data.
+
+    :param parameter_sets: The candidate parameter sets.
+    :param evaluate: The function used to evaluate parameter sets on a fraction of the data.
+    :param rungs: The number of rungs. A single rung is equivalent to a grid search.
+    :param eta: The factor by which the data grows, and the candidates shrink, from one rung to the next.
+    :param metric: The metric used to rank candidates. Higher is better.
+    :param group_by: Candidates are ranked within groups of parameter sets that share these parameters, so each
+        symbol/dataset keeps its own top candidates. Use an empty sequence to rank all of them together.
+    :returns: The (parameter set, result) tuples for the candidates that made it to the last rung.
+    """
+    candidates = list(parameter_sets)
+    fractions = rung_fractions(rungs, eta)
+    ret: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for rung, fraction in enumerate(fractions):
+        logger.info(StructuredMessage("Evaluating rung", rung=rung, fraction=fraction, candidates=len(candidates)))
+        results = evaluate(candidates, fraction)
+        assert len(results) == len(candidates), "Results don't match the candidates"
+        if rung == len(fractions) - 1:
+            ret = [(params, result) for params, result in zip(candidates, results) if result is not None]
+        else:
+            candidates = select_top(candidates, results, eta, metric, group_by)
+    return ret
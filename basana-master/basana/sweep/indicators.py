@@ -0,0 +1,207 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import dataclasses
+import hashlib
+import math
+
+import numpy as np
+
+from basana.sweep import datasets, vectorized
+
+# Indicators that only depend on the bars are calculated once per dataset, stored in shared memory alongside it, and
+# replayed by the strategies instead of being recalculated by every parameter set.
+
+#: The indicators that can be precalculated, by name. They take the closing prices and a period, and they return
+#: the same values talipp does, with NaN instead of None.
+FUNCTIONS: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    "rsi": vectorized.rsi,
+    "sma": vectorized.sma,
+}
+
+# An indicator name and its period.
+Spec = Tuple[str, int]
+
+#: The indicators required by each strategy, given a parameter set.
+STRATEGIES: Dict[str, Callable[[Dict[str, Any]], List[Spec]]] = {
+    "aspis_1": lambda params: [("rsi", 7), ("sma", 80)],
+    "aspis_2": lambda params: [("rsi", 7), ("sma", int(params["ma_short"])), ("sma", int(params["ma_long"]))],
+    "aspis_3": lambda params: [("sma", int(params["ma_short"])), ("sma", int(params["ma_long"]))],
+}
+
+
+def key(name: str, period: int) -> str:
+    """Returns the key used to identify an indicator in a :class:`basana.sweep.datasets.SharedDatasetHandle`."""
+    return f"{name}({period})"
+
+
+def dataset_checksum(dataset: datasets.Dataset) -> str:
+    """Returns the SHA-256 checksum of the bars in a dataset."""
+    ret = hashlib.sha256()
+    for column in datasets.COLUMNS:
+        ret.update(np.ascontiguousarray(getattr(dataset, column)).tobytes())
+    return ret.hexdigest()
+
+
+class Precalculated:
+    """Replays precalculated indicator values, one bar at a time.
+
+    Supports the subset of the talipp indicator interface used by the strategies, so it can be used instead of one.
+
+    :param values: The indicator values for every bar. NaN values are returned as None.
+    """
+
+    def __init__(self, values: np.ndarray):
+        self._values = values
+        self._count = 0
+
+    def add(self, value: Any):
+        """Moves to the next bar. The value is ignored since the indicator was already calculated."""
+        assert self._count < len(self._values), "No more values"
+        self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> Optional[float]:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Index out of range")
+        ret = float(self._values[index])
+        return None if math.isnan(ret) else ret
+
+
+class SharedIndicators:
+    """Calculates the indicators required by a strategy, once per dataset, and keeps them in shared memory.
+
+    Indicators are cached by name, period and dataset checksum, so identical datasets share them too. They are
+    released when :meth:`close` is called, or when exiting the context if used as a context manager.
+
+    :param shared_datasets: The datasets.
+    :param strategy: The strategy name. One of the keys in :data:`STRATEGIES`.
+    """
+
+    def __init__(self, shared_datasets: datasets.SharedDatasets, strategy: str):
+        self._shared_datasets = shared_datasets
+        self._required = STRATEGIES[strategy]
+        self._checksums: Dict[str, str] = {}
+        self._blocks: Dict[Tuple[str, str, int], shared_memory.SharedMemory] = {}
+
+    def load(self, parameter_sets: Iterable[Dict[str, Any]]) -> datasets.SharedDatasetHandle:
+        """Returns the handle to the dataset used by some parameter sets, including the indicators they require.
+
+        :param parameter_sets: Parameter sets that share the same filename.
+        """
+        parameter_sets = list(parameter_sets)
+        filename = parameter_sets[0]["filename"]
+        assert all(params["filename"] == filename for params in parameter_sets), "Datasets don't match"
+
+        dataset = self._shared_datasets.get(filename)
+        specs = sorted({spec for params in parameter_sets for spec in self._required(params)})
+        indicators = tuple((key(*spec), self._get_block(dataset, *spec).name) for spec in specs)
+        return dataclasses.replace(dataset.handle, indicators=indicators)
+
+    def _get_block(self, dataset: datasets.SharedDataset, name: str, period: int) -> shared_memory.SharedMemory:
+        # Checksums are kept by shared memory block name, since files that change are loaded into new blocks.
+        block_name = dataset.handle.name
+        checksum = self._checksums.get(block_name)
+        if checksum is None:
+            checksum = dataset_checksum(dataset)
+            self._checksums[block_name] = checksum
+
+        ret = self._blocks.get((checksum, name, period))
+        if ret is None:
+            values = FUNCTIONS[name](dataset.close, period)
+            # Zero sized shared memory blocks are not allowed.
+            ret = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=np.float64, buffer=ret.buf)[:] = values
+            self._blocks[(checksum, name, period)] = ret
+        return ret
+
+    def release_stale(self, dataset_names: Iterable[str]) -> List[str]:
+        """Releases the indicators that were only used by some datasets, once those are released.
+
+        See :meth:`basana.sweep.datasets.SharedDatasets.release_stale`.
+
+        :param dataset_names: The names of the shared memory blocks of the datasets that were released.
+        :returns: The names of the shared memory blocks that were released.
+        """
+        for name in dataset_names:
+            self._checksums.pop(name, None)
+        in_use = set(self._checksums.values())
+        ret = []
+        for block_key in [block_key for block_key in self._blocks if block_key[0] not in in_use]:
+            block = self._blocks.pop(block_key)
+            ret.append(block.name)
+            block.close()
+            block.unlink()
+        return ret
+
+    def close(self):
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
+
+    def __enter__(self) -> "SharedIndicators":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Indicators attached in the current process, by shared memory block name.
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def attach(handle: datasets.SharedDatasetHandle, name: str, period: int) -> Optional[Precalculated]:
+    """Returns a precalculated indicator for a shared dataset, or None if it is not available.
+
+    Indicators are calculated over the whole dataset, so for windows that don't start at the first bar they are
+    already warmed up with the bars before the window.
+
+    :param handle: The handle of the shared dataset.
+    :param name: The indicator name. One of the keys in :data:`FUNCTIONS`.
+    :param period: The indicator period.
+    """
+    block_name = dict(handle.indicators).get(key(name, period))
+    if block_name is None:
+        return None
+
+    block = _attached.get(block_name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=block_name)
+        _attached[block_name] = block
+    values = np.ndarray((handle.length, ), dtype=np.float64, buffer=block.buf)
+    return Precalculated(values[handle.start:handle.stop])
+
+
+def detach(names: Iterable[str]):
+    """Detaches from indicators that were attached in the current process, so their memory can be released.
+
+    :param names: The names of the shared memory blocks. Indicators that are not attached are ignored.
+    """
+    for name in names:
+        block = _attached.pop(name, None)
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:
+                # Some view is still around. The block gets closed when it is garbage collected.
+                pass
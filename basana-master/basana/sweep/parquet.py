@@ -0,0 +1,233 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bars from Parquet and Arrow IPC files. Requires pyarrow, which is installed using the ``parquet`` extra.
+
+Files need datetime, open, high, low, close and volume columns, and can have others, which are not read. Datetimes are
+the beginning of each period, either as timestamps or as strings in ``%Y-%m-%d %H:%M:%S`` format, and rows should be
+sorted by datetime. Prices and volumes can be floats, decimals, integers or strings.
+
+When a date range is set, filters are pushed down to the reader, so Parquet row groups that fall outside the range
+are skipped using their statistics.
+"""
+
+from decimal import Decimal
+from typing import Any, Iterator, List, Optional
+import datetime
+
+import numpy as np
+import pyarrow as pa  # type: ignore
+import pyarrow.dataset as ds  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
+
+from basana.core import bar, dt, errors, event, pair
+from basana.external.bitstamp.csv.bars import period_to_timedelta
+from basana.sweep import datasets
+
+
+#: The number of rows that are read at a time.
+BATCH_SIZE = 64 * 1024
+
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _open(path: str) -> ds.Dataset:
+    file_format = datasets.ARROW_FORMATS.get(datasets.extension(path))
+    if file_format is None:
+        raise errors.Error(f"{path} is not a Parquet or Arrow file")
+    ret = ds.dataset(path, format=file_format)
+    missing = [column for column in datasets.COLUMNS if column not in ret.schema.names]
+    if missing:
+        raise errors.Error(f"{path} is missing columns {missing}")
+    return ret
+
+
+def _bound(value: datetime.datetime, field_type: pa.DataType, tzinfo: datetime.tzinfo) -> pa.Scalar:
+    # Converts a datetime to the same type as the datetime column, so it can be compared with it.
+    value = value.replace(tzinfo=tzinfo) if dt.is_naive(value) else value.astimezone(tzinfo)
+    if pa.types.is_timestamp(field_type):
+        return pa.scalar(value if field_type.tz else value.replace(tzinfo=None), type=field_type)
+    return pa.scalar(value.strftime(_DATETIME_FORMAT), type=field_type)
+
+
+def scan(
+        path: str, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+        tzinfo: datetime.tzinfo = datetime.timezone.utc
+) -> Iterator[pa.RecordBatch]:
+    """Reads the datetime, open, high, low, close and volume columns in batches.
+
+    :param path: The path to the Parquet or Arrow file.
+    :param start: If set, rows before this datetime are skipped.
+    :param end: If set, rows at or after this datetime are skipped.
+    :param tzinfo: The timezone for naive datetimes in the file, and for naive start and end datetimes.
+    """
+    dataset = _open(path)
+    field_type = dataset.schema.field("datetime").type
+    condition = None
+    if start is not None:
+        condition = ds.field("datetime") >= _bound(start, field_type, tzinfo)
+    if end is not None:
+        end_condition = ds.field("datetime") < _bound(end, field_type, tzinfo)
+        condition = end_condition if condition is None else condition & end_condition
+    # Threads could deliver batches out of order.
+    yield from dataset.to_batches(
+        columns=list(datasets.COLUMNS), filter=condition, batch_size=BATCH_SIZE, use_threads=False
+    )
+
+
+def _to_datetimes(values: pa.Array, tzinfo: datetime.tzinfo) -> List[datetime.datetime]:
+    if pa.types.is_timestamp(values.type):
+        ret = values.to_pylist()
+        if values.type.tz is None:
+            ret = [value.replace(tzinfo=tzinfo) for value in ret]
+        return ret
+    return [datetime.datetime.strptime(value, _DATETIME_FORMAT).replace(tzinfo=tzinfo) for value in values.to_pylist()]
+
+
+def _to_decimals(values: pa.Array) -> List[Decimal]:
+    # Floats are converted using the shortest representation that round-trips, same as in
+    # basana.sweep.datasets.BarSource.
+    if pa.types.is_floating(values.type):
+        return [Decimal(repr(value)) for value in values.to_pylist()]
+    if pa.types.is_decimal(values.type):
+        return values.to_pylist()
+    return [Decimal(value) for value in values.to_pylist()]
+
+
+def _to_timestamps(values: pa.Array, tzinfo: datetime.tzinfo) -> np.ndarray:
+    if pa.types.is_timestamp(values.type) and (values.type.tz is not None or tzinfo == datetime.timezone.utc):
+        return values.cast(pa.timestamp("s", tz=values.type.tz)).cast(pa.int64()).to_numpy(zero_copy_only=False)
+    return np.array(
+        [dt.to_utc_timestamp(value) for value in _to_datetimes(values, tzinfo)],
+        dtype=datasets.COLUMN_DTYPES["datetime"]
+    )
+
+
+def _to_floats(values: pa.Array) -> np.ndarray:
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        return np.array([float(value) for value in values.to_pylist()], dtype=np.float64)
+    return values.cast(pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def load(
+        path: str, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+        tzinfo: datetime.tzinfo = datetime.timezone.utc
+) -> datasets.Dataset:
+    """Loads a dataset from a Parquet or Arrow file. Bars with no volume are skipped.
+
+    :raises basana.core.bar.InvalidBar: If prices in a bar are inconsistent.
+
+    :param path: The path to the Parquet or Arrow file.
+    :param start: If set, bars before this datetime are skipped.
+    :param end: If set, bars at or after this datetime are skipped.
+    :param tzinfo: The timezone for naive datetimes in the file, and for naive start and end datetimes.
+    """
+    chunks: List[List[np.ndarray]] = [[] for _ in datasets.COLUMNS]
+    for batch in scan(path, start=start, end=end, tzinfo=tzinfo):
+        columns = [_to_timestamps(batch.column("datetime"), tzinfo)]
+        columns.extend(_to_floats(batch.column(column)) for column in datasets.COLUMNS[1:])
+        with_volume = columns[-1] != 0
+        for chunk, column in zip(chunks, columns):
+            chunk.append(column[with_volume])
+    ret = datasets.Dataset(*[
+        np.concatenate(chunk) if chunk else np.array([], dtype=datasets.COLUMN_DTYPES[column])
+        for chunk, column in zip(chunks, datasets.COLUMNS)
+    ])
+    # Bars from datasets are not validated when they're delivered.
+    datasets.validate(ret)
+    return ret
+
+
+def write(dataset: datasets.Dataset, path: str, row_group_size: int = 100_000):
+    """Writes a dataset to a Parquet or Arrow file, with UTC timestamps.
+
+    :param dataset: The dataset.
+    :param path: The path to the file. The format depends on the extension. See
+        :data:`basana.sweep.datasets.ARROW_FORMATS`.
+    :param row_group_size: The number of rows per row group, or per record batch for Arrow files. Smaller row groups
+        make date range filters more selective.
+    """
+    file_format = datasets.ARROW_FORMATS.get(datasets.extension(path))
+    if file_format is None:
+        raise errors.Error(f"{path} is not a Parquet or Arrow file")
+    table = pa.table({
+        "datetime": pa.array(np.asarray(dataset.datetime), type=pa.timestamp("s", tz="UTC")),
+        **{column: pa.array(np.asarray(getattr(dataset, column))) for column in datasets.COLUMNS[1:]}
+    })
+    if file_format == "parquet":
+        pq.write_table(table, path, row_group_size=row_group_size)
+    else:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=row_group_size)
+
+
+class BarSource(event.EventSource, event.Producer):
+    """An event source for bars in a Parquet or Arrow file.
+
+    Events are the same ones that :class:`basana.external.bitstamp.csv.bars.BarSource` generates for a CSV file with
+    the same bars. Only the rows in the date range, and the OHLCV columns, are read, in batches.
+
+    :param pair: The trading pair.
+    :param path: The path to the Parquet or Arrow file.
+    :param period: The period of the bars, used to generate the events at the end of the period.
+    :param start: If set, bars before this datetime are skipped.
+    :param end: If set, bars at or after this datetime are skipped.
+    :param tzinfo: The timezone for naive datetimes in the file, and for naive start and end datetimes.
+    """
+
+    def __init__(
+            self, pair: pair.Pair, path: str, period: str, start: Optional[datetime.datetime] = None,
+            end: Optional[datetime.datetime] = None, tzinfo: datetime.tzinfo = datetime.timezone.utc
+    ):
+        super().__init__(producer=self)
+        timedelta = period_to_timedelta.get(period)
+        assert timedelta is not None, "Invalid period"
+
+        self._pair = pair
+        self._path = path
+        self._timedelta = timedelta
+        self._start = start
+        self._end = end
+        self._tzinfo = tzinfo
+        self._events: Optional[Iterator[bar.BarEvent]] = None
+        # Fail early if the file can't be read.
+        _open(path)
+
+    async def initialize(self):
+        self._events = self._load_events()
+
+    async def finalize(self):
+        self._events = None
+
+    def pop(self) -> Optional[event.Event]:
+        ret = None
+        if self._events is not None:
+            ret = next(self._events, None)
+            if ret is None:
+                self._events = None
+        return ret
+
+    def _load_events(self) -> Iterator[bar.BarEvent]:
+        for batch in scan(self._path, start=self._start, end=self._end, tzinfo=self._tzinfo):
+            datetimes = _to_datetimes(batch.column("datetime"), self._tzinfo)
+            columns: List[List[Any]] = [_to_decimals(batch.column(column)) for column in datasets.COLUMNS[1:]]
+            for begin, open_, high, low, close, volume in zip(datetimes, *columns):
+                # Skip bars with no volume.
+                if volume == 0:
+                    continue
+                yield bar.BarEvent(
+                    begin + self._timedelta, bar.Bar(begin, self._pair, open_, high, low, close, volume)
+                )
@@ -0,0 +1,262 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bars for many pairs, stored in one partition per pair, and delivered as a single time ordered stream.
+
+Usage: ``python -m basana.sweep.partitions -o data/universe -p 1h BTC/USDT=data/BTCUSDT1H.csv ETH/USDT=...``
+
+A partitioned store is a directory with a bar store per pair, named after the pair, like ``BTC-USDT.bars``. See
+:mod:`basana.sweep.barstore`.
+
+A single :class:`BarSource` delivers the bars for every pair, so backtests over large universes don't need an event
+source per pair, that the event dispatcher would have to check every time it looks for the next event.
+"""
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+
+from basana.core import bar, errors, event, pair
+from basana.external.bitstamp.csv.bars import period_to_timedelta
+from basana.sweep import barstore, datasets
+
+
+#: The maximum number of bars per partition that are merged at a time.
+BLOCK_SIZE = 10000
+
+_PARTITION_EXTENSION = ".bars"
+
+
+def partition_name(pair: pair.Pair) -> str:
+    """Returns the name of the partition for a pair, like ``BTC-USDT``."""
+    return f"{pair.base_symbol}-{pair.quote_symbol}"
+
+
+def _is_sorted(dataset: datasets.Dataset) -> bool:
+    timestamps = np.asarray(dataset.datetime)
+    return bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+
+def write(partitions: Dict[pair.Pair, datasets.Dataset], path: str, period: Optional[str] = None):
+    """Writes datasets to a partitioned store.
+
+    :param partitions: The dataset for each pair. Bars should be sorted by datetime.
+    :param path: The path to the store directory. It is created if it doesn't exist. Existing partitions for the same
+        pairs are replaced.
+    :param period: The period of the bars, if known.
+    """
+    os.makedirs(path, exist_ok=True)
+    for p, dataset in partitions.items():
+        if not _is_sorted(dataset):
+            raise errors.Error(f"Bars for {p} should be sorted by datetime")
+        barstore.write(dataset, os.path.join(path, partition_name(p) + _PARTITION_EXTENSION), period=period)
+
+
+def load(path: str) -> Dict[pair.Pair, datasets.Dataset]:
+    """Memory maps the partitions in a store.
+
+    :param path: The path to the store directory.
+    :returns: The dataset for each pair, ordered by partition name.
+    """
+    if not os.path.isdir(path):
+        raise errors.Error(f"{path} is not a partitioned store")
+    ret = {}
+    for name in sorted(os.listdir(path)):
+        stem, extension = os.path.splitext(name)
+        if extension != _PARTITION_EXTENSION:
+            continue
+        base_symbol, _, quote_symbol = stem.partition("-")
+        ret[pair.Pair(base_symbol, quote_symbol)] = barstore.load(os.path.join(path, name))
+    return ret
+
+
+def read_period(path: str) -> Optional[str]:
+    """Returns the period of the bars in a store, if it's the same for every partition and it is known.
+
+    :param path: The path to the store directory.
+    """
+    periods = {
+        barstore.read_header(os.path.join(path, name)).get("period")
+        for name in os.listdir(path) if os.path.splitext(name)[1] == _PARTITION_EXTENSION
+    }
+    return periods.pop() if len(periods) == 1 else None
+
+
+def merge(
+        partitions: Sequence[datasets.Dataset], block_size: int = BLOCK_SIZE
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Merges the bars in many datasets in time order, a block at a time.
+
+    Bars with the same datetime are ordered by partition.
+
+    :param partitions: The datasets. Bars should be sorted by datetime.
+    :param block_size: The maximum number of bars from each dataset in a block.
+    :returns: For each block, the timestamps, the partition indices and the row indices of the bars, in time order.
+    """
+    assert block_size > 0, "Invalid block size"
+
+    timestamps = [np.asarray(dataset.datetime) for dataset in partitions]
+    cursors = [0] * len(partitions)
+    while True:
+        active = [i for i in range(len(partitions)) if cursors[i] < len(timestamps[i])]
+        if not active:
+            break
+
+        # Every bar before the block end gets included, and no dataset contributes more than block_size bars.
+        block_end = min(
+            (timestamps[i][cursors[i] + block_size] for i in active if cursors[i] + block_size < len(timestamps[i])),
+            default=None
+        )
+        stops = [
+            len(timestamps[i]) if block_end is None
+            else cursors[i] + int(np.searchsorted(timestamps[i][cursors[i]:cursors[i] + block_size + 1], block_end))
+            for i in active
+        ]
+        if all(stop == cursors[i] for i, stop in zip(active, stops)):
+            # A dataset has more than block_size bars with the same datetime. All the bars with that datetime get
+            # merged in this block, so they're kept in partition order.
+            block_end = min(timestamps[i][cursors[i]] for i in active)
+            stops = [
+                cursors[i] + int(np.searchsorted(timestamps[i][cursors[i]:], block_end, side="right"))
+                for i in active
+            ]
+
+        block_timestamps = np.concatenate([timestamps[i][cursors[i]:stop] for i, stop in zip(active, stops)])
+        partition_indices = np.concatenate([
+            np.full(stop - cursors[i], i, dtype=np.int32) for i, stop in zip(active, stops)
+        ])
+        row_indices = np.concatenate([
+            np.arange(cursors[i], stop, dtype=np.int64) for i, stop in zip(active, stops)
+        ])
+        order = np.argsort(block_timestamps, kind="stable")
+        yield block_timestamps[order], partition_indices[order], row_indices[order]
+
+        for i, stop in zip(active, stops):
+            cursors[i] = stop
+
+
+class MergedBarSource(event.EventSource, event.Producer):
+    """An event source for the bars of many pairs, in time order.
+
+    Events are the same ones that a :class:`basana.sweep.datasets.BarSource` per pair would generate.
+
+    :param partitions: The dataset for each pair. Bars should be sorted by datetime.
+    :param period: The period of the bars, used to generate the events at the end of the period.
+    :param block_size: The maximum number of bars per pair that are merged at a time.
+    """
+
+    def __init__(
+            self, partitions: Dict[pair.Pair, datasets.Dataset], period: str, block_size: int = BLOCK_SIZE
+    ):
+        super().__init__(producer=self)
+        timedelta = period_to_timedelta.get(period)
+        assert timedelta is not None, "Invalid period"
+        for p, dataset in partitions.items():
+            if not _is_sorted(dataset):
+                raise errors.Error(f"Bars for {p} should be sorted by datetime")
+
+        self._pairs = list(partitions.keys())
+        self._datasets = list(partitions.values())
+        self._timedelta = timedelta
+        self._block_size = block_size
+        self._events: Optional[Iterator[bar.BarEvent]] = None
+
+    @property
+    def pairs(self) -> List[pair.Pair]:
+        """The pairs."""
+        return list(self._pairs)
+
+    async def initialize(self):
+        self._events = self._load_events()
+
+    async def finalize(self):
+        self._events = None
+
+    def pop(self) -> Optional[event.Event]:
+        ret = None
+        if self._events is not None:
+            ret = next(self._events, None)
+            if ret is None:
+                self._events = None
+        return ret
+
+    def _load_events(self) -> Iterator[bar.BarEvent]:
+        # Bars for different pairs usually share datetimes, so those get reused.
+        last_timestamp = None
+        begin = end = datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+        for timestamps, partition_indices, row_indices in merge(self._datasets, block_size=self._block_size):
+            for timestamp, i, row in zip(timestamps.tolist(), partition_indices.tolist(), row_indices.tolist()):
+                if timestamp != last_timestamp:
+                    begin = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+                    end = begin + self._timedelta
+                    last_timestamp = timestamp
+                yield bar.BarEvent(end, datasets.DatasetBar(begin, self._pairs[i], self._datasets[i], row))
+
+
+class BarSource(MergedBarSource):
+    """An event source for the bars in a partitioned store, in time order.
+
+    :param path: The path to the store directory.
+    :param period: The period of the bars, used to generate the events at the end of the period. Defaults to the one
+        in the store.
+    :param pairs: The pairs to include. Defaults to all of them.
+    :param block_size: The maximum number of bars per pair that are merged at a time.
+    """
+
+    def __init__(
+            self, path: str, period: Optional[str] = None, pairs: Optional[Sequence[pair.Pair]] = None,
+            block_size: int = BLOCK_SIZE
+    ):
+        partitions = load(path)
+        if pairs is not None:
+            missing = [p for p in pairs if p not in partitions]
+            if missing:
+                raise errors.Error(f"{path} has no partitions for {missing}")
+            partitions = {p: partitions[p] for p in pairs}
+        period = period or read_period(path)
+        if period is None:
+            raise errors.Error(f"The period is not set in {path}")
+        super().__init__(partitions, period, block_size=block_size)
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Builds a partitioned store with the bars for many pairs.")
+    parser.add_argument(
+        "files", nargs="+", metavar="PAIR=FILE",
+        help="A pair and the CSV, Parquet or Arrow file with its bars, like BTC/USDT=data/BTCUSDT1H.csv."
+    )
+    parser.add_argument("-o", "--output", required=True, help="The store directory.")
+    parser.add_argument("-p", "--period", help="The period of the bars, like 1m or 1d.")
+    args = parser.parse_args(args=params)
+
+    for spec in args.files:
+        symbol, separator, path = spec.partition("=")
+        base_symbol, _, quote_symbol = symbol.partition("/")
+        if not separator or not base_symbol or not quote_symbol:
+            parser.error(f"Invalid argument {spec}. Expected PAIR=FILE, like BTC/USDT=data/BTCUSDT1H.csv")
+        begin = time.perf_counter()
+        p = pair.Pair(base_symbol, quote_symbol)
+        dataset = datasets.load_file(path)
+        write({p: dataset}, args.output, period=args.period)
+        print(f"{p}: {len(dataset)} bars from {path} in {time.perf_counter() - begin:.2f}s")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
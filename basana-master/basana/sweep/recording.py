@@ -0,0 +1,114 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from typing import List, Optional, Tuple, Union
+import datetime
+
+from basana.core import bar
+from basana.core.enums import OrderOperation
+from basana.core.pair import Pair
+import basana.backtesting.exchange as backtesting_exchange
+
+
+class Recorder:
+    """Records the data needed to chart a backtest for a single pair, using compact arrays.
+
+    Prices and portfolio values are recorded once per bar, and fills are collected from the exchange at the end, so
+    this is much cheaper than building :class:`basana.backtesting.charts.LineCharts` while the backtest runs. Charts
+    are only built when :meth:`save` is called.
+
+    :param exchange: The backtesting exchange.
+    :param pair: The pair.
+    """
+
+    def __init__(self, exchange: backtesting_exchange.Exchange, pair: Pair):
+        self._exchange = exchange
+        self._pair = pair
+        # Timestamps, in seconds since the epoch, close prices and portfolio values in the quote symbol.
+        self._timestamps = array("d")
+        self._closes = array("d")
+        self._portfolio_values = array("d")
+        self._tzinfo: Optional[datetime.tzinfo] = None
+        exchange.subscribe_to_bar_events(pair, self._on_bar_event)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    @property
+    def closes(self) -> array:
+        return self._closes
+
+    @property
+    def portfolio_values(self) -> array:
+        return self._portfolio_values
+
+    def datetimes(self) -> List[datetime.datetime]:
+        return [self._to_datetime(timestamp) for timestamp in self._timestamps]
+
+    def fills(self, operation: OrderOperation) -> Tuple[List[datetime.datetime], List[float]]:
+        """Returns the datetimes and prices for the order fills for the pair.
+
+        :param operation: The order operation.
+        """
+        ret: List[Tuple[datetime.datetime, float]] = []
+        for order in self._exchange._get_all_orders():
+            if order.pair != self._pair or order.operation != operation:
+                continue
+            for fill in order.fills:
+                base_amount = fill.balance_updates[self._pair.base_symbol]
+                quote_amount = fill.balance_updates[self._pair.quote_symbol]
+                ret.append((fill.when, float(-quote_amount / base_amount)))
+        ret.sort()
+        return [when for when, _ in ret], [price for _, price in ret]
+
+    def save(self, path: str, width: Optional[int] = None, height: Optional[int] = None,
+             scale: Optional[Union[int, float]] = None):
+        """Saves a chart with the prices, buys, sells and portfolio values to a file.
+
+        :param path: The path to the file to save the image. See :meth:`basana.backtesting.charts.LineCharts.save`.
+        :param width: The width of the exported image in layout pixels.
+        :param height: The height of the exported image in layout pixels.
+        :param scale: The scale factor to use when exporting the figure.
+        """
+        # Plotting libraries are only needed here.
+        from basana.backtesting import charts
+
+        datetimes = self.datetimes()
+        line_charts = charts.LineCharts(self._exchange)
+        name = str(self._pair)
+        line_charts.add_series(name, name, datetimes, self._closes)
+        for operation, line in ((OrderOperation.BUY, "Buy"), (OrderOperation.SELL, "Sell")):
+            line_charts.add_series(name, line, *self.fills(operation), markers=True)
+        line_charts.add_series(
+            f"Portfolio value in {self._pair.quote_symbol}", "Portfolio", datetimes, self._portfolio_values
+        )
+        line_charts.save(path, width=width, height=height, scale=scale)
+
+    def _to_datetime(self, timestamp: float) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(timestamp, tz=self._tzinfo)
+
+    async def _on_bar_event(self, bar_event: bar.BarEvent):
+        close = bar_event.bar.close
+        balances = await self._exchange.get_balances()
+        base = balances.get(self._pair.base_symbol)
+        quote = balances.get(self._pair.quote_symbol)
+        portfolio_value = (0 if quote is None else quote.total) + (0 if base is None else base.total * close)
+
+        self._tzinfo = bar_event.when.tzinfo
+        self._timestamps.append(bar_event.when.timestamp())
+        self._closes.append(float(close))
+        self._portfolio_values.append(float(portfolio_value))
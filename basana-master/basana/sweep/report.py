@@ -0,0 +1,90 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Plots sweep results. Requires plotly, which is included in the charts extra.
+
+This module is only meant to be imported in the parent process, once the sweep is done, so worker processes don't pay
+for these imports.
+"""
+
+from typing import Any, Dict, List, Sequence
+import math
+
+import plotly.graph_objects as go  # type: ignore
+import plotly.subplots  # type: ignore
+
+from basana.sweep import batches
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def build_figures(results: Sequence[Dict[str, Any]], columns: Sequence[str], top: int = 20) -> List[go.Figure]:
+    """Builds a scatter plot matrix with the distribution of the metrics, and a table with the best results sorted by
+    Sharpe ratio. Results without a Sharpe ratio are skipped.
+
+    :param results: The results, merged with their parameters.
+    :param columns: The columns to include in the table. Missing ones are skipped.
+    :param top: The number of results to include in the table.
+    """
+    metrics = list(batches.METRICS)
+    values = [{metric: _to_float(result.get(metric)) for metric in metrics} for result in results]
+    rows = [(result, metric_values) for result, metric_values in zip(results, values)
+            if not math.isnan(metric_values["sharpe"])]
+
+    # Scatter plot matrix.
+    scatter = plotly.subplots.make_subplots(rows=len(metrics), cols=len(metrics))
+    for i, metric1 in enumerate(metrics):
+        for j, metric2 in enumerate(metrics):
+            if i != j:
+                trace = go.Scatter(
+                    x=[metric_values[metric2] for _, metric_values in rows],
+                    y=[metric_values[metric1] for _, metric_values in rows], mode="markers"
+                )
+                y_title = metric1
+            else:
+                trace = go.Histogram(x=[metric_values[metric1] for _, metric_values in rows], nbinsx=20)
+                y_title = "Frequency"
+            scatter.add_trace(trace, row=i + 1, col=j + 1)
+            scatter.update_xaxes(title_text=metric2, row=i + 1, col=j + 1)
+            scatter.update_yaxes(title_text=y_title, row=i + 1, col=j + 1)
+    scatter.layout.update(title_text="Backtest Results Visualization", showlegend=False, height=900, width=900)
+
+    # Table with the best results.
+    columns = [column for column in columns if any(column in result for result, _ in rows)]
+    best = sorted(rows, key=lambda row: row[1]["sharpe"], reverse=True)[:top]
+    table = go.Figure(go.Table(
+        header=dict(values=[column.replace("_", " ").capitalize() for column in columns]),
+        cells=dict(values=[[str(result.get(column, "")) for result, _ in best] for column in columns])
+    ))
+    table.layout.update(title_text=f"Top {top} Results (Sorted by Sharpe Ratio)")
+
+    return [scatter, table]
+
+
+def visualize(results: Sequence[Dict[str, Any]], columns: Sequence[str], top: int = 20):
+    """Shows the figures from :func:`build_figures` using the default plotly renderer.
+
+    :param results: The results, merged with their parameters.
+    :param columns: The columns to include in the table. Missing ones are skipped.
+    :param top: The number of results to include in the table.
+    """
+    for figure in build_figures(results, columns, top=top):
+        figure.show()
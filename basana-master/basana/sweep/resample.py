@@ -0,0 +1,186 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bars for longer periods, aggregated from a file with shorter ones, like 1m bars.
+
+Usage: ``python -m basana.sweep.resample -p 1h -p 4h data/BTCUSDT1M.csv``
+
+Bars are aggregated into periods aligned to multiples of the period length since the epoch, in UTC, so 1h bars begin on
+the hour and 1d bars at midnight UTC. Periods with no bars in the source are skipped, and the last period may be
+partial.
+
+Aggregated datasets are cached as bar stores (see :mod:`basana.sweep.barstore`) in a ``.resampled`` directory next to
+the source file, keyed by the checksum of the source file, the timezone and the period, so changes to the source file
+are picked up. Checksums for CSV files are taken from their manifests (see :mod:`basana.core.event_sources.manifest`).
+Sweeps can use aggregated datasets by setting the filename to the source file followed by ``@`` and the period, like
+``BTCUSDT1M.csv@4h``.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import argparse
+import datetime
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from basana.core import errors, pair
+from basana.external.bitstamp.csv.bars import period_to_timedelta
+from basana.sweep import barstore, cache, datasets
+
+
+#: The separator between the source file and the period in filenames.
+SEPARATOR = "@"
+
+#: The name of the cache directory, next to the source files.
+CACHE_DIRNAME = ".resampled"
+
+# Checksums are memoized by path, size and modification time.
+_checksums: Dict[Tuple[str, int, int], str] = {}
+
+
+def split_path(path: str) -> Tuple[str, Optional[str]]:
+    """Splits a path like ``BTCUSDT1M.csv@4h`` into the path to the source file and the period.
+
+    :param path: The path.
+    :returns: The path to the source file, and the period, or None if the path doesn't have one.
+    """
+    source, separator, period = path.rpartition(SEPARATOR)
+    if separator and period in period_to_timedelta:
+        return source, period
+    return path, None
+
+
+def _step(period: str) -> int:
+    timedelta = period_to_timedelta.get(period)
+    if timedelta is None:
+        raise errors.Error(f"Invalid period {period}")
+    return int(timedelta.total_seconds())
+
+
+def resample(dataset: datasets.Dataset, period: str) -> datasets.Dataset:
+    """Aggregates bars into longer periods.
+
+    :param dataset: The bars, sorted by datetime.
+    :param period: The period for the aggregated bars, like 1h or 1d.
+    :raises basana.core.errors.Error: If the period is invalid, or if bars are not sorted.
+    """
+    step = _step(period)
+    timestamps = np.asarray(dataset.datetime)
+    if len(timestamps) == 0:
+        return dataset.slice(0, 0)
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        raise errors.Error("Bars should be sorted by datetime")
+
+    begins = timestamps - timestamps % step
+    starts = np.flatnonzero(np.concatenate(([True], begins[1:] != begins[:-1])))
+    ends = np.concatenate((starts[1:], [len(begins)])) - 1
+    return datasets.Dataset(
+        begins[starts],
+        np.asarray(dataset.open)[starts],
+        np.maximum.reduceat(dataset.high, starts),
+        np.minimum.reduceat(dataset.low, starts),
+        np.asarray(dataset.close)[ends],
+        np.add.reduceat(dataset.volume, starts),
+    )
+
+
+def _checksum(path: str) -> str:
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    ret = _checksums.get(key)
+    if ret is None:
+        ret = cache.data_checksum(path)
+        _checksums[key] = ret
+    return ret
+
+
+def cache_path(
+        path: str, period: str, tzinfo: datetime.tzinfo = datetime.timezone.utc, cache_dir: Optional[str] = None
+) -> str:
+    """Returns the path to the cached store for the bars in a file aggregated into a period.
+
+    :param path: The path to the source file.
+    :param period: The period for the aggregated bars.
+    :param tzinfo: The timezone for the datetimes in the source file.
+    :param cache_dir: The cache directory. Defaults to a ``.resampled`` directory next to the source file.
+    """
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIRNAME)
+    key = hashlib.sha256(f"{_checksum(path)}:{tzinfo}:{period}".encode()).hexdigest()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{period}-{key[:16]}.bars")
+
+
+def load(
+        path: str, period: str, tzinfo: datetime.tzinfo = datetime.timezone.utc, cache_dir: Optional[str] = None
+) -> datasets.Dataset:
+    """Loads the bars in a file aggregated into a period, from the cache if possible.
+
+    :param path: The path to the source file. See :func:`basana.sweep.datasets.load_file`.
+    :param period: The period for the aggregated bars, like 1h or 1d.
+    :param tzinfo: The timezone for the datetimes in the source file.
+    :param cache_dir: The cache directory. Defaults to a ``.resampled`` directory next to the source file.
+    """
+    _step(period)
+    store = cache_path(path, period, tzinfo=tzinfo, cache_dir=cache_dir)
+    if not os.path.exists(store):
+        os.makedirs(os.path.dirname(store), exist_ok=True)
+        try:
+            barstore.write(resample(datasets.load_file(path, tzinfo=tzinfo), period), store, period=period)
+        except OSError:
+            # Another process may have written it first.
+            if not os.path.exists(store):
+                raise
+    return barstore.load(store)
+
+
+class BarSource(datasets.BarSource):
+    """An event source for the bars in a file aggregated into a longer period.
+
+    :param pair: The trading pair.
+    :param path: The path to the source file. See :func:`basana.sweep.datasets.load_file`.
+    :param period: The period for the aggregated bars, like 1h or 1d.
+    :param tzinfo: The timezone for the datetimes in the source file.
+    :param cache_dir: The cache directory. Defaults to a ``.resampled`` directory next to the source file.
+    """
+
+    def __init__(
+            self, pair: pair.Pair, path: str, period: str, tzinfo: datetime.tzinfo = datetime.timezone.utc,
+            cache_dir: Optional[str] = None
+    ):
+        super().__init__(pair, load(path, period, tzinfo=tzinfo, cache_dir=cache_dir), period)
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Aggregates bars into longer periods, and caches them.")
+    parser.add_argument("files", nargs="+", help="CSV, Parquet or Arrow files with bars.")
+    parser.add_argument(
+        "-p", "--period", action="append", required=True, choices=period_to_timedelta.keys(),
+        help="The period for the aggregated bars, like 1h. Can be repeated."
+    )
+    parser.add_argument("-c", "--cache-dir", help="The cache directory. Defaults to one next to each file.")
+    args = parser.parse_args(args=params)
+
+    for path in args.files:
+        for period in args.period:
+            begin = time.perf_counter()
+            dataset = load(path, period, cache_dir=args.cache_dir)
+            print(f"{path}@{period}: {len(dataset)} bars in {time.perf_counter() - begin:.2f}s")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,114 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from typing import Any, Dict, Iterator, Optional
+import hashlib
+import json
+import sqlite3
+
+
+# Parameters that don't affect the outcome of a backtest and are left out of the key.
+IGNORED_PARAMS = ("dataset", "chart_path")
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+    return obj
+
+
+def dumps(obj: Any) -> str:
+    """Serializes to JSON, preserving Decimals."""
+    return json.dumps(obj, sort_keys=True, default=_encode)
+
+
+def loads(data: str) -> Any:
+    """Deserializes JSON generated by :func:`dumps`."""
+    return json.loads(data, object_hook=_decode)
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    """Returns a stable hash of a parameter set.
+
+    The hash doesn't depend on the order of the parameters, and numerically equal Decimals with a different number
+    of trailing zeros hash differently.
+
+    :param params: The parameter set.
+    """
+    params = {key: value for key, value in params.items() if key not in IGNORED_PARAMS}
+    return hashlib.sha256(dumps(params).encode()).hexdigest()
+
+
+class ResultsStore:
+    """An on-disk SQLite store for backtest results, keyed by parameter set.
+
+    Results are committed as soon as they're added so they survive crashes and interruptions.
+
+    :param path: The path to the database file. It will be created if it doesn't exist.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        # WAL makes the per-result commits cheap without risking corruption.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, params TEXT, result TEXT)")
+        self._conn.commit()
+
+    def add(self, params: Dict[str, Any], result: Dict[str, Any]):
+        """Adds, or replaces, the result for a parameter set."""
+        stored_params = {key: value for key, value in params.items() if key not in IGNORED_PARAMS}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, params, result) VALUES (?, ?, ?)",
+            (params_key(params), dumps(stored_params), dumps(result))
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns the result for a parameter set, merged with its parameters, or None if there is none."""
+        row = self._conn.execute(
+            "SELECT params, result FROM results WHERE key = ?", (params_key(params), )
+        ).fetchone()
+        return None if row is None else {**loads(row[0]), **loads(row[1])}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Iterates over all the results, merged with their parameters."""
+        for params, result in self._conn.execute("SELECT params, result FROM results ORDER BY rowid"):
+            yield {**loads(params), **loads(result)}
+
+    def clear(self):
+        """Removes all the results."""
+        self._conn.execute("DELETE FROM results")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,660 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs parameter sweeps for a strategy.
+
+Usage: ``python -m basana.sweep --strategy samples.aspis_1``
+
+The strategy module must have an async ``backtest`` function, and its keyword arguments are the parameters that can be
+swept. Parameter sets are read from the ``symbol_data_<name>.json``, ``constant_params_<name>.json`` and
+``varying_params_<name>.json`` files in the configuration directory, where ``<name>`` is the last component of the
+module name. Settings that affect the results and are not parameters, like exchange fees, can be declared in a
+``SETTINGS`` dictionary in the strategy module, so cached results are not used once they change.
+
+This module, and everything imported by worker processes, should stay away from plotting and reporting libraries.
+Those are imported in the parent process, once the sweep is done.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, as_completed, wait
+from types import ModuleType
+from typing import Any, Callable, Counter, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import collections
+import collections.abc
+import contextlib
+import importlib
+import inspect
+import itertools
+import json
+import logging
+import math
+import operator
+import os
+
+from basana.core import errors
+from basana.sweep import (
+    agent, batches, cache, daemon, datasets, executors, halving, indicators, results, scheduling, space,
+    telemetry, vectorized, walkforward
+)
+
+
+#: The maximum number of backtests per task. Bigger batches amortize the overhead per task, but hold more parameter
+#: sets in memory and leave workers idle at the end.
+MAX_BATCH_SIZE = 256
+
+# Parameters that identify the dataset, or that are not interesting when comparing results.
+_DATASET_PARAMS = ("name", "symbol", "timeframe", "filename", "initial_capital")
+
+
+def load_strategy(module_name: str) -> ModuleType:
+    """Imports a strategy module, checking that it has a backtest function.
+
+    :param module_name: The module name, like ``samples.aspis_1``.
+    """
+    ret = importlib.import_module(module_name)
+    if not inspect.iscoroutinefunction(getattr(ret, "backtest", None)):
+        raise errors.Error(f"{module_name} doesn't have an async backtest function")
+    return ret
+
+
+def strategy_name(module_name: str) -> str:
+    """Returns the name used for the configuration files and to look up precalculated indicators."""
+    return module_name.rsplit(".", 1)[-1]
+
+
+def parameters(backtest_function: batches.BacktestFunction) -> Dict[str, Optional[Any]]:
+    """Returns the parameters a backtest function takes, with their default values, or None if they're required.
+
+    :param backtest_function: The backtest function.
+    """
+    ret = {}
+    for name, parameter in inspect.signature(backtest_function).parameters.items():
+        if name in results.IGNORED_PARAMS or parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            continue
+        ret[name] = None if parameter.default is parameter.empty else parameter.default
+    return ret
+
+
+class _Validated:
+    # Parameter sets that get checked as they're iterated. The length hint is kept, so progress can be tracked and
+    # batch sizes can be set for lazily generated parameter sets.
+
+    def __init__(self, parameter_sets: Iterable[Dict[str, Any]], backtest_function: batches.BacktestFunction):
+        self._parameter_sets = parameter_sets
+        signature = inspect.signature(backtest_function).parameters
+        self._known = set(signature.keys())
+        self._required = set(name for name, parameter in signature.items() if parameter.default is parameter.empty)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        checked = set()
+        for params in self._parameter_sets:
+            # Parameter sets usually share keys, so those are checked only once.
+            keys = frozenset(params.keys())
+            if keys not in checked:
+                if keys - self._known:
+                    raise errors.Error(f"Unknown parameters {sorted(keys - self._known)}")
+                if self._required - keys:
+                    raise errors.Error(f"Missing parameters {sorted(self._required - keys)}")
+                checked.add(keys)
+            yield params
+
+    def __length_hint__(self) -> int:
+        return operator.length_hint(self._parameter_sets)
+
+
+def validate(
+        parameter_sets: Iterable[Dict[str, Any]], backtest_function: batches.BacktestFunction
+) -> Iterable[Dict[str, Any]]:
+    """Lazily checks that parameter sets match the parameters a backtest function takes.
+
+    The length hint of the parameter sets is kept. See :func:`operator.length_hint`.
+
+    :param parameter_sets: The parameter sets.
+    :param backtest_function: The backtest function.
+    :raises basana.core.errors.Error: If a parameter set is missing required parameters, or has unknown ones.
+    """
+    return _Validated(parameter_sets, backtest_function)
+
+
+def load_json(path: str) -> Any:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def generate_parameter_sets(config_dir: str, name: str) -> space.ParameterSpace:
+    """Loads the parameter space for a strategy from its configuration files.
+
+    Varying parameters can be lists, ranges or log scales, with constraints between them. See
+    :class:`basana.sweep.space.ParameterSpace`.
+
+    :param config_dir: The directory with the configuration files.
+    :param name: The strategy name.
+    """
+    symbol_data = load_json(os.path.join(config_dir, f"symbol_data_{name}.json"))
+    constant_params = load_json(os.path.join(config_dir, f"constant_params_{name}.json"))
+    varying_params = load_json(os.path.join(config_dir, f"varying_params_{name}.json"))
+    return space.ParameterSpace.from_config(varying_params, groups=symbol_data, constants=constant_params)
+
+
+class MassBacktest:
+    """Runs backtests for many parameter sets and collects the results.
+
+    :param backtest_function: The backtest function.
+    :param strategy: The strategy name, used to precalculate indicators and to pre-screen. See
+        :data:`basana.sweep.indicators.STRATEGIES` and :data:`basana.sweep.vectorized.STRATEGIES`.
+    :param data_dir: The directory where CSV files are located.
+    :param batched: True to group parameter sets that share a dataset, and run each group in a single worker task.
+    :param results_store: Where results get streamed as soon as each backtest completes.
+    :param result_cache: A cache for results. Parameter sets with a cached result are not dispatched.
+    :param executor_factory: Creates the executor that runs the backtests. By default they run in a local process
+        pool, with datasets and indicators loaded once into shared memory.
+    :param telemetry: Collects throughput and utilization statistics for the tasks.
+    :param cost_model: If set, tasks are scheduled longest first, with sizes based on their estimated cost. See
+        :func:`basana.sweep.scheduling.schedule`.
+    """
+
+    def __init__(
+            self, backtest_function: batches.BacktestFunction, strategy: Optional[str] = None, data_dir: str = "data",
+            batched: bool = False, results_store: Optional[results.ResultsStore] = None,
+            result_cache: Optional[cache.ResultCache] = None, executor_factory: Optional[Callable[[], Any]] = None,
+            telemetry: Optional[telemetry.Telemetry] = None, cost_model: Optional[scheduling.CostModel] = None
+    ):
+        self.backtest_function = backtest_function
+        self.strategy = strategy
+        self.data_dir = data_dir
+        self.batched = batched
+        self.results_store = results_store
+        self.result_cache = result_cache
+        self.executor_factory = executor_factory or (lambda: executors.LocalExecutor(data_dir))
+        self.telemetry = telemetry
+        self.cost_model = cost_model
+        self.results: List[Dict[str, Any]] = []
+
+    def run(
+            self, parameter_sets: Iterable[Dict[str, Any]], resume: bool = False, prescreen_top: Optional[int] = None
+    ):
+        """Runs a backtest for every parameter set.
+
+        Parameter sets can be lazily generated. They are consumed as workers become available, so the whole grid is
+        never held in memory, unless pre-screening since that ranks all of them. Scheduling by cost orders them in
+        windows. See :func:`basana.sweep.scheduling.schedule_windows`.
+
+        :param parameter_sets: The parameter sets.
+        :param resume: True to skip parameter sets that are already in the results store.
+        :param prescreen_top: If set, only the top N parameter sets for each dataset, based on a fast approximate
+            evaluation, get a full backtest.
+        """
+        expected = operator.length_hint(parameter_sets)
+        if self.telemetry is not None:
+            self.telemetry.expect(expected)
+            parameter_sets = self._track_expected(parameter_sets, expected)
+        if not resume and self.results_store is not None:
+            self.results_store.clear()
+        skipped: Counter[str] = collections.Counter()
+        pending: Iterable[Dict[str, Any]] = self._pending(parameter_sets, resume, skipped)
+
+        if prescreen_top:
+            assert self.strategy in vectorized.STRATEGIES, f"Pre-screening is not supported for {self.strategy}"
+            pending = list(pending)
+            total = len(pending)
+            pending = vectorized.prescreen(
+                self.strategy, pending, lambda filename: datasets.load_file(os.path.join(self.data_dir, filename)),
+                prescreen_top
+            )
+            print(f"Pre-screening kept {len(pending)} out of {total} parameter sets")
+            if self.telemetry is not None:
+                self.telemetry.skip(total - len(pending))
+
+        with self.executor_factory() as executor:
+            self._start_executor(executor)
+            if self.cost_model is None:
+                batch_size = self._batch_size(executor, operator.length_hint(pending) or expected)
+                planned: Iterable[List[Dict[str, Any]]] = batches.split(pending, batch_size)
+            else:
+                planned = (batch for _, batch in scheduling.schedule_windows(
+                    pending, self.cost_model.cost, executor.max_workers, MAX_BATCH_SIZE if self.batched else 1
+                ))
+            # Results are processed as they complete, not in submission order.
+            for batch, batch_results in self._stream_batches(executor, planned):
+                for params, metrics in zip(batch, batch_results):
+                    self.add_result(params, None if metrics is None else batches.from_metrics(metrics))
+
+        if resume:
+            print(f"Resumed. Skipped {skipped['done']} parameter sets that were already done")
+        if self.result_cache is not None:
+            print(f"Found {skipped['cached']} results in the cache")
+
+    def run_successive_halving(self, parameter_sets: Iterable[Dict[str, Any]], rungs: int = 3, eta: int = 3):
+        """Searches the parameter sets using successive halving. See :func:`basana.sweep.halving.successive_halving`.
+
+        Only the results from the last rung, which uses all the data, are kept.
+        """
+        if self.results_store is not None:
+            self.results_store.clear()
+
+        parameter_sets = list(parameter_sets)
+        with self.executor_factory() as executor:
+            self._start_executor(executor)
+
+            def evaluate(candidates, fraction):
+                print(f"Evaluating {len(candidates)} parameter sets on {fraction:.1%} of the data")
+                return self._evaluate_batches(executor, candidates, fraction)
+
+            for params, result in halving.successive_halving(parameter_sets, evaluate, rungs=rungs, eta=eta):
+                self.add_result(params, result)
+
+    def run_walk_forward(
+            self, parameter_sets: Iterable[Dict[str, Any]], in_sample: int, out_of_sample: int,
+            step: Optional[int] = None, anchored: bool = False
+    ):
+        """Runs a walk-forward optimization. See :func:`basana.sweep.walkforward.walk_forward`.
+
+        Only the out-of-sample results are kept, with the window they belong to.
+        """
+        if self.results_store is not None:
+            self.results_store.clear()
+
+        parameter_sets = list(parameter_sets)
+        lengths: Dict[str, int] = {}
+
+        def get_length(filename):
+            if filename not in lengths:
+                lengths[filename] = len(datasets.load_file(os.path.join(self.data_dir, filename)))
+            return lengths[filename]
+
+        with self.executor_factory() as executor:
+            self._start_executor(executor)
+            window_results = walkforward.walk_forward(
+                parameter_sets, lambda windows: self._evaluate_windows(executor, windows), get_length,
+                in_sample, out_of_sample, step=step, anchored=anchored
+            )
+
+        for window_result in window_results:
+            if window_result.params is not None:
+                window = window_result.window
+                params = {
+                    **window_result.params,
+                    "in_sample_start": window.in_sample_start,
+                    "out_of_sample_start": window.out_of_sample_start,
+                    "out_of_sample_stop": window.out_of_sample_stop,
+                }
+                # Not cached since these are not the results for the whole dataset.
+                self.add_result(params, window_result.out_of_sample_result, store_in_cache=False)
+
+        for group, equity in walkforward.stitch(window_results).items():
+            print(f"Out-of-sample profit for {group}: {(equity[-1] - 1) * 100:.2f}% over {len(equity) - 1} windows")
+
+    def add_result(
+            self, params: Dict[str, Any], result: Optional[Dict[str, Any]], store_in_cache: bool = True
+    ):
+        if result is None:
+            print(f"Warning: backtest returned None for params: {params}")
+            return
+
+        self.results.append({**params, **result})
+        if self.results_store is not None:
+            self.results_store.add(params, result)
+        if self.result_cache is not None and store_in_cache:
+            self.result_cache.put(params, result)
+
+    def print_results(self):
+        for i, result in enumerate(self.results):
+            print(f"Backtest {i + 1}:")
+            print(result)
+            print("-" * 30)
+
+    def get_best_result(self, key: str = "profit") -> Dict[str, Any]:
+        return max(self.results, key=lambda x: x[key])
+
+    def render_charts(
+            self, executor: executors.LocalExecutor, chart_dir: str, top: int, metric: str = "sharpe"
+    ) -> List[str]:
+        """Renders charts for the best results.
+
+        Charts are not built while sweeping, since that slows every backtest down. Instead, the best backtests are run
+        again, in parallel, recording what's needed to chart them, and each one saves its chart to a file. The backtest
+        function must take a ``chart_path`` argument.
+
+        :param executor: The executor used to run the backtests. Charts are saved by workers, so it should be local.
+        :param chart_dir: The directory where charts are saved. It is created if it doesn't exist.
+        :param top: The number of results to chart.
+        :param metric: The metric used to rank results. Higher is better.
+        :returns: The paths to the charts, in rank order.
+        """
+        names = parameters(self.backtest_function).keys()
+        ranked = [result for result in self.results if not math.isnan(float(result[metric]))]
+        ranked.sort(key=lambda result: float(result[metric]), reverse=True)
+        os.makedirs(chart_dir, exist_ok=True)
+
+        ret = []
+        futures = []
+        for rank, result in enumerate(ranked[:top], start=1):
+            params = {key: value for key, value in result.items() if key in names}
+            path = os.path.join(chart_dir, f"{rank:03d}_{results.params_key(params)[:12]}.png")
+            # Walk-forward results are charted for their out-of-sample window.
+            task = executors.Task(
+                self.backtest_function, [{**params, "chart_path": path}],
+                start=result.get("out_of_sample_start", 0), stop=result.get("out_of_sample_stop"),
+                strategy=self.strategy if self.strategy in indicators.STRATEGIES else None
+            )
+            futures.append(executor.submit(task))
+            ret.append(path)
+        for future in futures:
+            future.result()
+        return ret
+
+    def _track_expected(
+            self, parameter_sets: Iterable[Dict[str, Any]], expected: int
+    ) -> Iterator[Dict[str, Any]]:
+        # The length hint of lazily generated parameter sets, like a parameter space with constraints, is an estimate
+        # that gets better as they're generated, so the number of expected backtests is updated as they're consumed.
+        # The length hint of an iterator is the number of items left instead, so those are not tracked.
+        assert self.telemetry is not None
+        if isinstance(parameter_sets, collections.abc.Iterator):
+            yield from parameter_sets
+            return
+        for params in itertools.chain(parameter_sets, [None]):
+            hint = operator.length_hint(parameter_sets)
+            if hint != expected:
+                self.telemetry.expect(hint - expected)
+                expected = hint
+            if params is not None:
+                yield params
+
+    def _pending(
+            self, parameter_sets: Iterable[Dict[str, Any]], resume: bool, skipped: Counter[str]
+    ) -> Iterator[Dict[str, Any]]:
+        # Lazily filters out parameter sets that are already in the results store, when resuming, or in the cache.
+        for params in parameter_sets:
+            done = self.results_store.get(params) if resume and self.results_store is not None else None
+            if done is not None:
+                self.results.append(done)
+                skipped["done"] += 1
+            else:
+                result = None if self.result_cache is None else self.result_cache.get(params)
+                if result is None:
+                    yield params
+                    continue
+                # Already in the cache.
+                self.add_result(params, result, store_in_cache=False)
+                skipped["cached"] += 1
+            if self.telemetry is not None:
+                self.telemetry.skip(1)
+
+    def _batch_size(self, executor: Any, count: int) -> int:
+        # Aim for a few batches per worker so they stay busy until the end. Unbatched, every backtest is a task.
+        if not self.batched:
+            return 1
+        return max(1, min(MAX_BATCH_SIZE, count // (executor.max_workers * 4)))
+
+    def _make_task(
+            self, batch: List[Dict[str, Any]], fraction: float = 1, start: int = 0, stop: Optional[int] = None
+    ) -> executors.Task:
+        return executors.Task(
+            self.backtest_function, batch, fraction=fraction, start=start, stop=stop,
+            strategy=self.strategy if self.strategy in indicators.STRATEGIES else None
+        )
+
+    def _schedule(
+            self, executor: Any, parameter_sets: Iterable[Dict[str, Any]], fraction: float = 1, start: int = 0,
+            stop: Optional[int] = None
+    ) -> List[Tuple[float, List[Dict[str, Any]]]]:
+        assert self.cost_model is not None
+        cost_model = self.cost_model
+        ret = scheduling.schedule(
+            parameter_sets, lambda params: cost_model.cost(params, fraction=fraction, start=start, stop=stop),
+            executor.max_workers, MAX_BATCH_SIZE if self.batched else 1
+        )
+        if cost_model.seconds_per_bar is not None:
+            estimate = sum(cost for cost, _ in ret) / executor.max_workers
+            print(f"Scheduled {len(ret)} tasks, longest first. Estimated time: {estimate:.0f}s")
+        return ret
+
+    def _plan(
+            self, executor: Any, parameter_sets: List[Dict[str, Any]], fraction: float = 1, start: int = 0,
+            stop: Optional[int] = None
+    ) -> List[Tuple[float, List[Dict[str, Any]]]]:
+        # Splits parameter sets into batches, with their estimated cost if there is a cost model.
+        if self.cost_model is not None:
+            return self._schedule(executor, parameter_sets, fraction=fraction, start=start, stop=stop)
+        batch_size = self._batch_size(executor, len(parameter_sets))
+        return [(0.0, batch) for batch in batches.split(parameter_sets, batch_size)]
+
+    def _submit_batches(
+            self, executor: Any, parameter_sets: List[Dict[str, Any]], fraction: float = 1
+    ) -> Dict[Future, List[Dict[str, Any]]]:
+        futures = {}
+        for _, batch in self._plan(executor, parameter_sets, fraction=fraction):
+            futures[executor.submit(self._make_task(batch, fraction=fraction))] = batch
+        if self.telemetry is not None:
+            self.telemetry.expect(len(parameter_sets))
+        return futures
+
+    def _stream_batches(
+            self, executor: Any, planned: Iterable[List[Dict[str, Any]]]
+    ) -> Iterator[Tuple[List[Dict[str, Any]], List[Optional[batches.Metrics]]]]:
+        # Batches are submitted as they are planned, but only a few per worker are kept in flight.
+        # Yields each batch with its results, as they complete.
+        futures: Dict[Future, List[Dict[str, Any]]] = {}
+        for batch in planned:
+            futures[executor.submit(self._make_task(batch))] = batch
+            while len(futures) >= executor.max_workers * 4:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = futures.pop(future)
+                    yield batch, self._task_results(future, batch)
+        for future in as_completed(futures):
+            yield futures[future], self._task_results(future, futures[future])
+
+    def _start_executor(self, executor: Any):
+        print(f"Running on {executor.max_workers} workers")
+        if self.telemetry is not None:
+            self.telemetry.start(executor.max_workers)
+
+    def _task_results(self, future: Future, batch: List[Dict[str, Any]]) -> List[Optional[batches.Metrics]]:
+        batch_results, stats = future.result()
+        if self.telemetry is not None:
+            self.telemetry.record(batch, stats)
+        return batch_results
+
+    def _evaluate_batches(
+            self, executor: Any, parameter_sets: List[Dict[str, Any]], fraction: float
+    ) -> List[Optional[Dict[str, Any]]]:
+        # Same as run, but the backtests use a prefix of the data and the results are returned in order.
+        futures = self._submit_batches(executor, parameter_sets, fraction=fraction)
+        results_by_id = {}
+        for future in as_completed(futures):
+            for params, metrics in zip(futures[future], self._task_results(future, futures[future])):
+                results_by_id[id(params)] = None if metrics is None else batches.from_metrics(metrics)
+        return [results_by_id[id(params)] for params in parameter_sets]
+
+    def _evaluate_windows(
+            self, executor: Any, windows: List[Tuple[int, int, List[Dict[str, Any]]]]
+    ) -> List[List[Optional[Dict[str, Any]]]]:
+        # Every window is submitted before waiting for results, so they all run in parallel. With a cost model, the
+        # most expensive batches across all windows go first.
+        planned: List[Tuple[float, int, List[Dict[str, Any]]]] = []
+        for i, (start, stop, parameter_sets) in enumerate(windows):
+            planned.extend(
+                (cost, i, batch) for cost, batch in self._plan(executor, parameter_sets, start=start, stop=stop)
+            )
+            if self.telemetry is not None:
+                self.telemetry.expect(len(parameter_sets))
+        planned.sort(key=lambda item: item[0], reverse=True)
+
+        futures = {}
+        for _, i, batch in planned:
+            start, stop, _ = windows[i]
+            futures[executor.submit(self._make_task(batch, start=start, stop=stop))] = (i, batch)
+
+        results_by_id: List[Dict[int, Optional[Dict[str, Any]]]] = [{} for _ in windows]
+        for future in as_completed(futures):
+            i, batch = futures[future]
+            for params, metrics in zip(batch, self._task_results(future, batch)):
+                results_by_id[i][id(params)] = None if metrics is None else batches.from_metrics(metrics)
+        return [
+            [results_by_id[i][id(params)] for params in parameter_sets]
+            for i, (_, _, parameter_sets) in enumerate(windows)
+        ]
+
+
+def report_columns(backtest_function: batches.BacktestFunction) -> List[str]:
+    """Returns the columns to show when reporting results: the dataset, the metrics and the strategy parameters."""
+    return ["symbol", "timeframe"] + list(batches.METRICS) + [
+        name for name in parameters(backtest_function).keys() if name not in _DATASET_PARAMS
+    ]
+
+
+def main(params: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Runs a parameter sweep for a strategy.")
+    parser.add_argument(
+        "--strategy", required=True, help="The module with the async backtest function, like samples.aspis_1"
+    )
+    parser.add_argument("--describe", action="store_true", help="Print the strategy parameters and exit")
+    parser.add_argument("--config-dir", default="config", help="The directory with the configuration files")
+    parser.add_argument("--data-dir", default="data", help="The directory where CSV files are located")
+    parser.add_argument("--results", help="Where to store results. Defaults to results_<name>.sqlite")
+    parser.add_argument("--resume", action="store_true", help="Skip parameter sets that are already in the results")
+    parser.add_argument("--cache", default="backtest_cache.sqlite", help="Where to cache results across runs")
+    parser.add_argument("--no-cache", action="store_true", help="Run every parameter set, ignoring the cache")
+    parser.add_argument(
+        "--search", choices=["grid", "halving", "walkforward"], default="grid", help="How to search the parameters"
+    )
+    parser.add_argument("--rungs", type=int, default=3, help="Successive halving rungs")
+    parser.add_argument("--eta", type=int, default=3, help="Successive halving reduction factor")
+    parser.add_argument("--in-sample", type=int, default=365, help="Walk-forward in-sample bars")
+    parser.add_argument("--out-of-sample", type=int, default=90, help="Walk-forward out-of-sample bars")
+    parser.add_argument(
+        "--step", type=int, help="How many bars walk-forward windows move forward. Defaults to the out-of-sample bars"
+    )
+    parser.add_argument("--anchored", action="store_true", help="Walk-forward in-sample windows start at the first bar")
+    parser.add_argument("--prescreen", type=int, help="Only backtest the top N approximate results for each dataset")
+    parser.add_argument("--serve", help="Run the backtests on agents connecting to this host:port address")
+    parser.add_argument(
+        "--daemon", nargs="?", const=daemon.DEFAULT_ADDRESS,
+        help="Run the backtests on a sweep daemon listening on this address. It should use the same data directory"
+    )
+    parser.add_argument(
+        "--authkey", default=os.environ.get(agent.AUTHKEY_ENV_VAR), help="The key agents use to authenticate"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        help="The number of worker processes. When serving, the expected number across all agents"
+    )
+    parser.add_argument("--telemetry", help="Where to write per task statistics. Defaults to telemetry_<name>.jsonl")
+    parser.add_argument(
+        "--no-schedule", action="store_true",
+        help="Submit parameter sets in order, as they are generated, instead of scheduling the longest tasks first"
+    )
+    parser.add_argument("--no-report", action="store_true", help="Don't plot the results")
+    parser.add_argument("--charts", type=int, default=10, help="The number of best results to save charts for")
+    parser.add_argument("--chart-dir", help="Where to save charts. Defaults to charts_<name>")
+    args = parser.parse_args(args=params)
+
+    module = load_strategy(args.strategy)
+    backtest_function = module.backtest
+    name = strategy_name(args.strategy)
+    if args.describe:
+        for parameter, default in parameters(backtest_function).items():
+            print(parameter if default is None else f"{parameter} (default: {default})")
+        return
+
+    parameter_sets = generate_parameter_sets(args.config_dir, name)
+    print(f"Number of parameter sets, before applying constraints: {operator.length_hint(parameter_sets)}")
+
+    # Progress, with the estimated time left, is logged periodically. main can be called many times from the same
+    # process, so the handler is added only once.
+    telemetry.logger.setLevel(logging.INFO)
+    if not telemetry.logger.handlers:
+        telemetry.logger.addHandler(logging.StreamHandler())
+
+    result_cache: Any = contextlib.nullcontext() if args.no_cache \
+        else cache.ResultCache(args.cache, backtest_function, args.data_dir, settings=getattr(module, "SETTINGS", {}))
+    if (args.serve or args.daemon) and not args.authkey:
+        parser.error("An authentication key is required to serve backtests or to use a daemon")
+    if args.serve:
+        # Agents are started with: python -m basana.sweep.agent --address host:port
+        def executor_factory():
+            return executors.QueueExecutor(
+                executors.parse_address(args.serve), args.authkey.encode(), max_workers=args.workers
+            )
+    elif args.daemon:
+        # Started with: python -m basana.sweep.daemon --preload <strategy>
+        def executor_factory():
+            return daemon.DaemonExecutor(executors.parse_address(args.daemon), args.authkey.encode())
+    else:
+        # Workers are forked from a server process where the strategy was already imported, so they start quickly.
+        def executor_factory():
+            return executors.LocalExecutor(args.data_dir, max_workers=args.workers, preload=[args.strategy])
+
+    # The cost per bar is learned from the telemetry of the previous run, before it gets overwritten.
+    telemetry_path = args.telemetry or f"telemetry_{name}.jsonl"
+    cost_model = None if args.no_schedule else scheduling.CostModel.from_telemetry(args.data_dir, telemetry_path)
+
+    with results.ResultsStore(args.results or f"results_{name}.sqlite") as results_store, \
+            result_cache as result_cache, \
+            telemetry.Telemetry(telemetry_path) as sweep_telemetry:
+        mass_backtest = MassBacktest(
+            backtest_function, strategy=name, data_dir=args.data_dir, batched=True, results_store=results_store,
+            result_cache=result_cache, executor_factory=executor_factory, telemetry=sweep_telemetry,
+            cost_model=cost_model
+        )
+        checked_parameter_sets = validate(parameter_sets, backtest_function)
+        if args.search == "halving":
+            mass_backtest.run_successive_halving(checked_parameter_sets, rungs=args.rungs, eta=args.eta)
+        elif args.search == "walkforward":
+            mass_backtest.run_walk_forward(
+                checked_parameter_sets, args.in_sample, args.out_of_sample, step=args.step, anchored=args.anchored
+            )
+        else:
+            mass_backtest.run(checked_parameter_sets, resume=args.resume, prescreen_top=args.prescreen)
+
+        summary = sweep_telemetry.summary()
+        print(
+            f"{summary['backtests']} backtests in {summary['elapsed']:.1f}s. {summary['bars_per_second']:.0f} bars/s, "
+            f"{summary['idle']:.0%} worker idle time, {summary['avg_queue_wait']:.2f}s average queue wait, "
+            f"{summary['avg_payload_size']:.0f} bytes average result size"
+        )
+        for slowest in summary["slowest"][:3]:
+            print(f"Slow backtest ({slowest['duration']:.2f}s): {slowest['params']}")
+
+    mass_backtest.print_results()
+    if not mass_backtest.results:
+        print("No results.")
+        return
+
+    if args.charts > 0:
+        # Charts are rendered on this host, even when backtests ran on agents. The daemon may be running from a
+        # different directory.
+        chart_dir = os.path.abspath(args.chart_dir or f"charts_{name}")
+        chart_executor = executor_factory() if args.daemon else \
+            executors.LocalExecutor(args.data_dir, max_workers=args.workers, preload=[args.strategy])
+        with chart_executor as executor:
+            paths = mass_backtest.render_charts(executor, chart_dir, args.charts)
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"Warning: failed to save chart {path}")
+        print(f"Saved {len(paths)} charts to {chart_dir}")
+
+    if not args.no_report:
+        # Plotting libraries are imported here, in the parent process only, and after workers are gone.
+        from basana.sweep import report
+        report.visualize(mass_backtest.results, report_columns(backtest_function))
+
+    # Get the best result based on total return
+    print("Best result:", mass_backtest.get_best_result())
+    for result in mass_backtest.results:
+        print(f"profit: {result['profit']}, sharpe: {result['sharpe']}, mdd: {result['max_drawdown']}")
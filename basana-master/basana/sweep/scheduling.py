@@ -0,0 +1,184 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cost-aware scheduling for sweeps that mix datasets of very different sizes.
+
+Tasks are dispatched longest first, and the size of each task shrinks as the remaining work does, so workers don't end
+up waiting on a few huge tasks at the end of the sweep.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools
+import json
+import os
+
+from basana.core import errors
+from basana.core.event_sources import manifest
+from basana.sweep import datasets
+
+
+#: How many tasks per worker the remaining work is split into. Higher values give better balance at the end of the
+#: sweep, at the expense of more tasks.
+CHUNKS_PER_WORKER = 2
+
+#: How many parameter sets :func:`schedule_windows` orders at a time. Bigger windows give a better order, at the
+#: expense of holding more parameter sets in memory.
+WINDOW_SIZE = 10000
+
+CostFunction = Callable[[Dict[str, Any]], float]
+
+
+class CostModel:
+    """Estimates how long backtests take.
+
+    The cost of a backtest is the number of bars it processes times the seconds per bar for the strategy. Bars are
+    counted once per file. Without an estimate for the seconds per bar, costs are just the number of bars, which is
+    good enough to order tasks.
+
+    :param data_dir: The directory where CSV files are located.
+    :param seconds_per_bar: The seconds per bar for the strategy, if known.
+    """
+
+    def __init__(self, data_dir: str, seconds_per_bar: Optional[float] = None):
+        self.data_dir = data_dir
+        self.seconds_per_bar = seconds_per_bar
+        self._bars: Dict[str, int] = {}
+
+    @classmethod
+    def from_telemetry(cls, data_dir: str, path: str) -> "CostModel":
+        """Builds a cost model using the telemetry from a previous run of the same strategy.
+
+        :param data_dir: The directory where CSV files are located.
+        :param path: The path to the telemetry JSONL file. If it doesn't exist, the seconds per bar will be unknown.
+            See :class:`basana.sweep.telemetry.Telemetry`.
+        """
+        bars = 0
+        wall_time = 0.0
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The previous run may have been killed while writing.
+                        continue
+                    if record.get("type") == "task":
+                        bars += record["bars"]
+                        wall_time += record["wall_time"]
+        return cls(data_dir, seconds_per_bar=wall_time / bars if bars and wall_time else None)
+
+    def bars(self, filename: str) -> int:
+        """Returns the number of bars in a file.
+
+        :param filename: The file name, relative to the data directory.
+        """
+        ret = self._bars.get(filename)
+        if ret is None:
+            path = os.path.join(self.data_dir, filename)
+            source_path = datasets.source_path(path)
+            if not os.path.exists(source_path):
+                raise errors.Error(f"{source_path} not found")
+            if source_path != path or datasets.extension(path) in datasets.ARROW_FORMATS:
+                ret = len(datasets.load_file(path))
+            elif (file_manifest := manifest.load(path)) is not None:
+                ret = file_manifest.rows
+            else:
+                with open(path, "rb") as f:
+                    lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+                # Skip the header.
+                ret = max(0, lines - 1)
+            self._bars[filename] = ret
+        return ret
+
+    def cost(self, params: Dict[str, Any], fraction: float = 1, start: int = 0, stop: Optional[int] = None) -> float:
+        """Returns the estimated cost of a backtest.
+
+        :param params: The parameter set. Parameter sets without a filename are assumed to process a single bar.
+        :param fraction: The fraction of the bars to use, starting from the first one.
+        :param start: The index of the first bar to use.
+        :param stop: The index of the bar to stop at, or None to use the bars up to the end.
+        """
+        filename = params.get("filename")
+        bars = 1 if filename is None else self.bars(filename)
+        if fraction < 1:
+            bars = int(bars * fraction)
+        else:
+            bars = max(0, min(bars, bars if stop is None else stop) - start)
+        return bars * (self.seconds_per_bar or 1.0)
+
+
+def schedule(
+        parameter_sets: Iterable[Dict[str, Any]], cost: CostFunction, workers: int, max_batch_size: int
+) -> List[Tuple[float, List[Dict[str, Any]]]]:
+    """Splits parameter sets into batches that share a dataset, and orders them longest first.
+
+    Batch sizes follow guided self-scheduling: each batch takes a share of the remaining work, so the first batches
+    are big, to amortize the overhead per task, and they get smaller towards the end, to keep every worker busy.
+
+    :param parameter_sets: The parameter sets.
+    :param cost: A function that estimates the cost of a backtest.
+    :param workers: The number of workers.
+    :param max_batch_size: The maximum number of parameter sets per batch.
+    :returns: The batches, with their estimated cost, most expensive first.
+    """
+    assert workers > 0, "Invalid number of workers"
+    assert max_batch_size > 0, "Invalid batch size"
+
+    groups: Dict[Tuple[Any, Any], List[Tuple[float, Dict[str, Any]]]] = {}
+    for params in parameter_sets:
+        groups.setdefault((params.get("symbol"), params.get("filename")), []).append((cost(params), params))
+    remaining = sum(item_cost for group in groups.values() for item_cost, _ in group)
+
+    ret: List[Tuple[float, List[Dict[str, Any]]]] = []
+    # Expensive groups are split first, while the remaining work, and so the batches, are still big.
+    for group in sorted(groups.values(), key=lambda group: max(item_cost for item_cost, _ in group), reverse=True):
+        group.sort(key=lambda item: item[0], reverse=True)
+        i = 0
+        while i < len(group):
+            target = remaining / (workers * CHUNKS_PER_WORKER)
+            batch: List[Dict[str, Any]] = []
+            batch_cost = 0.0
+            while i < len(group) and len(batch) < max_batch_size and (not batch or batch_cost + group[i][0] <= target):
+                batch_cost += group[i][0]
+                batch.append(group[i][1])
+                i += 1
+            ret.append((batch_cost, batch))
+            remaining -= batch_cost
+
+    ret.sort(key=lambda item: item[0], reverse=True)
+    return ret
+
+
+def schedule_windows(
+        parameter_sets: Iterable[Dict[str, Any]], cost: CostFunction, workers: int, max_batch_size: int,
+        window_size: int = WINDOW_SIZE
+) -> Iterator[Tuple[float, List[Dict[str, Any]]]]:
+    """Like :func:`schedule`, but for parameter sets that are generated lazily.
+
+    Parameter sets are consumed, and scheduled, in windows of a fixed size, so only one window is held in memory.
+
+    :param parameter_sets: The parameter sets.
+    :param cost: A function that estimates the cost of a backtest.
+    :param workers: The number of workers.
+    :param max_batch_size: The maximum number of parameter sets per batch.
+    :param window_size: The number of parameter sets to schedule at a time.
+    :returns: The batches, with their estimated cost, most expensive first within each window.
+    """
+    assert window_size > 0, "Invalid window size"
+
+    iterator = iter(parameter_sets)
+    while window := list(itertools.islice(iterator, window_size)):
+        yield from schedule(window, cost, workers, max_batch_size)
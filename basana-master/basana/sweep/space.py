@@ -0,0 +1,276 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Set
+import ast
+import math
+import operator
+
+from basana.core import errors
+
+
+#: The key used in configuration files for the list of constraints.
+CONSTRAINTS_KEY = "__constraints__"
+
+_BIN_OPS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+_COMPARE_OPS: Dict[type, Callable[[Any, Any], bool]] = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+def to_decimal(value: Any) -> Any:
+    """Converts numbers to Decimals, leaving other values untouched."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return Decimal(str(value))
+    return value
+
+
+def _trim(value: Decimal) -> Decimal:
+    # Trailing zeros would make equal values hash differently in result stores and caches.
+    if value == value.to_integral_value():
+        return value.quantize(Decimal(1))
+    return value.normalize()
+
+
+def expand(spec: Any) -> List[Any]:
+    """Returns the values for a parameter.
+
+    Numbers are converted to Decimals. The spec can be:
+
+    * A list of values.
+    * A linear range, like ``{"start": 10, "stop": 50, "step": 5}``. The stop value is included if it falls on a step.
+    * A range with a number of values, evenly spaced either linearly or on a log scale, like
+      ``{"start": 5, "stop": 200, "num": 8, "scale": "log"}``. Values are rounded to ``digits`` decimal places, which
+      defaults to 0 if both start and stop are integers. Duplicates after rounding are dropped.
+    * A single value.
+
+    Values from ranges have no trailing zeros.
+
+    :param spec: The parameter spec.
+    """
+    if isinstance(spec, list):
+        return [to_decimal(value) for value in spec]
+    if not isinstance(spec, dict):
+        return [to_decimal(spec)]
+
+    unknown = set(spec.keys()) - {"start", "stop", "step", "num", "scale", "digits"}
+    if unknown or "start" not in spec or "stop" not in spec:
+        raise errors.Error(f"Invalid range {spec}")
+    start, stop = to_decimal(spec["start"]), to_decimal(spec["stop"])
+    if not isinstance(start, Decimal) or not isinstance(stop, Decimal):
+        raise errors.Error(f"Invalid range {spec}. start and stop must be numbers")
+
+    if "step" in spec:
+        if "num" in spec or spec.get("scale", "linear") != "linear":
+            raise errors.Error(f"Invalid range {spec}. step can only be used with linear ranges")
+        step = to_decimal(spec["step"])
+        if step <= 0:
+            raise errors.Error(f"Invalid range {spec}. step must be > 0")
+        count = int((stop - start) // step) + 1
+        # Multiplying, instead of accumulating, keeps the values exact.
+        return [_trim(start + step * i) for i in range(max(0, count))]
+
+    num = spec.get("num")
+    if not isinstance(num, int) or num < 1:
+        raise errors.Error(f"Invalid range {spec}. Either step or num has to be set")
+    scale = spec.get("scale", "linear")
+    if scale == "linear":
+        points = [float(start) + (float(stop) - float(start)) * i / max(1, num - 1) for i in range(num)]
+    elif scale == "log":
+        if start <= 0 or stop <= 0:
+            raise errors.Error(f"Invalid range {spec}. Log ranges must be > 0")
+        log_start, log_stop = math.log(start), math.log(stop)
+        points = [math.exp(log_start + (log_stop - log_start) * i / max(1, num - 1)) for i in range(num)]
+    else:
+        raise errors.Error(f"Invalid range {spec}. Unknown scale {scale}")
+
+    integral = start == start.to_integral_value() and stop == stop.to_integral_value()
+    digits = spec.get("digits", 0 if integral else 6)
+    ret: List[Any] = []
+    for point in points:
+        value = _trim(Decimal(repr(point)).quantize(Decimal(1).scaleb(-digits)))
+        if value not in ret:
+            ret.append(value)
+    return ret
+
+
+class Constraint:
+    """A condition that parameter sets have to satisfy, like ``ma_short < ma_long``.
+
+    Expressions can use parameter names, numbers, strings, arithmetic and comparison operators, ``and``, ``or`` and
+    ``not``.
+
+    :param expression: The expression.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as e:
+            raise errors.Error(f"Invalid constraint {expression}: {e}")
+        #: The names of the parameters the constraint depends on.
+        self.names: Set[str] = set()
+        self._evaluate = self._compile(tree.body)
+
+    def __call__(self, params: Dict[str, Any]) -> bool:
+        return bool(self._evaluate(params))
+
+    def _compile(self, node: ast.AST) -> Callable[[Dict[str, Any]], Any]:
+        # Only a small subset of Python is supported, so configuration files can't run arbitrary code.
+        if isinstance(node, ast.Name):
+            name = node.id
+            self.names.add(name)
+            return lambda params: params[name]
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) \
+                and not isinstance(node.value, bool):
+            value = to_decimal(node.value)
+            return lambda params: value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.Not)):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda params: -operand(params)
+            return lambda params: not operand(params)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            bin_op = _BIN_OPS[type(node.op)]
+            left, right = self._compile(node.left), self._compile(node.right)
+            return lambda params: bin_op(left(params), right(params))
+        if isinstance(node, ast.BoolOp):
+            values = [self._compile(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda params: all(value(params) for value in values)
+            return lambda params: any(value(params) for value in values)
+        if isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPS for op in node.ops):
+            operands = [self._compile(node.left)] + [self._compile(comparator) for comparator in node.comparators]
+            compare_ops = [_COMPARE_OPS[type(op)] for op in node.ops]
+
+            def compare(params: Dict[str, Any]) -> bool:
+                values = [operand(params) for operand in operands]
+                return all(op(values[i], values[i + 1]) for i, op in enumerate(compare_ops))
+            return compare
+        raise errors.Error(f"Invalid constraint {self.expression}: {ast.dump(node)} is not supported")
+
+
+class ParameterSpace:
+    """A lazily generated set of parameter combinations.
+
+    Combinations are generated one at a time, so the whole grid is never held in memory. Constraints are checked as
+    soon as the parameters they depend on are set, so invalid regions of the grid are pruned without being expanded.
+
+    :param parameters: A dictionary with the spec for each parameter. See :func:`expand`.
+    :param constraints: Expressions that valid combinations have to satisfy. See :class:`Constraint`.
+    :param groups: Parameters that every combination gets merged into, like the symbol and filename for each dataset.
+        All combinations for a group are generated before moving on to the next one. Constraints can use these too.
+    :param constants: Parameters with a single value that every combination gets. Values are used as they are, except
+        for numbers, which are converted to Decimals.
+
+    When the same name is used in more than one place, group parameters override constants, and varying parameters
+    override both.
+
+    The length hint is an estimate of the number of valid combinations, that gets better as they're generated. See
+    :meth:`__length_hint__`.
+    """
+
+    def __init__(
+            self, parameters: Dict[str, Any], constraints: Sequence[str] = (),
+            groups: Sequence[Dict[str, Any]] = ({}, ), constants: Dict[str, Any] = {}
+    ):
+        self._names = list(parameters.keys())
+        self._values = [expand(spec) for spec in parameters.values()]
+        base = {key: to_decimal(value) for key, value in constants.items()}
+        self._groups = [{**base, **{key: to_decimal(value) for key, value in group.items()}} for group in groups]
+
+        group_names = set(key for group in self._groups for key in group.keys())
+        # Constraints get checked at the depth where the last parameter they depend on is set. Depth 0 is for those
+        # that depend on group parameters only.
+        self._constraints: List[List[Constraint]] = [[] for _ in range(len(self._names) + 1)]
+        for expression in constraints:
+            constraint = Constraint(expression)
+            unknown = constraint.names - set(self._names) - group_names
+            if unknown:
+                raise errors.Error(f"Invalid constraint {expression}. Unknown parameters {sorted(unknown)}")
+            depth = max([self._names.index(name) + 1 for name in constraint.names if name in self._names], default=0)
+            self._constraints[depth].append(constraint)
+        # The number of combinations below each depth.
+        self._sizes = [
+            math.prod(len(values) for values in self._values[depth:]) for depth in range(len(self._names) + 1)
+        ]
+        # Progress through the combinations, counting the pruned ones, and the number of valid ones so far.
+        self._covered = 0
+        self._generated = 0
+
+    @classmethod
+    def from_config(
+            cls, parameters: Dict[str, Any], groups: Sequence[Dict[str, Any]] = ({}, ), constants: Dict[str, Any] = {}
+    ) -> "ParameterSpace":
+        """Builds a parameter space from a configuration dictionary, where constraints are listed under
+        :data:`CONSTRAINTS_KEY`.
+        """
+        parameters = dict(parameters)
+        constraints = parameters.pop(CONSTRAINTS_KEY, [])
+        return cls(parameters, constraints=constraints, groups=groups, constants=constants)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        self._covered = 0
+        self._generated = 0
+        for group in self._groups:
+            if all(constraint(group) for constraint in self._constraints[0]):
+                yield from self._combinations(dict(group), 0)
+            else:
+                self._covered += self._sizes[0]
+
+    def __length_hint__(self) -> int:
+        """Returns the estimated number of valid combinations.
+
+        Before combinations are generated, this is the number of combinations without taking constraints into account.
+        While they are, the ones left are estimated using the fraction that satisfied the constraints so far, and once
+        they all were, this is the exact number.
+        """
+        total = len(self._groups) * self._sizes[0]
+        if self._covered == 0:
+            return total
+        return self._generated + round((total - self._covered) * self._generated / self._covered)
+
+    def _combinations(self, params: Dict[str, Any], depth: int) -> Iterator[Dict[str, Any]]:
+        if depth == len(self._names):
+            self._covered += 1
+            self._generated += 1
+            yield dict(params)
+            return
+
+        name = self._names[depth]
+        constraints = self._constraints[depth + 1]
+        for value in self._values[depth]:
+            params[name] = value
+            if all(constraint(params) for constraint in constraints):
+                yield from self._combinations(params, depth + 1)
+            else:
+                self._covered += self._sizes[depth + 1]
+        del params[name]
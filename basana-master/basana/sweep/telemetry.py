@@ -0,0 +1,215 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import dataclasses
+import heapq
+import json
+import logging
+import time
+
+from basana.core.logs import StructuredMessage
+from basana.sweep import results
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class TaskStats:
+    """Measurements taken while running a task."""
+
+    #: The number of seconds the task waited to start, since it was submitted.
+    queue_wait: float
+    #: The number of seconds it took to run the task.
+    wall_time: float
+    #: The CPU time, in seconds, used by the worker process to run the task.
+    cpu_time: float
+    #: The number of bars processed, adding up all backtests.
+    bars: int
+    #: The size, in bytes, of the pickled results.
+    payload_size: int
+    #: The host and process id of the worker that ran the task.
+    worker: str
+    #: The number of seconds it took to run each backtest.
+    durations: List[float] = dataclasses.field(default_factory=list)
+
+    @property
+    def bars_per_second(self) -> float:
+        return self.bars / self.wall_time if self.wall_time > 0 else 0.0
+
+
+class Telemetry:
+    """Collects throughput and utilization statistics for a sweep.
+
+    Each task is written as a JSON line as soon as it completes, and progress, with an estimate of the time left, is
+    logged periodically. A summary is added as the last line when the telemetry is closed.
+
+    :param path: The path to the JSONL file, or None to skip writing it.
+    :param report_interval: The minimum number of seconds between progress reports.
+    :param slowest: The number of slowest parameter sets to include in the summary.
+    """
+
+    def __init__(self, path: Optional[str] = None, report_interval: float = 10, slowest: int = 10):
+        self._file = None if path is None else open(path, "w")
+        self._report_interval = report_interval
+        self._slowest_count = slowest
+        self._workers = 1
+        self._started = time.monotonic()
+        self._last_report = self._started
+        self._expected = 0
+        self._tasks = 0
+        self._backtests = 0
+        self._bars = 0
+        self._wall_time = 0.0
+        self._cpu_time = 0.0
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._payload_size = 0
+        self._max_payload_size = 0
+        # A min-heap with the slowest backtests. The sequence number breaks ties between equal durations.
+        self._slowest: List[Tuple[float, int, Dict[str, Any]]] = []
+
+    def start(self, workers: int):
+        """Resets the clock, before tasks get submitted.
+
+        :param workers: The number of worker processes. Used to calculate utilization.
+        """
+        self._workers = workers
+        self._started = time.monotonic()
+        self._last_report = self._started
+
+    def expect(self, backtests: int):
+        """Adds to the number of backtests that are expected to run. Used to estimate the time left."""
+        self._expected += backtests
+
+    def skip(self, backtests: int):
+        """Subtracts from the number of backtests that are expected to run, for the ones that didn't need to."""
+        self._expected -= backtests
+
+    def record(self, parameter_sets: Sequence[Dict[str, Any]], stats: TaskStats):
+        """Records a completed task.
+
+        :param parameter_sets: The parameter sets for the task.
+        :param stats: The measurements for the task.
+        """
+        self._tasks += 1
+        self._backtests += len(parameter_sets)
+        self._bars += stats.bars
+        self._wall_time += stats.wall_time
+        self._cpu_time += stats.cpu_time
+        self._queue_wait += stats.queue_wait
+        self._max_queue_wait = max(self._max_queue_wait, stats.queue_wait)
+        self._payload_size += stats.payload_size
+        self._max_payload_size = max(self._max_payload_size, stats.payload_size)
+
+        for params, duration in zip(parameter_sets, stats.durations):
+            item = (duration, self._backtests, _public_params(params))
+            if len(self._slowest) < self._slowest_count:
+                heapq.heappush(self._slowest, item)
+            elif self._slowest and duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+        self._write({
+            "type": "task",
+            "elapsed": self._elapsed(),
+            "backtests": len(parameter_sets),
+            "queue_wait": stats.queue_wait,
+            "wall_time": stats.wall_time,
+            "cpu_time": stats.cpu_time,
+            "bars": stats.bars,
+            "bars_per_second": stats.bars_per_second,
+            "payload_size": stats.payload_size,
+            "worker": stats.worker,
+            "durations": stats.durations,
+        })
+
+        now = time.monotonic()
+        if now - self._last_report >= self._report_interval:
+            self._last_report = now
+            self.report()
+
+    def eta(self) -> Optional[float]:
+        """Returns the estimated number of seconds left, or None if it can't be estimated yet."""
+        remaining = self._expected - self._backtests
+        if self._backtests == 0 or remaining < 0:
+            return None
+        return self._elapsed() / self._backtests * remaining
+
+    def report(self):
+        """Logs the progress so far."""
+        eta = self.eta()
+        logger.info(StructuredMessage(
+            "Sweep progress", backtests=self._backtests, expected=self._expected,
+            bars_per_second=round(self._bars / max(self._elapsed(), 1e-9)),
+            eta=None if eta is None else f"{eta:.0f}s"
+        ))
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns a summary of the statistics collected so far."""
+        elapsed = self._elapsed()
+        utilization = self._wall_time / (elapsed * self._workers) if elapsed > 0 else 0.0
+        return {
+            "type": "summary",
+            "elapsed": elapsed,
+            "workers": self._workers,
+            "tasks": self._tasks,
+            "backtests": self._backtests,
+            "bars": self._bars,
+            "bars_per_second": self._bars / elapsed if elapsed > 0 else 0.0,
+            "wall_time": self._wall_time,
+            "cpu_time": self._cpu_time,
+            # Wall time in workers includes waiting for IO and for the GIL, so CPU time is lower for IO bound tasks.
+            "cpu_ratio": self._cpu_time / self._wall_time if self._wall_time > 0 else 0.0,
+            "avg_queue_wait": self._queue_wait / self._tasks if self._tasks else 0.0,
+            "max_queue_wait": self._max_queue_wait,
+            "utilization": utilization,
+            "idle": max(0.0, 1 - utilization),
+            "avg_payload_size": self._payload_size / self._tasks if self._tasks else 0.0,
+            "max_payload_size": self._max_payload_size,
+            "slowest": [
+                {"params": params, "duration": duration}
+                for duration, _, params in sorted(self._slowest, key=lambda item: item[0], reverse=True)
+            ],
+        }
+
+    def close(self):
+        """Writes the summary and closes the file."""
+        if self._file is not None:
+            self._write(self.summary())
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "Telemetry":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def _write(self, record: Dict[str, Any]):
+        if self._file is not None:
+            self._file.write(results.dumps(record) + "\n")
+            self._file.flush()
+
+
+def _public_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Decimals are kept, but serialized using their string representation.
+    return json.loads(json.dumps(
+        {key: value for key, value in params.items() if key not in results.IGNORED_PARAMS}, default=str
+    ))
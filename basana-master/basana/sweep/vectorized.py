@@ -0,0 +1,292 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Callable, Dict, List, Sequence, Set, Tuple
+import math
+
+import numpy as np
+
+from basana.sweep import batches, datasets
+
+# Vectorized, approximate, evaluation of the aspis strategies, meant for pre-screening large parameter grids.
+# Signals are calculated for many parameter sets at once, and then a long/flat position is simulated for all of them
+# together, one bar at a time. Results are approximate and should only be used to pick the candidates that get
+# evaluated with an event-driven backtest.
+
+# Signal codes.
+NO_SIGNAL = -1
+NEUTRAL = 0
+LONG = 1
+
+SignalsFunction = Callable[[datasets.Dataset, Dict[str, np.ndarray]], np.ndarray]
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple moving average, calculated the same way talipp does. Values are NaN until there are enough of them."""
+    assert period > 0, "Invalid period"
+    ret = np.full(len(values), np.nan)
+    if len(values) >= period:
+        # talipp seeds the average with the sum of the first values and then updates it incrementally. Accumulating
+        # the same steps in the same order gives the same floating point results.
+        steps = np.empty(len(values) - period + 1)
+        steps[0] = np.add.accumulate(values[:period])[-1] / period
+        steps[1:] = -((values[:-period] - values[period:]) / period)
+        ret[period - 1:] = np.cumsum(steps)
+    return ret
+
+
+def stddev(values: np.ndarray, period: int) -> np.ndarray:
+    """Population standard deviation over a rolling window. Values are NaN until there are enough of them."""
+    assert period > 0, "Invalid period"
+    ret = np.full(len(values), np.nan)
+    if len(values) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(values, period)
+        ret[period - 1:] = windows.std(axis=1)
+    return ret
+
+
+def rsi(values: np.ndarray, period: int) -> np.ndarray:
+    """Relative strength index, calculated the same way talipp does. Values are NaN until there are enough of them."""
+    assert period > 1, "Invalid period"
+    ret = np.full(len(values), np.nan)
+    if len(values) < period + 1:
+        return ret
+
+    changes = np.diff(values)
+    gains = np.where(changes > 0, changes, 0.0)
+    losses = np.where(changes < 0, -changes, 0.0)
+    # talipp seeds the averages using only period - 1 changes.
+    avg_gain = gains[:period - 1].sum() / (period - 1)
+    avg_loss = losses[:period - 1].sum() / (period - 1)
+    # Wilder's smoothing is recursive, so this loop can't be vectorized over time. It runs once per period, and not
+    # once per parameter set.
+    for i in range(period, len(values)):
+        avg_gain = (avg_gain * (period - 1) + gains[i - 1]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[i - 1]) / period
+        ret[i] = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return ret
+
+
+def _by_period(
+        indicator: Callable[[np.ndarray, int], np.ndarray], values: np.ndarray, periods: np.ndarray
+) -> np.ndarray:
+    # Calculate the indicator once for every distinct period, and expand it to one row per parameter set.
+    unique_periods, indices = np.unique(periods.astype(np.int64), return_inverse=True)
+    return np.stack([indicator(values, int(period)) for period in unique_periods])[indices]
+
+
+def _ready(*arrays: np.ndarray) -> np.ndarray:
+    ret = np.ones(np.broadcast_shapes(*[array.shape for array in arrays]), dtype=bool)
+    for array in arrays:
+        ret &= ~np.isnan(array)
+    return ret
+
+
+def _previous_ready(values: np.ndarray) -> np.ndarray:
+    # True where the previous value is available. Strategies wait for that before generating signals.
+    ret = np.zeros(values.shape, dtype=bool)
+    ret[..., 1:] = ~np.isnan(values[..., :-1])
+    return ret
+
+
+def _combine(long: np.ndarray, neutral: np.ndarray) -> np.ndarray:
+    return np.where(long, LONG, np.where(neutral, NEUTRAL, NO_SIGNAL)).astype(np.int8)
+
+
+def aspis_1_signals(dataset: datasets.Dataset, params: Dict[str, np.ndarray]) -> np.ndarray:
+    """Signals for samples.strategies.aspis_1. RSI(7) and SMA(80) are shared by all parameter sets."""
+    close = dataset.close
+    rsi_values = rsi(close, 7)[np.newaxis, :]
+    sma_values = sma(close, 80)[np.newaxis, :]
+    oversold = params["oversold_level"][:, np.newaxis]
+    overbought = params["overbought_level"][:, np.newaxis]
+
+    below_oversold = rsi_values < oversold
+    ready = _previous_ready(rsi_values)
+    # The strategy fails to compare against the SMA until it is ready, and no signal is generated in that case.
+    failed = below_oversold & ~_ready(sma_values)
+    long = ready & below_oversold & ~failed & (close > sma_values * 1.01)
+    neutral = ready & ~long & ~failed & (rsi_values > overbought)
+    return _combine(long, neutral)
+
+
+def aspis_2_signals(dataset: datasets.Dataset, params: Dict[str, np.ndarray]) -> np.ndarray:
+    """Signals for samples.strategies.aspis_2, with RSI(7)."""
+    close = dataset.close
+    rsi_values = rsi(close, 7)[np.newaxis, :]
+    sma_short = _by_period(sma, close, params["ma_short"])
+    sma_long = _by_period(sma, close, params["ma_long"])
+    threshold = params["rsi_threshold"].astype(np.int64)[:, np.newaxis]
+
+    ready = _previous_ready(rsi_values) & _ready(sma_short, sma_long)
+    long = ready & (rsi_values < threshold) & (sma_short > sma_long)
+    neutral = ready & (rsi_values > threshold) & (sma_short < sma_long)
+    return _combine(long, neutral)
+
+
+def aspis_3_signals(dataset: datasets.Dataset, params: Dict[str, np.ndarray]) -> np.ndarray:
+    """Signals for samples.strategies.aspis_3."""
+    close = dataset.close
+    sma_short = _by_period(sma, close, params["ma_short"])
+    sma_long = _by_period(sma, close, params["ma_long"])
+    bb_center = _by_period(sma, close, params["bb_period"])
+    bb_lower = bb_center - params["bb_std_dev"][:, np.newaxis] * _by_period(stddev, close, params["bb_period"])
+
+    ready = _previous_ready(bb_lower) & _ready(sma_short, sma_long)
+    long = ready & (close < bb_lower) & (sma_short > sma_long)
+    neutral = ready & (sma_short < sma_long)
+    return _combine(long, neutral)
+
+
+#: The signal functions, by strategy name, and the parameters they require.
+STRATEGIES: Dict[str, Tuple[SignalsFunction, Tuple[str, ...]]] = {
+    "aspis_1": (aspis_1_signals, ("oversold_level", "overbought_level")),
+    "aspis_2": (aspis_2_signals, ("rsi_threshold", "ma_short", "ma_long")),
+    "aspis_3": (aspis_3_signals, ("ma_short", "ma_long", "bb_period", "bb_std_dev")),
+}
+
+
+def simulate(
+        dataset: datasets.Dataset, signals: np.ndarray, initial_capital: np.ndarray, sizing: np.ndarray,
+        stop_loss: np.ndarray, fee_pct: float = 0.05
+) -> Dict[str, np.ndarray]:
+    """Simulates a long/flat position for many parameter sets at once.
+
+    Signals generated on a bar are executed at the open of the next bar, buying sizing worth of the base symbol or
+    selling all of it. Positions are also closed once the loss, based on the closing price, reaches stop_loss percent.
+    Metrics are calculated from the portfolio value at the close of every bar, like the position manager does.
+
+    :param dataset: The bars.
+    :param signals: The signals, with one row per parameter set and one column per bar.
+    :param initial_capital: The initial capital for each parameter set.
+    :param sizing: The position size, in quote units, for each parameter set.
+    :param stop_loss: The stop loss percentage for each parameter set.
+    :param fee_pct: The percentage charged on every trade.
+    :returns: A dictionary with the profit, sharpe and max_drawdown arrays, with one value per parameter set.
+    """
+    count, bars = signals.shape
+    assert bars == len(dataset), "Signals don't match the bars"
+    fee = fee_pct / 100
+
+    cash = initial_capital.astype(np.float64).copy()
+    units = np.zeros(count)
+    entry_price = np.zeros(count)
+    pending = np.full(count, NO_SIGNAL, dtype=np.int8)
+    pending_units = np.zeros(count)
+
+    # Running statistics. Equity values are not kept.
+    prev_equity = cash.copy()
+    peak = cash.copy()
+    max_drawdown = np.zeros(count)
+    returns_sum = np.zeros(count)
+    returns_sq_sum = np.zeros(count)
+
+    for i in range(bars):
+        open_price = dataset.open[i]
+        close_price = dataset.close[i]
+
+        # Fill the orders that were placed on the previous bar.
+        buys = pending == LONG
+        sells = pending == NEUTRAL
+        cash[buys] -= pending_units[buys] * open_price * (1 + fee)
+        units[buys] = pending_units[buys]
+        entry_price[buys] = open_price
+        cash[sells] += units[sells] * open_price * (1 - fee)
+        units[sells] = 0
+        pending[:] = NO_SIGNAL
+
+        equity = cash + units * close_price
+        if i > 0:
+            returns = equity / prev_equity - 1
+            returns_sum += returns
+            returns_sq_sum += returns * returns
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_drawdown, (peak - equity) / peak, out=max_drawdown)
+        prev_equity = equity
+
+        in_position = units > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stopped = in_position & ((close_price - entry_price) / entry_price * 100 <= -stop_loss)
+        signal = signals[:, i]
+        buy = ~in_position & (signal == LONG)
+        pending[buy] = LONG
+        pending_units[buy] = sizing[buy] / close_price
+        pending[in_position & ((signal == NEUTRAL) | stopped)] = NEUTRAL
+
+    # Same formulas as samples.backtesting.position_manager.History.
+    samples = bars - 1
+    profit = (prev_equity / initial_capital - 1) * 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = returns_sum / max(samples, 1)
+        std = np.sqrt(np.maximum(returns_sq_sum / max(samples, 1) - mean * mean, 0))
+        sharpe = np.where(samples >= 2, mean * 252 / (std * math.sqrt(252)), 0.0)
+    return {"profit": profit, "sharpe": sharpe, "max_drawdown": max_drawdown}
+
+
+def evaluate(
+        strategy: str, dataset: datasets.Dataset, parameter_sets: Sequence[Dict[str, Any]], chunk_size: int = 1000,
+        fee_pct: float = 0.05
+) -> List[Dict[str, float]]:
+    """Evaluates parameter sets that share a dataset, approximately.
+
+    :param strategy: The strategy name. One of the keys in :data:`STRATEGIES`.
+    :param dataset: The bars.
+    :param parameter_sets: The parameter sets. Besides the strategy parameters they should include initial_capital,
+        sizing and stop_loss.
+    :param chunk_size: The number of parameter sets to simulate together. Memory usage is proportional to
+        chunk_size * bars.
+    :param fee_pct: The percentage charged on every trade.
+    :returns: The metrics for each parameter set.
+    """
+    signals_fun, param_names = STRATEGIES[strategy]
+    param_names = param_names + ("initial_capital", "sizing", "stop_loss")
+
+    ret: List[Dict[str, float]] = []
+    for begin in range(0, len(parameter_sets), chunk_size):
+        chunk = parameter_sets[begin:begin + chunk_size]
+        params = {name: np.array([float(p[name]) for p in chunk]) for name in param_names}
+        metrics = simulate(
+            dataset, signals_fun(dataset, params), params["initial_capital"], params["sizing"], params["stop_loss"],
+            fee_pct=fee_pct
+        )
+        ret.extend(
+            {name: float(metrics[name][i]) for name in batches.METRICS} for i in range(len(chunk))
+        )
+    return ret
+
+
+def prescreen(
+        strategy: str, parameter_sets: Sequence[Dict[str, Any]], get_dataset: Callable[[str], datasets.Dataset],
+        top: int, metric: str = "sharpe"
+) -> List[Dict[str, Any]]:
+    """Keeps the top parameter sets of each (symbol, filename) group, based on an approximate evaluation.
+
+    :param strategy: The strategy name. One of the keys in :data:`STRATEGIES`.
+    :param parameter_sets: The parameter sets.
+    :param get_dataset: A function that returns the dataset for a filename.
+    :param top: The number of parameter sets to keep for each group.
+    :param metric: The metric used to rank parameter sets. Higher is better, and NaNs rank last.
+    :returns: The selected parameter sets, in their original order.
+    """
+    assert top > 0, "Invalid top"
+
+    selected: Set[int] = set()
+    for group in batches.split(parameter_sets, max(1, len(parameter_sets))):
+        results = evaluate(strategy, get_dataset(group[0]["filename"]), group)
+        scores = [-math.inf if math.isnan(result[metric]) else result[metric] for result in results]
+        ranked = sorted(range(len(group)), key=lambda i: (-scores[i], i))
+        selected.update(id(group[i]) for i in ranked[:top])
+    return [params for params in parameter_sets if id(params) in selected]
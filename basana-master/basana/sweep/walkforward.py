@@ -0,0 +1,164 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import dataclasses
+import logging
+
+from basana.core.logs import StructuredMessage
+from basana.sweep import halving
+
+
+logger = logging.getLogger(__name__)
+
+#: Evaluates groups of parameter sets, each one on a (start, stop, parameter sets) window of bars, and returns the
+#: results for each group in the same order.
+EvaluateFunction = Callable[
+    [List[Tuple[int, int, List[Dict[str, Any]]]]], Sequence[Sequence[Optional[Dict[str, Any]]]]
+]
+
+
+@dataclasses.dataclass(frozen=True)
+class Window:
+    """An in-sample range of bars, used to pick parameters, followed by an out-of-sample one, used to test them."""
+
+    #: The index of the first in-sample bar.
+    in_sample_start: int
+    #: The index of the first out-of-sample bar, which is also where the in-sample bars stop.
+    out_of_sample_start: int
+    #: The index of the bar where out-of-sample bars stop.
+    out_of_sample_stop: int
+
+
+@dataclasses.dataclass
+class WindowResult:
+    """The outcome of a walk-forward window for a group of parameter sets."""
+
+    #: The values for the parameters used to group parameter sets.
+    group: Tuple[Any, ...]
+    window: Window
+    #: The parameter set with the best in-sample result, or None if there were no in-sample results.
+    params: Optional[Dict[str, Any]]
+    in_sample_result: Optional[Dict[str, Any]]
+    out_of_sample_result: Optional[Dict[str, Any]]
+
+
+def windows(
+        length: int, in_sample: int, out_of_sample: int, step: Optional[int] = None, anchored: bool = False
+) -> List[Window]:
+    """Splits a number of bars into rolling windows.
+
+    :param length: The number of bars.
+    :param in_sample: The number of in-sample bars.
+    :param out_of_sample: The number of out-of-sample bars.
+    :param step: How many bars windows move forward. Defaults to out_of_sample, so out-of-sample ranges are adjacent.
+    :param anchored: True if in-sample ranges should always start at the first bar, and grow.
+    """
+    assert in_sample > 0, "Invalid in-sample size"
+    assert out_of_sample > 0, "Invalid out-of-sample size"
+    step = step or out_of_sample
+    assert step > 0, "Invalid step"
+
+    ret = []
+    start = 0
+    while start + in_sample < length:
+        out_of_sample_start = start + in_sample
+        ret.append(Window(
+            0 if anchored else start, out_of_sample_start, min(out_of_sample_start + out_of_sample, length)
+        ))
+        start += step
+    return ret
+
+
+def walk_forward(
+        parameter_sets: Sequence[Dict[str, Any]], evaluate: EvaluateFunction, get_length: Callable[[str], int],
+        in_sample: int, out_of_sample: int, step: Optional[int] = None, anchored: bool = False,
+        metric: str = "sharpe", group_by: Sequence[str] = ("symbol", "filename")
+) -> List[WindowResult]:
+    """Runs a walk-forward optimization.
+
+    The bars for each dataset are split into windows. The parameter set with the best in-sample result is picked for
+    each window, and it is evaluated on the out-of-sample bars that follow. The in-sample grids for every group and
+    window are evaluated together, and so are the out-of-sample runs, so they can run in parallel.
+
+    :param parameter_sets: The candidate parameter sets.
+    :param evaluate: The function used to evaluate parameter sets on windows of bars.
+    :param get_length: A function that returns the number of bars for a filename.
+    :param in_sample: The number of in-sample bars.
+    :param out_of_sample: The number of out-of-sample bars.
+    :param step: How many bars windows move forward. Defaults to out_of_sample.
+    :param anchored: True if in-sample ranges should always start at the first bar.
+    :param metric: The metric used to pick the best in-sample candidate. Higher is better.
+    :param group_by: Parameters that identify a dataset. Candidates are picked within each group. The filename should
+        be one of them.
+    :returns: The result for every group and window, in window order.
+    """
+    groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+    for params in parameter_sets:
+        groups.setdefault(tuple(params.get(key) for key in group_by), []).append(params)
+
+    ret: List[WindowResult] = []
+    in_sample_requests = []
+    for group, candidates in groups.items():
+        for window in windows(get_length(candidates[0]["filename"]), in_sample, out_of_sample, step, anchored):
+            ret.append(WindowResult(group, window, None, None, None))
+            in_sample_requests.append((window.in_sample_start, window.out_of_sample_start, candidates))
+
+    logger.info(StructuredMessage(
+        "Evaluating in-sample windows", windows=len(in_sample_requests),
+        backtests=sum(len(candidates) for _, _, candidates in in_sample_requests)
+    ))
+    in_sample_results = evaluate(in_sample_requests)
+    assert len(in_sample_results) == len(in_sample_requests), "Results don't match the windows"
+
+    out_of_sample_requests = []
+    selected = []
+    for window_result, (_, _, candidates), results in zip(ret, in_sample_requests, in_sample_results):
+        # Keep only the best candidate.
+        best = halving.select_top(candidates, results, len(candidates), metric, ())
+        if best:
+            window_result.params = best[0]
+            window_result.in_sample_result = results[[id(params) for params in candidates].index(id(best[0]))]
+            window = window_result.window
+            out_of_sample_requests.append((window.out_of_sample_start, window.out_of_sample_stop, best))
+            selected.append(window_result)
+
+    logger.info(StructuredMessage("Evaluating out-of-sample windows", windows=len(out_of_sample_requests)))
+    out_of_sample_results = evaluate(out_of_sample_requests)
+    assert len(out_of_sample_results) == len(out_of_sample_requests), "Results don't match the windows"
+    for window_result, results in zip(selected, out_of_sample_results):
+        window_result.out_of_sample_result = results[0]
+    return ret
+
+
+def stitch(window_results: Sequence[WindowResult], initial_equity: float = 1) -> Dict[Tuple[Any, ...], List[float]]:
+    """Stitches the out-of-sample results for each group into a single equity curve.
+
+    Each out-of-sample window starts with the same capital, so their profits get compounded. Windows without a result
+    count as flat.
+
+    :param window_results: The results from :func:`walk_forward`.
+    :param initial_equity: The initial equity.
+    :returns: The equity at the start of the first window, and at the end of every window, for each group.
+    """
+    ret: Dict[Tuple[Any, ...], List[float]] = {}
+    for window_result in window_results:
+        equity = ret.setdefault(window_result.group, [initial_equity])
+        profit = 0.0
+        if window_result.out_of_sample_result is not None:
+            profit = float(window_result.out_of_sample_result["profit"])
+        equity.append(equity[-1] * (1 + profit / 100))
+    return ret
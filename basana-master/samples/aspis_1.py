@@ -2,8 +2,8 @@ from decimal import Decimal
 import asyncio
 import logging
 
-from basana.backtesting import charts
 from basana.external.bitstamp import csv
+from basana.sweep import datasets, indicators, recording
 import basana as bs
 import basana.backtesting.exchange as backtesting_exchange
 
@@ -12,7 +12,7 @@ from samples.strategies import aspis_1 as rsi
 
 import os
 
-async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing, filename, oversold_level, overbought_level):
+async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing, filename, oversold_level, overbought_level, dataset=None, chart_path=None):
     '''returns
     name, symbol, stop_loss, timeframe, sizing, filename, parameter_list
     profit, sharpe, max_drawdown'''
@@ -28,7 +28,11 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
     exchange.set_symbol_precision(pair.quote_symbol, 2)
 
     # Connect the strategy to the bar events from the exchange.
-    strategy = rsi.Strategy(event_dispatcher, 7, oversold_level, overbought_level)
+    # Indicators that were precalculated for the shared dataset are used, if available.
+    precalculated = {} if dataset is None else {
+        'rsi': indicators.attach(dataset, 'rsi', 7), 'sma': indicators.attach(dataset, 'sma', 80)
+    }
+    strategy = rsi.Strategy(event_dispatcher, 7, oversold_level, overbought_level, **precalculated)
     exchange.subscribe_to_bar_events(pair, strategy.on_bar_event)
 
     # Connect the position manager to the strategy signals and to bar events. Borrowing is disabled in this example.
@@ -39,20 +43,17 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
     strategy.subscribe_to_trading_signals(position_mgr.on_trading_signal)
     exchange.subscribe_to_bar_events(pair, position_mgr.on_bar_event)
 
-    path = 'data' + os.sep + filename
-    # Load bars from the CSV file.
-    exchange.add_bar_source(csv.BarSource(pair, path, "1d"))
+    if dataset is None:
+        path = 'data' + os.sep + filename
+        # Load bars from the CSV file.
+        exchange.add_bar_source(csv.BarSource(pair, path, "1d"))
+    else:
+        # Load bars from a dataset that was already loaded into shared memory.
+        exchange.add_bar_source(datasets.BarSource(pair, datasets.attach(dataset), "1d"))
 
-    # Setup chart.
-    
-    chart = charts.LineCharts(exchange)
-    chart.add_pair(pair)
-    chart.add_portfolio_value(pair.quote_symbol)
-    #chart.add_custom("RSI", "RSI", charts.DataPointFromSequence(strategy.rsi))
-    #chart.add_custom("SMA", "SMA", charts.DataPointFromSequence(strategy.sma))
-    #chart.add_custom("RSI", "Overbought", lambda _: overbought_level)
-    #chart.add_custom("RSI", "Oversold", lambda _: oversold_level)
-    
+    # Charts are only recorded when asked for, since that slows the backtest down. Sweeps use this to chart the best
+    # results once they're done.
+    recorder = None if chart_path is None else recording.Recorder(exchange, pair)
 
     # Run the backtest.
     await event_dispatcher.run()
@@ -64,7 +65,8 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
 
     profit, sharpe, mdd = position_mgr.history.run()
     
-    chart.show()
+    if recorder is not None:
+        recorder.save(chart_path)
 
     result = {
         'name': name, 
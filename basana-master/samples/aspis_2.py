@@ -2,8 +2,8 @@ from decimal import Decimal
 import asyncio
 import logging
 
-from basana.backtesting import charts
 from basana.external.bitstamp import csv
+from basana.sweep import datasets, indicators, recording
 import basana as bs
 import basana.backtesting.exchange as backtesting_exchange
 
@@ -12,7 +12,7 @@ from samples.strategies import aspis_2 as rsi
 
 import os
 
-async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing, filename, rsi_threshold, ma_short, ma_long):
+async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing, filename, rsi_threshold, ma_short, ma_long, dataset=None, chart_path=None):
     logging.basicConfig(level=logging.INFO, format="[%(asctime)s %(levelname)s] %(message)s")
 
     event_dispatcher = bs.backtesting_dispatcher()
@@ -27,7 +27,13 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
     rsi_period = 7
 
     # Connect the strategy to the bar events from the exchange.
-    strategy = rsi.Strategy(event_dispatcher, rsi_period, ma_short, ma_long, rsi_threshold)
+    # Indicators that were precalculated for the shared dataset are used, if available.
+    precalculated = {} if dataset is None else {
+        'rsi': indicators.attach(dataset, 'rsi', rsi_period),
+        'sma_short': indicators.attach(dataset, 'sma', int(ma_short)),
+        'sma_long': indicators.attach(dataset, 'sma', int(ma_long)),
+    }
+    strategy = rsi.Strategy(event_dispatcher, rsi_period, ma_short, ma_long, rsi_threshold, **precalculated)
     exchange.subscribe_to_bar_events(pair, strategy.on_bar_event)
 
     # Connect the position manager to the strategy signals and to bar events. Borrowing is disabled in this example.
@@ -38,20 +44,17 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
     strategy.subscribe_to_trading_signals(position_mgr.on_trading_signal)
     exchange.subscribe_to_bar_events(pair, position_mgr.on_bar_event)
 
-    path = 'data' + os.sep + filename
-    # Load bars from the CSV file.
-    exchange.add_bar_source(csv.BarSource(pair, path, "1d"))
+    if dataset is None:
+        path = 'data' + os.sep + filename
+        # Load bars from the CSV file.
+        exchange.add_bar_source(csv.BarSource(pair, path, "1d"))
+    else:
+        # Load bars from a dataset that was already loaded into shared memory.
+        exchange.add_bar_source(datasets.BarSource(pair, datasets.attach(dataset), "1d"))
 
-    # Setup chart.
-    
-    chart = charts.LineCharts(exchange)
-    chart.add_pair(pair)
-    chart.add_portfolio_value(pair.quote_symbol)
-    #chart.add_custom("RSI", "RSI", charts.DataPointFromSequence(strategy.rsi))
-    #chart.add_custom("SMA", "SMA", charts.DataPointFromSequence(strategy.sma))
-    #chart.add_custom("RSI", "Overbought", lambda _: overbought_level)
-    #chart.add_custom("RSI", "Oversold", lambda _: oversold_level)
-    
+    # Charts are only recorded when asked for, since that slows the backtest down. Sweeps use this to chart the best
+    # results once they're done.
+    recorder = None if chart_path is None else recording.Recorder(exchange, pair)
 
     # Run the backtest.
     await event_dispatcher.run()
@@ -63,7 +66,8 @@ async def backtest(name, symbol, stop_loss, timeframe, initial_capital, sizing,
 
     profit, sharpe, mdd = position_mgr.history.run()
     
-    chart.show()
+    if recorder is not None:
+        recorder.save(chart_path)
 
     result = {
         'name': name, 
@@ -1,15 +1,21 @@
+from typing import Any, Optional
+
 from talipp.indicators import RSI, SMA
 
 import basana as bs
 
 
 class Strategy(bs.TradingSignalSource):
-    def __init__(self, dispatcher: bs.EventDispatcher, period: int, oversold_level: float, overbought_level: float):
+    def __init__(
+            self, dispatcher: bs.EventDispatcher, period: int, oversold_level: float, overbought_level: float,
+            rsi: Optional[Any] = None, sma: Optional[Any] = None
+    ):
         super().__init__(dispatcher)
         self._oversold_level = oversold_level
         self._overbought_level = overbought_level
-        self.rsi = RSI(period=period)
-        self.sma = SMA(period=80)
+        # Precalculated indicators can be supplied instead of calculating them here.
+        self.rsi = RSI(period=period) if rsi is None else rsi
+        self.sma = SMA(period=80) if sma is None else sma
 
     async def on_bar_event(self, bar_event: bs.BarEvent):
         # Feed the technical indicator.
@@ -1,3 +1,5 @@
+from typing import Any, Optional
+
 from talipp.indicators import RSI, SMA
 
 import basana as bs
@@ -12,11 +14,13 @@ class Strategy(bs.TradingSignalSource):
     ma_short < ma_long
     and
     rsi > 30'''
-    def __init__(self, dispatcher: bs.EventDispatcher, rsi_period: int, ma_short: float, ma_long: float, rsi_threshold: int):
+    def __init__(self, dispatcher: bs.EventDispatcher, rsi_period: int, ma_short: float, ma_long: float, rsi_threshold: int,
+                 rsi: Optional[Any] = None, sma_short: Optional[Any] = None, sma_long: Optional[Any] = None):
         super().__init__(dispatcher)
-        self.rsi = RSI(period=int(rsi_period)) #rsi period 7
-        self.sma_short = SMA(period=int(ma_short))
-        self.sma_long = SMA(period=int(ma_long))
+        # Precalculated indicators can be supplied instead of calculating them here.
+        self.rsi = RSI(period=int(rsi_period)) if rsi is None else rsi #rsi period 7
+        self.sma_short = SMA(period=int(ma_short)) if sma_short is None else sma_short
+        self.sma_long = SMA(period=int(ma_long)) if sma_long is None else sma_long
         self.rsi_threshold = int(rsi_threshold)
 
     async def on_bar_event(self, bar_event: bs.BarEvent):
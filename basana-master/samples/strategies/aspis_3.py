@@ -1,3 +1,5 @@
+from typing import Any, Optional
+
 from talipp.indicators import SMA, BB
 
 import basana as bs
@@ -11,10 +13,12 @@ class Strategy(bs.TradingSignalSource):
     sell
     ma_short < ma_long
     '''
-    def __init__(self, dispatcher: bs.EventDispatcher, ma_short: float, ma_long: float, bb_period: int, bb_std_dev: float):
+    def __init__(self, dispatcher: bs.EventDispatcher, ma_short: float, ma_long: float, bb_period: int, bb_std_dev: float,
+                 sma_short: Optional[Any] = None, sma_long: Optional[Any] = None):
         super().__init__(dispatcher)
-        self.sma_short = SMA(period=int(ma_short))
-        self.sma_long = SMA(period=int(ma_long))
+        # Precalculated indicators can be supplied instead of calculating them here.
+        self.sma_short = SMA(period=int(ma_short)) if sma_short is None else sma_short
+        self.sma_long = SMA(period=int(ma_long)) if sma_long is None else sma_long
         self.bb = BB(period=int(bb_period), std_dev_mult=float(bb_std_dev))
 
     async def on_bar_event(self, bar_event: bs.BarEvent):
@@ -17,3 +17,4 @@
 from tests.fixtures.binance import *  # noqa: F401,F403
 from tests.fixtures.bitstamp import *  # noqa: F401,F403
 from tests.fixtures.dispatcher import *  # noqa: F401,F403
+from tests.fixtures.sweep import *  # noqa: F401,F403
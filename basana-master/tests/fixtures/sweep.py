@@ -0,0 +1,28 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import shutil
+
+import pytest
+
+from tests.helpers import abs_data_path
+
+
+@pytest.fixture()
+def csv_path(tmp_path):
+    # A copy of the minute bars, so that files derived from it are not written next to the test data.
+    ret = str(tmp_path / "bitstamp_btcusd_min_2020_01_01.csv")
+    shutil.copy(abs_data_path("bitstamp_btcusd_min_2020_01_01.csv"), ret)
+    return ret
@@ -73,3 +73,16 @@ def test_save_line_chart(order_plan, backtesting_dispatcher, caplog):
             assert os.stat(tmp_file_name).st_size > 100
 
     asyncio.run(impl())
+
+
+def test_save_series_chart(backtesting_dispatcher):
+    e = exchange.Exchange(backtesting_dispatcher, {"USD": Decimal("1e6")})
+    line_charts = charts.LineCharts(e)
+    when = [datetime.datetime(2000, 1, day, tzinfo=datetime.timezone.utc) for day in range(1, 11)]
+    line_charts.add_series("ORCL", "ORCL", when, [float(day) for day in range(10)])
+    line_charts.add_series("ORCL", "Buy", when[2:3], [2.0], markers=True)
+    line_charts.add_series("Portfolio", "Portfolio", when, [1e6] * 10)
+
+    with helpers.temp_file_name(suffix=".png") as tmp_file_name:
+        line_charts.save(tmp_file_name)
+        assert os.stat(tmp_file_name).st_size > 100
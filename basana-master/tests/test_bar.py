@@ -17,9 +17,25 @@
 from decimal import Decimal
 import datetime
 
+import pytest
+
 from basana.core import bar, pair
 
 
+def test_invalid_bar():
+    when = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+    with pytest.raises(bar.InvalidBar, match="high < low"):
+        bar.Bar(when, pair.Pair("BTC", "USD"), Decimal(10), Decimal(9), Decimal(10), Decimal(10), Decimal(1))
+
+    # Validation is skipped.
+    b = bar.Bar.unchecked(when, pair.Pair("BTC", "USD"), Decimal(10), Decimal(9), Decimal(10), Decimal(10), Decimal(1))
+    assert b.high == Decimal(9)
+    assert b.low == Decimal(10)
+    # Bars don't have a __dict__.
+    with pytest.raises(AttributeError):
+        b.extra = 1
+
+
 def test_trades_to_bar_empty():
     trade_to_bar = bar.RealTimeTradesToBar(pair.Pair("BTC", "USD"), 5)
 
@@ -0,0 +1,236 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import os
+import zipfile
+
+from basana.core.event_sources import manifest
+from basana.core.pair import Pair
+from basana.external.binance import csv
+from basana.external.binance.tools import ingest_klines
+from basana.sweep import datasets
+
+
+HOUR = 3600
+
+
+def timestamp(month, day=1, hour=0):
+    return int(datetime.datetime(2023, month, day, hour, tzinfo=datetime.timezone.utc).timestamp())
+
+
+def kline(ts, price=100, volume="1.5", unit=1000):
+    # The same columns as in the archives.
+    return [
+        str(ts * unit), str(price), str(price + 2), str(price - 1), str(price + 1), volume, str((ts + HOUR) * unit - 1),
+        "150.0", "10", "0.5", "50.0", "0"
+    ]
+
+
+def write_archive(input_dir, symbol, interval, month, klines, header=False):
+    path = os.path.join(input_dir, symbol, interval, f"{symbol}-{interval}-2023-{month:02}.zip")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = [",".join(values) for values in klines]
+    if header:
+        lines.insert(0, "open_time,open,high,low,close,volume,close_time,quote_volume,count,x,y,ignore")
+    with zipfile.ZipFile(path, "w") as zip_file:
+        zip_file.writestr(os.path.basename(path).replace(".zip", ".csv"), "\n".join(lines) + "\n")
+    return path
+
+
+def hourly(month, days=1):
+    return [kline(ts) for ts in range(timestamp(month), timestamp(month) + days * 24 * HOUR, HOUR)]
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_initial_and_incremental_runs(tmp_path, capsys):
+    input_dir = os.path.join(tmp_path, "klines")
+    output_dir = os.path.join(tmp_path, "data")
+    write_archive(input_dir, "BTCUSDT", "1h", 1, hourly(1))
+    write_archive(input_dir, "ETHUSDT", "1h", 1, hourly(1), header=True)
+
+    ingest_klines.main(["-i", input_dir, "-o", output_dir, "-w", "2"])
+    output = capsys.readouterr().out
+    assert "BTCUSDT1H.csv: rebuilt with 24 rows from 1 months (2023-01 to 2023-01)" in output
+    assert "ETHUSDT1H.csv: rebuilt with 24 rows" in output
+
+    path = os.path.join(output_dir, "BTCUSDT1H.csv")
+    lines = read_lines(path)
+    assert lines[0] == "datetime,open,high,low,close,volume"
+    assert lines[1] == "2023-01-01 00:00:00,100,102,99,101,1.5"
+    assert len(lines) == 25
+
+    # Nothing to do.
+    ingest_klines.main(["-i", input_dir, "-o", output_dir])
+    assert f"{path}: up to date" in capsys.readouterr().out
+
+    # A new month gets appended, and the gap between the months is reported.
+    write_archive(input_dir, "BTCUSDT", "1h", 2, hourly(2))
+    reports = ingest_klines.ingest(input_dir, output_dir, max_workers=1)
+    report = {(report.symbol, report.interval): report for report in reports}[("BTCUSDT", "1h")]
+    assert not report.rebuilt
+    assert report.months == ["2023-02"]
+    assert report.rows == 24
+    assert report.gaps == [(timestamp(1, 2), timestamp(2))]
+    lines = read_lines(path)
+    assert len(lines) == 49
+    assert lines[25] == "2023-02-01 00:00:00,100,102,99,101,1.5"
+
+    file_manifest = manifest.load(path)
+    assert file_manifest.rows == 48
+    assert file_manifest.sorted
+    assert file_manifest.gaps == 1
+
+    # The output can be read as any other file with Binance bars.
+    dataset = datasets.load_file(path)
+    assert len(dataset) == 48
+    source = csv.BarSource(Pair("BTC", "USDT"), path, "1h")
+    assert source is not None
+
+
+def test_duplicates_and_invalid_rows(tmp_path):
+    input_dir = os.path.join(tmp_path, "klines")
+    klines = hourly(1)
+    klines.insert(5, kline(timestamp(1, hour=4), price=200))  # Duplicate.
+    klines.append(kline(timestamp(1, 1, 23) + 60))  # Not aligned to the hour.
+    bad_ohlc = kline(timestamp(1, 2))
+    bad_ohlc[2] = "10"  # High below the low.
+    klines.append(bad_ohlc)
+    klines.append(kline(timestamp(1, 2, 1), volume="-1"))
+    klines.append(kline(timestamp(1, 2, 2), volume="nan"))
+    # Microsecond timestamps, like in recent archives.
+    klines.append(kline(timestamp(1, 2, 3), unit=1000000))
+    write_archive(input_dir, "BTCUSDT", "1h", 1, list(reversed(klines)) + [["garbage"]])
+
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert report.invalid == 5
+    assert report.duplicates == 1
+    assert report.rows == 25
+    assert report.gaps == [(timestamp(1, 2), timestamp(1, 2, 3))]
+
+    lines = read_lines(report.path)
+    assert lines[-1] == "2023-01-02 03:00:00,100,102,99,101,1.5"
+    assert lines[1:] == sorted(lines[1:])
+
+
+def test_parse_archive(tmp_path):
+    klines = hourly(1)[:3] + [
+        [], ["garbage"], kline(timestamp(1, hour=3) + 60), kline(timestamp(1, hour=4), volume="inf"),
+        kline(timestamp(1, hour=5), volume="-1"),
+    ]
+    path = write_archive(tmp_path, "BTCUSDT", "1h", 1, klines, header=True)
+    # Files other than CSVs are ignored.
+    with zipfile.ZipFile(path, "a") as zip_file:
+        zip_file.writestr("README.txt", "garbage")
+
+    parsed = ingest_klines.parse_archive(ingest_klines.find_archives(tmp_path)[("BTCUSDT", "1h")][0])
+    assert parsed.invalid == 4
+    assert parsed.rows == [(timestamp(1, hour=hour), "100", "102", "99", "101", "1.5") for hour in range(3)]
+
+
+def test_many_gaps(tmp_path, capsys):
+    input_dir = os.path.join(tmp_path, "klines")
+    write_archive(input_dir, "BTCUSDT", "1h", 1, hourly(1)[::2])
+
+    ingest_klines.main(["-i", input_dir, "-o", str(tmp_path)])
+    output = capsys.readouterr().out
+    assert "11 gaps" in output
+    assert "  Missing bars from 2023-01-01 01:00:00 until 2023-01-01 02:00:00" in output
+    assert output.count("Missing bars") == 5
+    assert "... and 6 more gaps" in output
+
+
+def test_backfilled_month_rebuilds(tmp_path):
+    input_dir = os.path.join(tmp_path, "klines")
+    write_archive(input_dir, "BTCUSDT", "4h", 2, [kline(ts) for ts in range(timestamp(2), timestamp(3), 4 * HOUR)])
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert report.rows == 28 * 6
+
+    write_archive(input_dir, "BTCUSDT", "4h", 1, [kline(ts) for ts in range(timestamp(1), timestamp(2), 4 * HOUR)])
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert report.rebuilt
+    assert report.months == ["2023-01", "2023-02"]
+    assert report.rows == 59 * 6
+    assert report.gaps == []
+    assert len(read_lines(report.path)) == 59 * 6 + 1
+
+    with open(ingest_klines.state_path(report.path)) as f:
+        state = json.load(f)
+    assert sorted(state["archives"]) == ["BTCUSDT-4h-2023-01.zip", "BTCUSDT-4h-2023-02.zip"]
+    assert state["last_timestamp"] == timestamp(3) - 4 * HOUR
+
+
+def test_interrupted_append_is_discarded(tmp_path):
+    input_dir = os.path.join(tmp_path, "klines")
+    write_archive(input_dir, "BTCUSDT", "1h", 1, hourly(1))
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+
+    # Rows written by a run that didn't get to update the state.
+    with open(report.path, "a") as f:
+        f.write("2023-02-01 00:00:00,1,1,1,1,1\n")
+    write_archive(input_dir, "BTCUSDT", "1h", 2, hourly(2))
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert not report.rebuilt
+    lines = read_lines(report.path)
+    assert len(lines) == 49
+    assert lines[25] == "2023-02-01 00:00:00,100,102,99,101,1.5"
+
+    # Truncated files are rebuilt.
+    with open(report.path, "r+") as f:
+        f.truncate(100)
+    report, = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert report.rebuilt
+    assert len(read_lines(report.path)) == 49
+
+
+def test_more_jobs_than_workers(tmp_path):
+    input_dir = os.path.join(tmp_path, "klines")
+    symbols = ["ADAUSDT", "BTCUSDT", "ETHUSDT", "XRPUSDT"]
+    for symbol in symbols:
+        for month in (1, 2):
+            write_archive(input_dir, symbol, "1h", month, hourly(month))
+    # Nothing to do for the first symbol.
+    ingest_klines.ingest(input_dir, tmp_path, symbols=symbols[:1], max_workers=1)
+
+    reports = ingest_klines.ingest(input_dir, tmp_path, max_workers=1)
+    assert [(report.symbol, report.rows) for report in reports] == [
+        ("ADAUSDT", 0), ("BTCUSDT", 48), ("ETHUSDT", 48), ("XRPUSDT", 48)
+    ]
+    for report in reports:
+        assert len(read_lines(report.path)) == 49
+
+
+def test_filters(tmp_path, capsys):
+    input_dir = os.path.join(tmp_path, "klines")
+    write_archive(input_dir, "BTCUSDT", "1h", 1, hourly(1))
+    write_archive(input_dir, "BTCUSDT", "1d", 1, [kline(timestamp(1))])
+    write_archive(input_dir, "ETHUSDT", "1h", 1, hourly(1))
+    # Monthly klines are not supported.
+    write_archive(input_dir, "BTCUSDT", "1M", 1, [kline(timestamp(1))])
+
+    ingest_klines.main(["-i", input_dir, "-o", str(tmp_path), "-s", "BTCUSDT", "-t", "1d"])
+    assert os.path.exists(os.path.join(tmp_path, "BTCUSDT1D.csv"))
+    assert not os.path.exists(os.path.join(tmp_path, "BTCUSDT1H.csv"))
+    assert not os.path.exists(os.path.join(tmp_path, "ETHUSDT1H.csv"))
+    assert list(ingest_klines.find_archives(input_dir, intervals=["1M"])) == []
+
+    ingest_klines.main(["-i", os.path.join(tmp_path, "missing"), "-o", str(tmp_path)])
+    assert "No archives found" in capsys.readouterr().out
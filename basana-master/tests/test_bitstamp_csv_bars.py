@@ -18,11 +18,15 @@ from decimal import Decimal
 import asyncio
 import datetime
 
+from dateutil import tz
 import pytest
 
-from .helpers import abs_data_path
+from .helpers import abs_data_path, temp_file_name
+from basana.core import dispatcher
+from basana.core.event_sources import csv
 from basana.core.pair import Pair
 from basana.external.bitstamp.csv import bars as csv_bars
+from basana.external.common.csv import bars as common_bars
 
 
 @pytest.mark.parametrize("filename", [
@@ -108,3 +112,135 @@ def test_minute_bars_from_csv_using_deprecated_period_format(backtesting_dispatc
         assert bars[-1].open == Decimal("7178.68")
 
     asyncio.run(impl())
+
+
+@pytest.mark.parametrize("filename, tzinfo", [
+    ("bitstamp_btcusd_day_2015.csv", datetime.timezone.utc),
+    ("bitstamp_btcusd_day_2015.csv.utf16", datetime.timezone.utc),
+    ("bitstamp_btcusd_min_2020_01_01.csv", tz.gettz("America/New_York")),
+])
+def test_values_parser_matches_dict_parser(filename, tzinfo):
+    row_parser = common_bars.RowParser(Pair("BTC", "USD"), tzinfo, datetime.timedelta(days=1))
+    path = abs_data_path(filename)
+    # Passing arguments to the DictReader disables the fast path.
+    expected = list(csv.load_and_yield(path, row_parser, dict_reader_kwargs={"delimiter": ","}))
+    events = list(csv.load_and_yield(path, row_parser))
+
+    assert len(events) == len(expected)
+    for ev, expected_ev in zip(events, expected):
+        assert ev.when == expected_ev.when
+        assert ev.bar.datetime == expected_ev.bar.datetime
+        assert ev.bar.datetime.utcoffset() == expected_ev.bar.datetime.utcoffset()
+        assert ev.bar.pair == expected_ev.bar.pair
+        for field in ("open", "high", "low", "close", "volume"):
+            assert getattr(ev.bar, field) == getattr(expected_ev.bar, field)
+
+
+@pytest.mark.parametrize("values, error", [
+    (["2020-01-01 00:00:00", "1", "1", "1", "1"], "Expected 6 columns but got 5"),
+    (["2020-01-01T00:00:00", "1", "1", "1", "1", "1"], "does not match format"),
+    (["2020-01-01 00:00:00+00:00", "1", "1", "1", "1", "1"], "does not match format"),
+    (["2020-W01-1 00:00:00", "1", "1", "1", "1", "1"], "does not match format"),
+])
+@pytest.mark.parametrize("tzinfo", [datetime.timezone.utc, tz.gettz("America/New_York")])
+def test_values_parser_is_strict(values, error, tzinfo):
+    row_parser = common_bars.RowParser(Pair("BTC", "USD"), tzinfo, datetime.timedelta(days=1))
+    parse_values = row_parser.get_values_parser(common_bars.COLUMNS)
+    with pytest.raises(ValueError, match=error):
+        parse_values(values)
+    # The same rows are rejected by the dict parser.
+    if len(values) == len(common_bars.COLUMNS):
+        with pytest.raises(ValueError):
+            row_parser.parse_row(dict(zip(common_bars.COLUMNS, values)))
+
+
+def test_extra_columns_are_ignored(backtesting_dispatcher):
+    bars = []
+
+    async def on_bar(bar_event):
+        bars.append(bar_event.bar)
+
+    async def impl():
+        with temp_file_name(suffix=".csv") as csv_path:
+            with open(csv_path, "w") as f:
+                f.write(
+                    "datetime,open,high,low,close,volume,close_time,quote_asset_volume,number_of_trades,"
+                    "taker_buy_base_vol,taker_buy_quote_vol,ignore\n"
+                    "2020-01-01 00:00:00,7195.24,7196.25,7183.14,7186.68,51.642812,1577836859999,371233.65,493,"
+                    "19.24,138308.44,0\n"
+                    "2020-01-01 00:01:00,7187.67,7188.06,7182.20,7184.03,0,1577836919999,0,0,0,0,0\n"
+                    "\n"
+                    "2020-01-01 00:02:00,7184.41,7184.71,7180.26,7182.43,10.7,1577836979999,76808.4,161,5.4,38836.1,0\n"
+                )
+            src = csv_bars.BarSource(Pair("BTC", "USDT"), csv_path, "1m")
+            backtesting_dispatcher.subscribe(src, on_bar)
+            await backtesting_dispatcher.run()
+
+        assert len(bars) == 2
+        assert bars[0].datetime == datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        assert bars[0].open == Decimal("7195.24")
+        assert bars[0].volume == Decimal("51.642812")
+        assert bars[1].datetime == datetime.datetime(2020, 1, 1, 0, 2, tzinfo=datetime.timezone.utc)
+        assert bars[1].close == Decimal("7182.43")
+
+    asyncio.run(impl())
+
+
+def load_bar_events(src):
+    async def impl():
+        ret = []
+
+        async def on_bar(bar_event):
+            ret.append(bar_event)
+
+        backtesting_dispatcher = dispatcher.backtesting_dispatcher()
+        backtesting_dispatcher.subscribe(src, on_bar)
+        await backtesting_dispatcher.run()
+        return ret
+
+    return asyncio.run(impl())
+
+
+@pytest.mark.parametrize("filename, period", [
+    ("bitstamp_btcusd_min_2020_01_01.csv", "1m"),
+    ("bitstamp_btcusd_day_2015.csv", "1d"),
+    ("bitstamp_btcusd_day_2015.csv.utf16", "1d"),
+])
+@pytest.mark.parametrize("start, end", [
+    (datetime.datetime(2020, 1, 1, 3, 15), None),
+    (None, datetime.datetime(2020, 1, 1, 3, 15)),
+    (datetime.datetime(2020, 1, 1, 3, 15), datetime.datetime(2020, 1, 1, 9, 30)),
+    (datetime.datetime(2020, 1, 1, 23, 59), None),
+    (datetime.datetime(2015, 3, 1), datetime.datetime(2015, 3, 3)),
+    (datetime.datetime(2015, 7, 1), None),
+    (datetime.datetime(2014, 1, 1), datetime.datetime(2014, 1, 2)),
+    (datetime.datetime(2021, 1, 1), None),
+])
+@pytest.mark.parametrize("sort", [False, True])
+def test_date_range(filename, period, start, end, sort):
+    pair = Pair("BTC", "USD")
+    path = abs_data_path(filename)
+    all_events = load_bar_events(csv_bars.BarSource(pair, path, period))
+    utc = datetime.timezone.utc
+    expected = [
+        ev for ev in all_events
+        if (start is None or ev.bar.datetime >= start.replace(tzinfo=utc))
+        and (end is None or ev.bar.datetime < end.replace(tzinfo=utc))
+    ]
+    events = load_bar_events(csv_bars.BarSource(pair, path, period, sort=sort, start=start, end=end))
+    assert [ev.bar.datetime for ev in events] == [ev.bar.datetime for ev in expected]
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+
+
+def test_seek_skips_the_rows_before_start():
+    path = abs_data_path("bitstamp_btcusd_min_2020_01_01.csv")
+    row_parser = common_bars.RowParser(Pair("BTC", "USD"), datetime.timezone.utc, datetime.timedelta(minutes=1))
+    start = row_parser.event_datetime(datetime.datetime(2020, 1, 1, 12))
+    offset, _ = csv._find_start(path, row_parser, start)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        # The search stops at the row for the bar before the one that starts at 12:00, or at the one for that bar.
+        assert f.readline().startswith((b"2020-01-01 11:59:00,", b"2020-01-01 12:00:00,"))
+
+    # Seeking is not supported for files that can't be parsed using values.
+    assert csv._find_start(abs_data_path("bitstamp_btcusd_day_2015.csv.utf16"), row_parser, start) is None
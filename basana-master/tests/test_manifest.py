@@ -0,0 +1,291 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from .helpers import abs_data_path
+from .test_bitstamp_csv_bars import load_bar_events
+from basana.core import errors, event
+from basana.core.event_sources import csv, manifest
+from basana.core.pair import Pair
+from basana.external.bitstamp.csv import bars as csv_bars
+from basana.external.common.csv import bars as common_bars
+from basana.sweep import cache, scheduling
+
+
+@pytest.fixture()
+def tmp_dir():
+    with tempfile.TemporaryDirectory() as ret:
+        yield ret
+
+
+def copy_data_file(filename, dst_dir):
+    ret = os.path.join(dst_dir, filename)
+    shutil.copy(abs_data_path(filename), ret)
+    return ret
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def test_build(tmp_dir):
+    path = copy_data_file("bitstamp_btcusd_min_2020_01_01.csv", tmp_dir)
+    file_manifest = manifest.build(path, index_step=100)
+
+    with open(path, "rb") as f:
+        assert file_manifest.checksum == hashlib.sha256(f.read()).hexdigest()
+    assert file_manifest.size == os.path.getsize(path)
+    assert file_manifest.rows == 1440
+    begin = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    assert file_manifest.min_timestamp == begin
+    assert file_manifest.max_timestamp == begin + 1439 * 60
+    assert file_manifest.period == 60
+    assert file_manifest.sorted
+    assert file_manifest.gaps == 0
+    assert len(file_manifest.index) == 15
+    with open(path, "rb") as f:
+        for i, (timestamp, offset) in enumerate(file_manifest.index):
+            assert timestamp == begin + i * 100 * 60
+            f.seek(offset)
+            assert f.readline().startswith(f"2020-01-01 {i * 100 // 60:02}:{i * 100 % 60:02}:00,".encode())
+
+
+def test_unsorted_file_with_gaps(tmp_dir):
+    path = os.path.join(tmp_dir, "bars.csv")
+    write_lines(path, [
+        "datetime,open,high,low,close,volume",
+        "2021-01-01T01:00:00+01:00,1,1,1,1,1",
+        "",
+        "2021-01-01 01:00:00,1,1,1,1,1",
+        "2021-01-01 02:00:00,1,1,1,1,1",
+        "2021-01-01 05:00:00,1,1,1,1,1",
+        "2021-01-01 04:00:00,1,1,1,1,1",
+        "2021-01-01 05:00:00,1,1,1,1,1",
+    ])
+    file_manifest = manifest.build(path)
+    assert file_manifest.rows == 6
+    assert not file_manifest.sorted
+    assert file_manifest.period == 3600
+    assert file_manifest.gaps == 1
+    assert file_manifest.min_timestamp == datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    assert file_manifest.index == [(file_manifest.min_timestamp, 36)]
+
+
+def test_invalid_files(tmp_dir):
+    path = os.path.join(tmp_dir, "bars.csv")
+    write_lines(path, ["datetime,open,high,low,close,volume", "yesterday,1,1,1,1,1"])
+    with pytest.raises(errors.Error, match="Invalid datetime"):
+        manifest.build(path)
+    with pytest.raises(errors.Error, match="not UTF-8 encoded"):
+        manifest.build(abs_data_path("bitstamp_btcusd_day_2015.csv.utf16"))
+
+
+def test_get_and_load(tmp_dir):
+    path = copy_data_file("bitstamp_btcusd_day_2015.csv", tmp_dir)
+    assert manifest.load(path) is None
+
+    file_manifest = manifest.get(path)
+    assert os.path.exists(manifest.manifest_path(path))
+    assert manifest.load(path) == file_manifest
+    assert file_manifest.period == 86400
+    assert file_manifest.rows + file_manifest.gaps <= 365
+
+    # Changes to the file make the manifest out of date.
+    with open(path, "a") as f:
+        # Empty lines are skipped, so this works whether the file ends with a line terminator or not.
+        f.write("\n2016-01-01 00:00:00,430.89,430.89,430.89,430.89,1\n")
+    assert manifest.load(path) is None
+    assert manifest.get(path).rows == file_manifest.rows + 1
+
+
+def test_get_when_the_manifest_cant_be_saved(tmp_dir, monkeypatch):
+    def save(path, file_manifest):
+        raise PermissionError()
+
+    path = copy_data_file("bitstamp_btcusd_day_2015.csv", tmp_dir)
+    monkeypatch.setattr(manifest, "save", save)
+    assert manifest.get(path).rows == manifest.build(path).rows
+    assert manifest.load(path) is None
+
+
+@pytest.mark.parametrize("start, end", [
+    (datetime.datetime(2020, 1, 1, 3, 15), None),
+    (datetime.datetime(2020, 1, 1, 3, 15), datetime.datetime(2020, 1, 1, 9, 30)),
+    (datetime.datetime(2019, 1, 1), None),
+    (datetime.datetime(2020, 1, 1, 23, 59), None),
+    (datetime.datetime(2021, 1, 1), None),
+])
+@pytest.mark.parametrize("sort", [False, True])
+def test_bar_source_uses_the_manifest(start, end, sort, tmp_dir):
+    pair = Pair("BTC", "USD")
+    path = copy_data_file("bitstamp_btcusd_min_2020_01_01.csv", tmp_dir)
+    start = start.replace(tzinfo=datetime.timezone.utc)
+    end = end.replace(tzinfo=datetime.timezone.utc) if end else None
+    expected = load_bar_events(csv_bars.BarSource(pair, path, "1m", sort=sort, start=start, end=end))
+
+    manifest.save(path, manifest.build(path, index_step=7))
+    events = load_bar_events(csv_bars.BarSource(pair, path, "1m", sort=sort, start=start, end=end))
+    assert [ev.bar.datetime for ev in events] == [ev.bar.datetime for ev in expected]
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+
+    # Seeking with the index stops right before the first bar.
+    row_parser = common_bars.RowParser(pair, datetime.timezone.utc, datetime.timedelta(minutes=1))
+    found = csv._find_start(path, row_parser, row_parser.event_datetime(start))
+    with open(path, "rb") as f:
+        f.seek(found[0])
+        line = f.readline()
+    if events:
+        # The search stops a few rows before the first bar, since rows with no volume are skipped.
+        line_datetime = datetime.datetime.fromisoformat(line.decode().split(",")[0] + "+00:00")
+        assert datetime.timedelta(0) <= events[0].bar.datetime - line_datetime <= datetime.timedelta(minutes=2)
+
+
+def test_seeking_edge_cases(tmp_dir):
+    pair = Pair("BTC", "USD")
+    row_parser = common_bars.RowParser(pair, datetime.timezone.utc, datetime.timedelta(days=1))
+    start = datetime.datetime(2021, 1, 2, tzinfo=datetime.timezone.utc)
+
+    # Empty files.
+    path = os.path.join(tmp_dir, "empty.csv")
+    open(path, "w").close()
+    assert list(csv.load_and_yield(path, row_parser, start=start)) == []
+
+    # Files with columns in a different order are parsed as dicts, from the beginning.
+    path = os.path.join(tmp_dir, "bars.csv")
+    write_lines(path, [
+        "datetime,close,open,high,low,volume",
+        "2021-01-01 00:00:00,1,1,1,1,1",
+        "2021-01-02 00:00:00,2,2,2,2,1",
+    ])
+    assert csv._find_start(path, row_parser, start) is None
+    assert [ev.bar.close for ev in csv.load_and_yield(path, row_parser, start=start)] == [1, 2]
+
+    # Ranges that span a single byte, or that go beyond the end of the file.
+    lines = [b"2021-01-01 00:00:00,1,1,1,1,1\n", b"2021-01-02 00:00:00,2,2,2,2,0\n"]
+    f = io.BytesIO(b"".join(lines))
+    parse_values = row_parser.get_values_parser(common_bars.COLUMNS)
+    assert csv._find_offset(f, 0, 1, parse_values, start + datetime.timedelta(days=1)) == len(lines[0])
+    assert csv._find_offset(f, 0, 1000, parse_values, start + datetime.timedelta(days=2)) == 0
+
+
+def test_unsorted_files_get_sorted(tmp_dir):
+    path = os.path.join(tmp_dir, "bars.csv")
+    write_lines(path, [
+        "datetime,open,high,low,close,volume",
+        "2021-01-02 00:00:00,2,2,2,2,1",
+        "2021-01-01 00:00:00,1,1,1,1,1",
+    ])
+    manifest.get(path)
+    events = load_bar_events(csv_bars.BarSource(Pair("BTC", "USD"), path, "1d", sort=True))
+    assert [ev.bar.close for ev in events] == [1, 2]
+
+
+def test_sorted_files_get_a_manifest_while_sorting(tmp_dir, monkeypatch):
+    pair = Pair("BTC", "USD")
+    path = copy_data_file("bitstamp_btcusd_min_2020_01_01.csv", tmp_dir)
+    row_parser = common_bars.RowParser(pair, datetime.timezone.utc, datetime.timedelta(minutes=1))
+    expected = list(csv.load_and_yield(path, row_parser))
+
+    # Files that fit in a single chunk are parsed once anyway.
+    assert len(list(csv.load_sort_and_yield(path, row_parser, save_manifest=True))) == len(expected)
+    assert manifest.load(path) is None
+
+    # Manifests are only saved when asked for.
+    events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=100))
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+    assert manifest.load(path) is None
+
+    events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=100, save_manifest=True))
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+    assert manifest.load(path).sorted
+
+    # The next time, the file is parsed only once.
+    monkeypatch.setattr(csv, "_read_prefix", None)
+    events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=100))
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+
+    # Files that can't get a manifest are loaded anyway.
+    monkeypatch.undo()
+    path = copy_data_file("bitstamp_btcusd_day_2015.csv.utf16", tmp_dir)
+    row_parser = common_bars.RowParser(pair, datetime.timezone.utc, datetime.timedelta(days=1))
+    assert len(list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=100, save_manifest=True))) == 362
+    assert manifest.load(path) is None
+
+
+class SecondColumnRowParser(csv.RowParser):
+    # Events take the datetime from the second column, so manifests don't tell their order.
+    def parse_row(self, row_dict):
+        return [event.Event(datetime.datetime.fromisoformat(row_dict["when"]).replace(tzinfo=datetime.timezone.utc))]
+
+    def get_values_parser(self, fieldnames):
+        def parse_values(values):
+            return [event.Event(datetime.datetime.fromisoformat(values[1]).replace(tzinfo=datetime.timezone.utc))]
+        return parse_values
+
+
+def test_manifests_are_only_used_if_events_follow_the_first_column(tmp_dir, monkeypatch):
+    path = os.path.join(tmp_dir, "events.csv")
+    write_lines(path, ["datetime,when"] + [
+        f"2021-01-01 00:{minute:02}:00,2021-01-01 00:{59 - minute:02}:00" for minute in range(60)
+    ])
+    manifest.save(path, manifest.build(path, index_step=7))
+    assert manifest.load(path).sorted
+
+    row_parser = SecondColumnRowParser()
+    events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=10, save_manifest=True))
+    assert [ev.when.minute for ev in events] == list(range(60))
+
+    # The manifest index is not used to seek either.
+    monkeypatch.setattr(csv, "_bracket", None)
+    start = datetime.datetime(2021, 1, 1, 0, 30, tzinfo=datetime.timezone.utc)
+    assert csv._find_start(path, row_parser, start) is not None
+
+    # Bar parsers don't use manifests when the rows are parsed as dicts.
+    path = copy_data_file("bitstamp_btcusd_day_2015.csv", tmp_dir)
+    manifest.get(path)
+    row_parser = common_bars.RowParser(Pair("BTC", "USD"), datetime.timezone.utc, datetime.timedelta(days=1))
+    assert row_parser.events_follow_first_column(common_bars.COLUMNS)
+    assert not csv._manifest_applies(path, row_parser, {"delimiter": ","})
+    assert csv._manifest_applies(path, row_parser, {})
+
+
+def test_sweep_checksums_and_costs(tmp_dir):
+    path = copy_data_file("bitstamp_btcusd_day_2015.csv", tmp_dir)
+    assert cache.data_checksum(path) == cache.file_checksum(path)
+    file_manifest = manifest.load(path)
+    assert file_manifest is not None
+
+    # The checksum and the number of rows are taken from the manifest.
+    file_manifest.checksum = "0" * 64
+    file_manifest.rows = 1
+    manifest.save(path, file_manifest)
+    assert cache.data_checksum(path) == "0" * 64
+    assert scheduling.CostModel(tmp_dir).bars("bitstamp_btcusd_day_2015.csv") == 1
+
+    # Files that can't get a manifest are read.
+    invalid_path = os.path.join(tmp_dir, "invalid.csv")
+    write_lines(invalid_path, ["datetime,open,high,low,close,volume", "yesterday,1,1,1,1,1"])
+    assert cache.data_checksum(invalid_path) == cache.file_checksum(invalid_path)
+    assert not os.path.exists(manifest.manifest_path(invalid_path))
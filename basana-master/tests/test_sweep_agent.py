@@ -0,0 +1,37 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from basana.sweep import agent, executors
+
+
+def test_main(monkeypatch):
+    monkeypatch.delenv(agent.AUTHKEY_ENV_VAR, raising=False)
+    with pytest.raises(SystemExit):
+        agent.main(["-a", "127.0.0.1:5000"])
+
+    calls = []
+
+    def run_agent(*args, **kwargs):
+        calls.append((args, kwargs))
+        # Ctrl-C stops the agent quietly.
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(executors, "run_agent", run_agent)
+    monkeypatch.setenv(agent.AUTHKEY_ENV_VAR, "secret")
+    agent.main(["-a", "127.0.0.1:5000", "-d", "data", "-w", "2"])
+    assert calls == [((("127.0.0.1", 5000), b"secret", "data"), {"max_workers": 2})]
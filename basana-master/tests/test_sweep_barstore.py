@@ -0,0 +1,115 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from .test_sweep_datasets import assert_same_bars, load_bars
+from basana.core import errors
+from basana.core.pair import Pair
+from basana.external.bitstamp.csv import bars as csv_bars
+from basana.sweep import barstore, datasets
+
+
+def test_convert_and_load(csv_path):
+    path = barstore.convert_csv(csv_path, period="1m")
+    assert path == csv_path[:-4] + ".bars"
+    assert barstore.read_header(path)["period"] == "1m"
+    assert barstore.is_up_to_date(csv_path)
+
+    dataset = barstore.load(path)
+    assert isinstance(dataset.close, np.memmap)
+    expected = datasets.load_csv(csv_path, use_store=False)
+    assert len(dataset) == len(expected)
+    for column in datasets.COLUMNS:
+        assert np.array_equal(getattr(dataset, column), getattr(expected, column))
+
+
+def test_bars_match_csv_bar_source(csv_path):
+    pair = Pair("BTC", "USD")
+    path = barstore.convert_csv(csv_path, period="1m")
+    assert_same_bars(load_bars(barstore.BarSource(pair, path)), load_bars(csv_bars.BarSource(pair, csv_path, "1m")))
+
+
+def test_load_csv_uses_store_if_up_to_date(csv_path):
+    assert not barstore.is_up_to_date(csv_path)
+    assert not isinstance(datasets.load_csv(csv_path).close, np.memmap)
+
+    barstore.convert_csv(csv_path)
+    assert isinstance(datasets.load_csv(csv_path).close, np.memmap)
+
+    # The CSV file changed after it was converted.
+    with open(csv_path, "a") as f:
+        f.write("2020-01-02 00:00:00,7200,7200,7200,7200,1\n")
+    assert not barstore.is_up_to_date(csv_path)
+    assert len(datasets.load_csv(csv_path)) == len(barstore.load(barstore.store_path(csv_path))) + 1
+
+
+def test_empty_store():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "empty.bars")
+        barstore.write(datasets.load_bars([]), path)
+        assert len(barstore.load(path)) == 0
+        with pytest.raises(errors.Error, match="period is not set"):
+            barstore.BarSource(Pair("BTC", "USD"), path)
+        assert load_bars(barstore.BarSource(Pair("BTC", "USD"), path, "1d")) == []
+
+
+def test_invalid_stores():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.bars")
+        with pytest.raises(errors.Error, match="not a bar store"):
+            barstore.load(path)
+
+        barstore.write(datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv")), path)
+        np.save(os.path.join(path, "close.npy"), np.zeros(10))
+        with pytest.raises(errors.Error, match="corrupt"):
+            barstore.load(path)
+
+        with open(os.path.join(path, barstore.HEADER_FILENAME), "w") as f:
+            json.dump({"version": 0}, f)
+        with pytest.raises(errors.Error, match="version 0"):
+            barstore.load(path)
+
+
+def test_store_is_replaced(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.bars")
+        barstore.write(datasets.load_bars([]), path)
+        barstore.write(datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv")), path, period="1d")
+        assert barstore.read_header(path)["period"] == "1d"
+        assert len(barstore.load(path)) == 362
+
+        # A failed write leaves the previous store in place and doesn't leave the temporary directory behind.
+        def failing_dump(*args, **kwargs):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr(json, "dump", failing_dump)
+        with pytest.raises(OSError, match="No space left"):
+            barstore.write(datasets.load_bars([]), path)
+        assert os.listdir(tmp_dir) == ["test.bars"]
+        assert len(barstore.load(path)) == 362
+
+
+def test_main(csv_path, capsys):
+    barstore.main(["--period", "1m", csv_path])
+    assert "1395 bars" in capsys.readouterr().out
+    assert barstore.is_up_to_date(csv_path)
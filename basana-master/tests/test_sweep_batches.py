@@ -0,0 +1,86 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import concurrent.futures
+
+from .helpers import abs_data_path
+from basana.sweep import batches, datasets
+
+
+async def backtest(symbol, filename, value, dataset=None):
+    if value < 0:
+        raise Exception("Negative value")
+    if value == 0:
+        return None
+    bars = 0 if dataset is None else len(datasets.attach(dataset))
+    return {"profit": value, "sharpe": Decimal(bars), "max_drawdown": Decimal("0.5")}
+
+
+def test_split():
+    parameter_sets = [
+        {"symbol": "BTC", "filename": "btc.csv", "value": 1},
+        {"symbol": "ETH", "filename": "eth.csv", "value": 2},
+        {"symbol": "BTC", "filename": "btc.csv", "value": 3},
+        {"symbol": "BTC", "filename": "btc.csv", "value": 4},
+        {"symbol": "BTC", "filename": "btc_4h.csv", "value": 5},
+    ]
+    assert [[params["value"] for params in batch] for batch in batches.split(parameter_sets, 2)] == [
+        [1, 3], [4], [2], [5]
+    ]
+
+
+def test_split_is_lazy():
+    def generate():
+        for value in range(5):
+            yield {"symbol": "BTC", "filename": "btc.csv", "value": value}
+        raise Exception("Should not get here")
+
+    split = batches.split(generate(), 2)
+    assert [params["value"] for params in next(split)] == [0, 1]
+    assert [params["value"] for params in next(split)] == [2, 3]
+
+
+def test_run_batch():
+    parameter_sets = [{"symbol": "BTC", "filename": "btc.csv", "value": value} for value in [1, 0, -1, 2]]
+    assert batches.run_batch(backtest, parameter_sets) == [(1.0, 0.0, 0.5), None, None, (2.0, 0.0, 0.5)]
+    assert batches.from_metrics((1.0, 0.0, 0.5)) == {"profit": 1.0, "sharpe": 0.0, "max_drawdown": 0.5}
+
+
+def test_run_batch_in_worker_with_shared_dataset():
+    parameter_sets = [
+        {"symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": value} for value in [1, 2]
+    ]
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets:
+        dataset = shared_datasets.load("bitstamp_btcusd_day_2015.csv")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            results = executor.submit(batches.run_batch, backtest, parameter_sets, dataset).result()
+    assert results == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+
+
+def test_run_batch_with_shared_dataset_and_durations():
+    parameter_sets = [
+        {"symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": value} for value in [1, 0, 2]
+    ]
+    durations = []
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets:
+        dataset = shared_datasets.load("bitstamp_btcusd_day_2015.csv")
+        try:
+            results = batches.run_batch(backtest, parameter_sets, dataset, durations)
+        finally:
+            datasets.detach([dataset.name])
+    assert results == [(1.0, 362.0, 0.5), None, (2.0, 362.0, 0.5)]
+    assert len(durations) == 3 and all(duration >= 0 for duration in durations)
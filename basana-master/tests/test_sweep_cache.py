@@ -0,0 +1,107 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+
+from .helpers import abs_data_path, temp_file_name
+from basana.sweep import cache
+from samples import aspis_1
+
+
+async def backtest(filename, value):
+    return {"profit": value}
+
+
+def test_file_checksum():
+    path = abs_data_path("bitstamp_btcusd_day_2015.csv")
+    assert cache.file_checksum(path) == cache.file_checksum(path, chunk_size=7)
+    assert cache.file_checksum(path) != cache.file_checksum(abs_data_path("bitstamp_btcusd_min_2020_01_01.csv"))
+
+
+def test_code_checksum():
+    assert cache.code_checksum(aspis_1.backtest) == cache.code_checksum(aspis_1.backtest)
+    assert cache.code_checksum(aspis_1.backtest) != cache.code_checksum(aspis_1.backtest, packages=())
+    # Modules can be given instead of packages.
+    assert cache.code_checksum(aspis_1.backtest, packages=("samples.aspis_2", )) != \
+        cache.code_checksum(aspis_1.backtest, packages=())
+
+
+def test_cache_hits_and_misses():
+    with tempfile.TemporaryDirectory() as data_dir, temp_file_name(suffix=".sqlite") as path:
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), os.path.join(data_dir, "btc.csv"))
+        parameter_sets = [{"filename": "btc.csv", "value": Decimal(value)} for value in range(3)]
+
+        with cache.ResultCache(path, backtest, data_dir) as result_cache:
+            assert result_cache.get(parameter_sets[0]) is None
+            result_cache.put(parameter_sets[0], {"profit": Decimal(1)})
+            result_cache.put(parameter_sets[1], {"profit": Decimal(2)})
+            assert result_cache.get(parameter_sets[0]) == {"profit": Decimal(1)}
+            assert result_cache.get(parameter_sets[2]) is None
+
+        # Different settings, or a different data file, should result in cache misses.
+        with cache.ResultCache(path, backtest, data_dir, settings={"fee": "0.1"}) as result_cache:
+            assert len(result_cache) == 2
+            assert result_cache.get(parameter_sets[0]) is None
+        with open(os.path.join(data_dir, "btc.csv"), "a") as f:
+            f.write("2016-01-01 00:00:00,430,431,429,430,1\n")
+        with cache.ResultCache(path, backtest, data_dir) as result_cache:
+            assert result_cache.get(parameter_sets[0]) is None
+
+
+def test_changes_to_packages_result_in_cache_misses(tmp_path, monkeypatch):
+    # A package with a module the backtest function doesn't reference.
+    package_dir = tmp_path / "sweep_cache_package"
+    package_dir.mkdir()
+    (package_dir / "__init__.py").write_text("")
+    (package_dir / "fees.py").write_text("FEE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), data_dir / "btc.csv")
+    params = {"filename": "btc.csv", "value": Decimal(1)}
+    path = str(tmp_path / "cache.sqlite")
+
+    with cache.ResultCache(path, backtest, str(data_dir), packages=("sweep_cache_package", )) as result_cache:
+        result_cache.put(params, {"profit": Decimal(1)})
+        assert result_cache.get(params) is not None
+    (package_dir / "fees.py").write_text("FEE = 2\n")
+    with cache.ResultCache(path, backtest, str(data_dir), packages=("sweep_cache_package", )) as result_cache:
+        assert result_cache.get(params) is None
+    assert "basana" in cache.DEFAULT_PACKAGES
+
+
+def test_lru_eviction():
+    with tempfile.TemporaryDirectory() as data_dir, temp_file_name(suffix=".sqlite") as path:
+        # Keys for CSV files are taken from their manifests, which get written next to them.
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), data_dir)
+        parameter_sets = [{"filename": "bitstamp_btcusd_day_2015.csv", "value": value} for value in range(4)]
+
+        with cache.ResultCache(path, backtest, data_dir, max_entries=2) as result_cache:
+            result_cache.put(parameter_sets[0], {"profit": 0})
+            result_cache.put(parameter_sets[1], {"profit": 1})
+            # Using the first one makes the second one the least recently used.
+            assert result_cache.get(parameter_sets[0]) is not None
+            result_cache.put(parameter_sets[2], {"profit": 2})
+            assert len(result_cache) == 2
+            assert result_cache.get(parameter_sets[1]) is None
+            assert result_cache.get(parameter_sets[0]) is not None
+            assert result_cache.get(parameter_sets[2]) is not None
+            # Replacing an existing result should not evict anything.
+            result_cache.put(parameter_sets[2], {"profit": 3})
+            assert result_cache.get(parameter_sets[0]) is not None
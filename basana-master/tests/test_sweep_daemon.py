@@ -0,0 +1,196 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from multiprocessing import connection
+import asyncio
+import os
+import pickle
+import signal
+import tempfile
+import threading
+import time
+
+import pytest
+
+from .helpers import abs_data_path
+from basana.core import errors
+from basana.sweep import agent, daemon, executors, runner
+
+
+async def backtest(name, symbol, filename, value, dataset=None):
+    return {"profit": value, "sharpe": Decimal(os.getpid()), "max_drawdown": Decimal("0.5")}
+
+
+async def slow_backtest(name, symbol, filename, value, dataset=None):
+    await asyncio.sleep(0.5)
+    return await backtest(name, symbol, filename, value, dataset=dataset)
+
+
+class PicklesOnce:
+    # Can be sent to the daemon, but the daemon can't send it to its workers.
+    def __init__(self, unpickled=False):
+        self.unpickled = unpickled
+
+    def __reduce__(self):
+        if self.unpickled:
+            raise pickle.PicklingError("Pickled twice")
+        return PicklesOnce, (True, )
+
+
+def slow_tasks(count):
+    return [
+        executors.Task(
+            slow_backtest, [{"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": 1}]
+        )
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture()
+def server():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ret = daemon.Server(
+            os.path.join(tmp_dir, "sweep.sock"), b"secret", abs_data_path(""), max_workers=1,
+            preload=["tests.test_sweep_daemon"]
+        )
+        thread = threading.Thread(target=ret.serve_forever)
+        thread.start()
+        yield ret
+        ret.close()
+        thread.join()
+
+
+def test_workers_stay_warm_across_sweeps(server):
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(5)
+    ]
+    worker_pids = set()
+    for _ in range(2):
+        mass_backtest = runner.MassBacktest(
+            backtest, batched=True, executor_factory=lambda: daemon.DaemonExecutor(server.address, b"secret")
+        )
+        mass_backtest.run(parameter_sets)
+        assert sorted(result["profit"] for result in mass_backtest.results) == list(range(5))
+        worker_pids.update(result["sharpe"] for result in mass_backtest.results)
+    # The same worker ran every backtest.
+    assert len(worker_pids) == 1
+    assert os.getpid() not in worker_pids
+
+
+def test_failed_task(server):
+    with daemon.DaemonExecutor(server.address, b"secret") as executor:
+        assert executor.max_workers == 1
+        task = executors.Task(backtest, [{"name": "test", "symbol": "BTC", "filename": "missing.csv", "value": 1}])
+        with pytest.raises(RuntimeError, match="No such file"):
+            executor.submit(task).result()
+        # The connection is still usable.
+        task = executors.Task(
+            backtest, [{"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": 1}]
+        )
+        assert executor.submit(task).result()[0][0][0] == 1
+
+    with pytest.raises(errors.Error, match="closed"):
+        executor.submit(task)
+
+
+def test_task_that_cant_be_sent_to_workers(server):
+    with daemon.DaemonExecutor(server.address, b"secret") as executor:
+        task = executors.Task(
+            backtest,
+            [{"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": PicklesOnce()}]
+        )
+        with pytest.raises(RuntimeError, match="Pickled twice"):
+            executor.submit(task).result()
+
+
+def test_client_disconnects_with_tasks_in_flight(server):
+    with daemon.DaemonExecutor(server.address, b"secret") as executor:
+        for task in slow_tasks(8):
+            executor.submit(task)
+    # Tasks that didn't start are cancelled, and results for the ones that did are dropped.
+    with daemon.DaemonExecutor(server.address, b"secret") as executor:
+        assert executor.submit(slow_tasks(1)[0]).result()[0][0][0] == 1
+    server.close()
+    # Closing again is a no-op.
+    server.close()
+
+
+def test_lost_connection():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with connection.Listener(os.path.join(tmp_dir, "sweep.sock"), authkey=b"secret") as listener:
+            def serve_one_task():
+                with listener.accept() as conn:
+                    conn.send(1)
+                    conn.recv()
+
+            thread = threading.Thread(target=serve_one_task)
+            thread.start()
+            executor = daemon.DaemonExecutor(listener.address, b"secret")
+            future = executor.submit(slow_tasks(1)[0])
+            thread.join()
+            with pytest.raises(RuntimeError, match="closed"):
+                future.result()
+            with pytest.raises(errors.Error, match="closed"):
+                executor.submit(slow_tasks(1)[0])
+            executor.close()
+
+
+def test_stale_socket():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "sweep.sock")
+        with open(path, "w"):
+            pass
+        with pytest.raises(ConnectionRefusedError):
+            daemon.DaemonExecutor(path, b"secret")
+
+        server = daemon.Server(path, b"secret", abs_data_path(""), max_workers=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with pytest.raises(errors.Error, match="already listening"):
+                daemon.Server(path, b"secret", abs_data_path(""), max_workers=1)
+        finally:
+            server.close()
+            thread.join()
+
+
+def test_main(monkeypatch):
+    monkeypatch.delenv(agent.AUTHKEY_ENV_VAR, raising=False)
+    with pytest.raises(SystemExit):
+        daemon.main([])
+
+    sigterm_handler = signal.getsignal(signal.SIGTERM)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "sweep.sock")
+
+        def terminate():
+            while not os.path.exists(path):
+                time.sleep(0.05)
+            with daemon.DaemonExecutor(path, b"secret") as executor:
+                assert executor.max_workers == 1
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        thread = threading.Thread(target=terminate)
+        thread.start()
+        try:
+            daemon.main([
+                "-a", path, "-k", "secret", "-d", abs_data_path(""), "-w", "1", "-p", "tests.test_sweep_daemon"
+            ])
+        finally:
+            signal.signal(signal.SIGTERM, sigterm_handler)
+            thread.join()
@@ -0,0 +1,185 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from multiprocessing import shared_memory
+import asyncio
+import concurrent.futures
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from basana.core import dispatcher
+from basana.core.bar import Bar, InvalidBar
+from basana.core.pair import Pair
+from basana.external.bitstamp.csv import bars as csv_bars
+from basana.sweep import datasets
+
+
+def load_bars(src):
+    ret = []
+    backtesting_dispatcher = dispatcher.backtesting_dispatcher()
+
+    async def on_bar(bar_event):
+        ret.append((bar_event.when, bar_event.bar))
+
+    backtesting_dispatcher.subscribe(src, on_bar)
+    asyncio.run(backtesting_dispatcher.run())
+    return ret
+
+
+def count_bars(handle):
+    return len(datasets.attach(handle))
+
+
+def assert_same_bars(bars, expected_bars):
+    assert len(bars) == len(expected_bars)
+    for (when, bar), (expected_when, expected_bar) in zip(bars, expected_bars):
+        assert when == expected_when
+        for attr in ("datetime", "pair", "open", "high", "low", "close", "volume"):
+            assert getattr(bar, attr) == getattr(expected_bar, attr)
+
+
+@pytest.mark.parametrize("filename, period", [
+    ("bitstamp_btcusd_day_2015.csv", "1d"),
+    ("bitstamp_btcusd_min_2020_01_01.csv", "1m"),
+])
+def test_bars_match_csv_bar_source(filename, period):
+    pair = Pair("BTC", "USD")
+    expected_bars = load_bars(csv_bars.BarSource(pair, abs_data_path(filename), period))
+
+    dataset = datasets.load_csv(abs_data_path(filename))
+    bars = load_bars(datasets.BarSource(pair, dataset, period))
+    assert_same_bars(bars, expected_bars)
+
+
+def test_shared_dataset():
+    pair = Pair("BTC", "USD")
+    csv_path = abs_data_path("bitstamp_btcusd_day_2015.csv")
+    expected_bars = load_bars(csv_bars.BarSource(pair, csv_path, "1d"))
+
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets:
+        handle = shared_datasets.load("bitstamp_btcusd_day_2015.csv")
+        # The file is loaded only once.
+        assert shared_datasets.load("bitstamp_btcusd_day_2015.csv") == handle
+        assert pickle.loads(pickle.dumps(handle)) == handle
+        assert handle.length == 365 - 3  # There are 3 bars with no volume that are skipped.
+
+        bars = load_bars(datasets.BarSource(pair, datasets.attach(handle), "1d"))
+        assert_same_bars(bars, expected_bars)
+        # Attachments are reused.
+        assert datasets.attach(handle) is datasets.attach(handle)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            assert list(executor.map(count_bars, [handle, handle])) == [handle.length, handle.length]
+
+        datasets.attach(handle).release()
+        datasets._attached.pop(handle.name)
+
+    # The shared memory block should be gone.
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle.name)
+
+
+def test_changed_files_are_reloaded():
+    with tempfile.TemporaryDirectory() as data_dir, datasets.SharedDatasets(data_dir) as shared_datasets:
+        path = os.path.join(data_dir, "bars.csv")
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), path)
+        handle = shared_datasets.load("bars.csv")
+        assert shared_datasets.release_stale() == []
+
+        with open(path, "a") as f:
+            f.write("\n2016-01-01 00:00:00,430.89,430.89,430.89,430.89,1\n")
+        new_handle = shared_datasets.load("bars.csv")
+        assert new_handle.name != handle.name
+        assert new_handle.length == handle.length + 1
+        assert shared_datasets.load("bars.csv@1d") != new_handle
+
+        # The old dataset is kept until it is released. Detaching works even if the memory is still referenced.
+        dataset = datasets.attach(handle)
+        view = memoryview(dataset._shm.buf)
+        datasets.detach([handle.name, "missing"])
+        assert handle.name not in datasets._attached
+        view.release()
+        assert shared_datasets.release_stale() == [handle.name]
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=handle.name)
+
+
+def test_windows():
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets:
+        handle = shared_datasets.load("bitstamp_btcusd_day_2015.csv")
+        dataset = datasets.attach(handle)
+
+        window = datasets.attach(handle.window(10, 20))
+        assert len(window) == 10
+        assert window.close[0] == dataset.close[10]
+        assert len(datasets.attach(handle.prefix(0.5))) == 181
+        assert len(datasets.attach(handle.prefix(0.0001))) == 1
+        assert datasets.attach(handle.prefix(1)) is dataset
+
+        # Views need to be gone before releasing the dataset.
+        del window
+        dataset.release()
+        datasets._attached.pop(handle.name)
+
+
+def test_empty_dataset():
+    dataset = datasets.SharedDataset.create(datasets.load_bars([]))
+    try:
+        assert len(dataset) == 0
+        assert datasets.BarSource(Pair("BTC", "USD"), dataset, "1d").pop() is None
+    finally:
+        dataset.release()
+
+
+def test_dataset_bars_are_lazy():
+    dataset = datasets.load_csv(abs_data_path("bitstamp_btcusd_min_2020_01_01.csv"), use_store=False)
+    bar_event = datasets.BarSource(Pair("BTC", "USD"), dataset, "1m").pop()
+    b = bar_event.bar
+    assert isinstance(b, datasets.DatasetBar)
+    assert isinstance(b, Bar)
+    assert b.datetime == datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    assert bar_event.when == datetime.datetime(2020, 1, 1, 0, 1, tzinfo=datetime.timezone.utc)
+
+    # Decimals are built on first access, and then reused.
+    assert b.close == Decimal("7159.64")
+    assert b.close is b.close
+    b.close = Decimal(1)
+    assert b.close == Decimal(1)
+
+    # Bars are pickled as plain bars, without the dataset.
+    unpickled = pickle.loads(pickle.dumps(b))
+    assert type(unpickled) is Bar
+    for attr in ("datetime", "pair", "open", "high", "low", "close", "volume"):
+        assert getattr(unpickled, attr) == getattr(b, attr)
+
+
+def test_validate():
+    dataset = datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv"), use_store=False)
+    datasets.validate(dataset)
+
+    high = np.array(dataset.high)
+    high[10] = dataset.low[10] - 1
+    dataset = datasets.Dataset(dataset.datetime, dataset.open, high, dataset.low, dataset.close, dataset.volume)
+    with pytest.raises(InvalidBar, match="high < low on 2015-01-1"):
+        datasets.validate(dataset)
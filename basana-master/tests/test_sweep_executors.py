@@ -0,0 +1,330 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from multiprocessing import connection
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from .helpers import abs_data_path
+from basana.core import errors
+from basana.sweep import datasets, executors, telemetry
+
+
+async def backtest(symbol, filename, value, dataset=None):
+    bars = 0 if dataset is None else len(datasets.attach(dataset))
+    return {"profit": value, "sharpe": Decimal(bars), "max_drawdown": Decimal("0.5")}
+
+
+async def slow_backtest(symbol, filename, value, dataset=None):
+    await asyncio.sleep(0.5)
+    return await backtest(symbol, filename, value, dataset=dataset)
+
+
+def make_task(fraction=1):
+    parameter_sets = [
+        {"symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": value} for value in [1, 2]
+    ]
+    return executors.Task(backtest, parameter_sets, fraction=fraction)
+
+
+def make_stats():
+    return telemetry.TaskStats(queue_wait=0, wall_time=1, cpu_time=1, bars=10, payload_size=10, worker="worker")
+
+
+def test_parse_address():
+    assert executors.parse_address("localhost:5000") == ("localhost", 5000)
+    assert executors.parse_address("/tmp/sweep.sock") == "/tmp/sweep.sock"
+
+
+def test_run_task():
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets:
+        handle = shared_datasets.load("bitstamp_btcusd_day_2015.csv")
+        # Runs in this process, as it would in a worker.
+        results, stats = executors._run_task(backtest, make_task().parameter_sets, handle, time.time(), ("missing", ))
+        datasets.detach([handle.name])
+    assert results == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+    assert stats.bars == 362 * 2
+    assert stats.worker.endswith(f":{os.getpid()}")
+
+
+def test_local_executor():
+    with executors.LocalExecutor(abs_data_path(""), max_workers=1) as executor:
+        assert executor.max_workers == 1
+        results, stats = executor.submit(make_task()).result()
+        assert results == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+        assert stats.bars == 362 * 2
+        assert len(stats.durations) == 2
+        assert stats.wall_time >= sum(stats.durations)
+        assert stats.payload_size > 0
+        assert stats.queue_wait >= 0
+        assert executor.submit(make_task(0.5)).result()[0] == [(1.0, 181.0, 0.5), (2.0, 181.0, 0.5)]
+        task = executors.Task(backtest, make_task().parameter_sets, start=10, stop=20)
+        results, stats = executor.submit(task).result()
+        assert results == [(1.0, 10.0, 0.5), (2.0, 10.0, 0.5)]
+        assert stats.bars == 20
+
+
+def test_local_executor_reloads_changed_files():
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, "bitstamp_btcusd_day_2015.csv")
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), path)
+        with executors.LocalExecutor(data_dir, max_workers=1) as executor:
+            assert executor.submit(make_task()).result()[0][0] == (1.0, 362.0, 0.5)
+            task = executors.Task(backtest, make_task().parameter_sets, strategy="aspis_1")
+            assert executor.submit(task).result()[0][0] == (1.0, 362.0, 0.5)
+            old_handle = executor._shared_indicators["aspis_1"].load(task.parameter_sets)
+
+            with open(path, "a") as f:
+                f.write("\n2016-01-01 00:00:00,430.89,430.89,430.89,430.89,1\n")
+            assert executor.submit(make_task()).result()[0][0] == (1.0, 363.0, 0.5)
+            # The old dataset is released before the next task, once no task is using it.
+            assert executor.submit(make_task()).result()[0][0] == (1.0, 363.0, 0.5)
+            # Along with the indicators that were calculated for it.
+            assert sorted(executor._released) == sorted([block_name for _, block_name in old_handle.indicators] + [
+                old_handle.name
+            ])
+
+
+async def imported_modules(symbol, filename, value, dataset=None):
+    # The sharpe is 1 if the module was imported in the worker.
+    sharpe = Decimal(int(value in sys.modules))
+    return {"profit": Decimal(os.getpid()), "sharpe": sharpe, "max_drawdown": Decimal(0)}
+
+
+def test_local_executor_with_preload():
+    import xml.dom.minidom  # noqa: F401
+
+    parameter_sets = [
+        {"symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": value}
+        for value in ["xml.dom.minidom", "tests.test_sweep_executors"]
+    ]
+    with executors.LocalExecutor(abs_data_path(""), max_workers=1, preload=["tests.test_sweep_executors"]) as executor:
+        results, _ = executor.submit(executors.Task(imported_modules, parameter_sets)).result()
+    # Workers don't inherit the modules imported by this process, but they have the ones that were preloaded.
+    assert [metrics[1] for metrics in results] == [0, 1]
+    assert results[0][0] != os.getpid()
+
+
+def test_queue_executor():
+    stop_event = threading.Event()
+    with executors.QueueExecutor(("127.0.0.1", 0), b"secret", max_workers=2) as executor:
+        agent = threading.Thread(
+            target=executors.run_agent,
+            args=(executor.address, b"secret", abs_data_path("")),
+            kwargs={"max_workers": 1, "poll_interval": 0.1, "stop_event": stop_event},
+        )
+        agent.start()
+        try:
+            futures = [executor.submit(make_task()), executor.submit(make_task(0.5))]
+            assert futures[0].result(timeout=60)[0] == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+            assert futures[1].result(timeout=60)[0] == [(1.0, 181.0, 0.5), (2.0, 181.0, 0.5)]
+            assert futures[1].result()[1].bars == 181 * 2
+
+            # Tasks that can't be run get retried, and their backtests fail, but the agent keeps going.
+            task = executors.Task(backtest, [{"symbol": "BTC", "filename": "missing.csv", "value": 1}])
+            assert executor.submit(task).result(timeout=60)[0] == [None]
+            assert executor.submit(make_task()).result(timeout=60)[0] == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+        finally:
+            stop_event.set()
+            agent.join()
+
+
+def test_unresponsive_agents_lose_their_tasks():
+    broker = executors._Broker(lease_timeout=0.1, max_attempts=3)
+    future = broker.add_task(make_task())
+
+    task_id, _ = broker.get_task("agent-1", 0)
+    assert broker.get_task("agent-2", 0) is None
+    time.sleep(0.2)
+    assert broker.get_task("agent-2", 0)[0] == task_id
+
+    # The result from the first agent is ignored since the task was reassigned.
+    broker.put_result("agent-1", task_id, ([None], make_stats()), None)
+    assert not future.done()
+    broker.put_result("agent-2", task_id, ([(1.0, 2.0, 3.0)], make_stats()), None)
+    results, stats = future.result()
+    assert results == [(1.0, 2.0, 3.0)]
+    # The queue wait is measured by the broker, up to the last time the task was leased.
+    assert stats.queue_wait >= 0.2
+
+
+def test_leases_are_renewed():
+    broker = executors._Broker(lease_timeout=1, max_attempts=3)
+    broker.add_task(make_task())
+
+    task_id, _ = broker.get_task("agent-1", 0)
+    for _ in range(4):
+        time.sleep(0.3)
+        broker.renew("agent-1", [task_id])
+        # Only the agent that has the task can renew it.
+        broker.renew("agent-2", [task_id])
+    assert broker.get_task("agent-2", 0) is None
+
+
+def test_failed_tasks_are_retried():
+    broker = executors._Broker(lease_timeout=60, max_attempts=2)
+    future = broker.add_task(make_task())
+
+    task_id, _ = broker.get_task("agent-1", 0)
+    broker.put_result("agent-1", task_id, None, "FileNotFoundError()")
+    assert not future.done()
+
+    assert broker.get_task("agent-2", 0)[0] == task_id
+    broker.put_result("agent-2", task_id, None, "FileNotFoundError()")
+    # Backtests in tasks that fail every attempt are recorded as failed, instead of aborting the sweep.
+    results, stats = future.result()
+    assert results == [None, None]
+    assert stats.worker == "agent-2"
+    assert stats.bars == 0
+
+
+def test_invalid_methods_get_an_error():
+    with executors.QueueExecutor(("127.0.0.1", 0), b"secret") as executor:
+        client = executors._BrokerClient(executor.address, b"secret")
+        try:
+            with pytest.raises(errors.Error, match="Invalid method 'close'"):
+                client.call("close")
+            client._conn.send("garbage")
+            assert client._conn.recv() == (None, "Invalid method None")
+            # The connection is still usable, even after being idle for a while.
+            time.sleep(1.5)
+            assert client.call("get_task", "agent-1", 0) is None
+        finally:
+            client.close()
+
+        # Agents with the wrong key are rejected.
+        with pytest.raises(connection.AuthenticationError):
+            executors._BrokerClient(executor.address, b"wrong")
+
+
+def test_close(monkeypatch):
+    client = connection.Client
+
+    def reset_client(*args, **kwargs):
+        client(*args, **kwargs).close()
+        raise ConnectionResetError()
+
+    executor = executors.QueueExecutor(("127.0.0.1", 0), b"secret")
+    monkeypatch.setattr(connection, "Client", reset_client)
+    executor.close()
+    executor.close()
+
+
+def test_agents_wait_for_the_coordinator():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        address = os.path.join(tmp_dir, "sweep.sock")
+        for coordinator_starts in (False, True):
+            stop_event = threading.Event()
+            agent = threading.Thread(
+                target=executors.run_agent, args=(address, b"secret", abs_data_path("")),
+                kwargs={"max_workers": 1, "poll_interval": 0.1, "stop_event": stop_event},
+            )
+            agent.start()
+            time.sleep(0.3)
+            assert agent.is_alive()
+            if coordinator_starts:
+                with executors.QueueExecutor(address, b"secret") as executor:
+                    try:
+                        results, _ = executor.submit(make_task()).result(timeout=60)
+                        assert results == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+                    finally:
+                        stop_event.set()
+                        agent.join()
+            else:
+                # Agents can be stopped while waiting.
+                stop_event.set()
+                agent.join()
+
+
+def test_agents_reconnect(monkeypatch):
+    clients = []
+
+    class BrokerClient(executors._BrokerClient):
+        # The first connection is lost after pushing a result.
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.closed = False
+            self.results = 0
+            clients.append(self)
+
+        def call(self, method, *args):
+            if self is clients[0] and self.results:
+                raise EOFError()
+            self.results += method == "put_result"
+            return super().call(method, *args)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    monkeypatch.setattr(executors, "_BrokerClient", BrokerClient)
+    stop_event = threading.Event()
+    with executors.QueueExecutor(("127.0.0.1", 0), b"secret") as executor:
+        agent = threading.Thread(
+            target=executors.run_agent, args=(executor.address, b"secret", abs_data_path("")),
+            kwargs={"max_workers": 1, "poll_interval": 0.1, "heartbeat_interval": 0.1, "stop_event": stop_event},
+        )
+        agent.start()
+        try:
+            for _ in range(2):
+                assert executor.submit(make_task()).result(timeout=60)[0] == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+        finally:
+            stop_event.set()
+            agent.join()
+
+    # The agent reconnected, and the lost connection was closed.
+    assert len(clients) == 2
+    assert all(client.closed for client in clients)
+
+
+def test_agents_reconnect_when_heartbeats_fail(monkeypatch):
+    clients = []
+
+    class BrokerClient(executors._BrokerClient):
+        # Renewing leases fails on the first connection.
+        def __init__(self, *args):
+            super().__init__(*args)
+            clients.append(self)
+
+        def call(self, method, *args):
+            if self is clients[0] and method == "renew":
+                raise OSError()
+            return super().call(method, *args)
+
+    monkeypatch.setattr(executors, "_BrokerClient", BrokerClient)
+    stop_event = threading.Event()
+    with executors.QueueExecutor(("127.0.0.1", 0), b"secret", lease_timeout=1) as executor:
+        agent = threading.Thread(
+            target=executors.run_agent, args=(executor.address, b"secret", abs_data_path("")),
+            kwargs={"max_workers": 1, "poll_interval": 0.1, "heartbeat_interval": 0.1, "stop_event": stop_event},
+        )
+        agent.start()
+        try:
+            # The result can't be pushed back on the lost connection, so the task runs again once its lease expires.
+            task = executors.Task(slow_backtest, make_task().parameter_sets)
+            assert executor.submit(task).result(timeout=60)[0] == [(1.0, 362.0, 0.5), (2.0, 362.0, 0.5)]
+        finally:
+            stop_event.set()
+            agent.join()
+    assert len(clients) == 2
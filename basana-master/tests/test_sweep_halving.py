@@ -0,0 +1,57 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+import pytest
+
+from basana.sweep import halving
+
+
+def test_rung_fractions():
+    assert halving.rung_fractions(1, 3) == [1]
+    assert halving.rung_fractions(3, 3) == pytest.approx([1 / 9, 1 / 3, 1])
+    assert halving.rung_fractions(2, 2) == pytest.approx([1 / 2, 1])
+
+
+def test_select_top():
+    parameter_sets = [{"symbol": symbol, "value": value} for symbol in ("BTC", "ETH") for value in range(4)]
+    results = [
+        {"sharpe": 1}, {"sharpe": 3}, None, {"sharpe": 2},
+        {"sharpe": math.nan}, {"sharpe": -1}, {"sharpe": -2}, {"sharpe": -1},
+    ]
+
+    selected = halving.select_top(parameter_sets, results, 2, "sharpe", ("symbol", ))
+    assert selected == [parameter_sets[1], parameter_sets[3], parameter_sets[5], parameter_sets[7]]
+
+    selected = halving.select_top(parameter_sets, results, 3, "sharpe", ())
+    assert selected == [parameter_sets[0], parameter_sets[1], parameter_sets[3]]
+
+
+def test_successive_halving():
+    parameter_sets = [{"symbol": "BTC", "filename": "btc.csv", "value": value} for value in range(27)]
+    evaluated = []
+
+    def evaluate(candidates, fraction):
+        evaluated.append((len(candidates), fraction))
+        # Candidates with a higher value are better, but value 26 only looks good on short prefixes.
+        return [
+            {"sharpe": -1 if params["value"] == 26 and fraction == 1 else params["value"]} for params in candidates
+        ]
+
+    results = halving.successive_halving(parameter_sets, evaluate, rungs=3, eta=3)
+    assert evaluated == [(27, pytest.approx(1 / 9)), (9, pytest.approx(1 / 3)), (3, 1)]
+    assert [(params["value"], result["sharpe"]) for params, result in results] == [(24, 24), (25, 25), (26, -1)]
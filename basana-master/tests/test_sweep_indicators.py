@@ -0,0 +1,178 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from multiprocessing import shared_memory
+import asyncio
+import concurrent.futures
+import os
+import shutil
+import tempfile
+
+from talipp.indicators import RSI, SMA
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from basana.core import dispatcher
+from basana.core.pair import Pair
+from basana.sweep import datasets, indicators
+from samples.strategies import aspis_2
+
+
+def detach(handle):
+    for _, block_name in handle.indicators:
+        block = indicators._attached.pop(block_name, None)
+        if block is not None:
+            block.close()
+
+
+def indicator_values(handle, name, period):
+    indicator = indicators.attach(handle, name, period)
+    for _ in range(len(datasets.attach(handle))):
+        indicator.add(None)
+    return [indicator[i] for i in range(len(indicator))]
+
+
+def trading_signals(handle, **precalculated):
+    ret = []
+    backtesting_dispatcher = dispatcher.backtesting_dispatcher()
+    src = datasets.BarSource(Pair("BTC", "USD"), datasets.attach(handle), "1d")
+    strategy = aspis_2.Strategy(backtesting_dispatcher, 7, 5, 20, 50, **precalculated)
+
+    async def on_trading_signal(trading_signal):
+        ret.append((trading_signal.when, trading_signal.position))
+
+    backtesting_dispatcher.subscribe(src, strategy.on_bar_event)
+    strategy.subscribe_to_trading_signals(on_trading_signal)
+    asyncio.run(backtesting_dispatcher.run())
+    return ret
+
+
+def test_precalculated():
+    indicator = indicators.Precalculated(np.array([np.nan, 1.5, 2.5]))
+    assert len(indicator) == 0
+    with pytest.raises(IndexError):
+        indicator[-1]
+
+    indicator.add(10)
+    indicator.add(11)
+    assert len(indicator) == 2
+    assert indicator[-1] == 1.5
+    assert indicator[-2] is None
+    assert indicator[0] is None
+    with pytest.raises(IndexError):
+        indicator[-3]
+
+
+def test_shared_indicators():
+    parameter_sets = [
+        {"filename": "bitstamp_btcusd_day_2015.csv", "ma_short": ma_short, "ma_long": 20} for ma_short in (5, 10)
+    ]
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets, \
+            indicators.SharedIndicators(shared_datasets, "aspis_2") as shared_indicators:
+        handle = shared_indicators.load(parameter_sets)
+        assert [key for key, _ in handle.indicators] == ["rsi(7)", "sma(5)", "sma(10)", "sma(20)"]
+        # Indicators are calculated only once.
+        assert shared_indicators.load(parameter_sets[:1]).indicators == (
+            handle.indicators[0], handle.indicators[1], handle.indicators[3]
+        )
+
+        closes = [float(value) for value in datasets.attach(handle).close]
+        assert indicator_values(handle, "rsi", 7) == list(RSI(7, closes))
+        assert indicator_values(handle, "sma", 20) == list(SMA(20, closes))
+        assert indicator_values(handle.prefix(0.5), "sma", 5) == list(SMA(5, closes))[:181]
+        assert indicators.attach(handle, "sma", 30) is None
+        # Windows are warmed up with the bars before them.
+        assert indicator_values(handle.window(10, 20), "sma", 5) == list(SMA(5, closes))[10:20]
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(indicator_values, handle, "sma", 5).result() == list(SMA(5, closes))
+
+        detach(handle)
+        datasets.attach(handle).release()
+        datasets._attached.pop(handle.name)
+
+    # The shared memory blocks should be gone.
+    for _, block_name in handle.indicators:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block_name)
+
+
+def test_identical_datasets_share_indicators():
+    with tempfile.TemporaryDirectory() as data_dir:
+        for filename in ("a.csv", "b.csv"):
+            shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), os.path.join(data_dir, filename))
+
+        with datasets.SharedDatasets(data_dir) as shared_datasets, \
+                indicators.SharedIndicators(shared_datasets, "aspis_1") as shared_indicators:
+            handle_a = shared_indicators.load([{"filename": "a.csv"}])
+            handle_b = shared_indicators.load([{"filename": "b.csv"}])
+            assert handle_a.name != handle_b.name
+            assert handle_a.indicators == handle_b.indicators
+
+
+def test_stale_indicators_are_released():
+    with tempfile.TemporaryDirectory() as data_dir:
+        for filename in ("a.csv", "b.csv"):
+            shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), os.path.join(data_dir, filename))
+
+        with datasets.SharedDatasets(data_dir) as shared_datasets, \
+                indicators.SharedIndicators(shared_datasets, "aspis_1") as shared_indicators:
+            handle_a = shared_indicators.load([{"filename": "a.csv"}])
+            shared_indicators.load([{"filename": "b.csv"}])
+            assert indicator_values(handle_a, "rsi", 7)
+            # Detaching works even if the memory is still referenced.
+            block = indicators._attached[handle_a.indicators[0][1]]
+            view = memoryview(block.buf)
+
+            with open(os.path.join(data_dir, "a.csv"), "a") as f:
+                f.write("\n2016-01-01 00:00:00,430.89,430.89,430.89,430.89,1\n")
+            new_handle_a = shared_indicators.load([{"filename": "a.csv"}])
+            assert new_handle_a.indicators != handle_a.indicators
+            # Indicators are still used by the other dataset.
+            assert shared_indicators.release_stale(shared_datasets.release_stale()) == []
+
+            with open(os.path.join(data_dir, "b.csv"), "a") as f:
+                f.write("\n2016-01-01 00:00:00,430.89,430.89,430.89,430.89,1\n")
+            assert shared_indicators.load([{"filename": "b.csv"}]).indicators == new_handle_a.indicators
+            released = shared_indicators.release_stale(shared_datasets.release_stale())
+            assert released == [block_name for _, block_name in handle_a.indicators]
+
+            indicators.detach(released + ["missing"])
+            datasets.detach([handle_a.name])
+            for block_name in released:
+                assert block_name not in indicators._attached
+                with pytest.raises(FileNotFoundError):
+                    shared_memory.SharedMemory(name=block_name)
+            view.release()
+            block.close()
+
+
+def test_strategy_signals_match():
+    with datasets.SharedDatasets(abs_data_path("")) as shared_datasets, \
+            indicators.SharedIndicators(shared_datasets, "aspis_2") as shared_indicators:
+        handle = shared_indicators.load([{"filename": "bitstamp_btcusd_day_2015.csv", "ma_short": 5, "ma_long": 20}])
+        expected = trading_signals(handle)
+        signals = trading_signals(
+            handle,
+            rsi=indicators.attach(handle, "rsi", 7),
+            sma_short=indicators.attach(handle, "sma", 5),
+            sma_long=indicators.attach(handle, "sma", 20),
+        )
+        assert len(expected) > 0
+        assert signals == expected
+
+        detach(handle)
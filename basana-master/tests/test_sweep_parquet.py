@@ -0,0 +1,150 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import csv
+import datetime
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from .helpers import abs_data_path
+from .test_sweep_datasets import assert_same_bars, load_bars
+from basana.core import bar, errors
+from basana.core.pair import Pair
+from basana.external.bitstamp.csv import bars as csv_bars
+from basana.sweep import datasets, parquet, scheduling
+
+
+CSV_FILENAME = "bitstamp_btcusd_min_2020_01_01.csv"
+
+
+def write_string_parquet(path, row_group_size=100):
+    # Same values as in the CSV file, as strings, with an extra column that should not be read.
+    with open(abs_data_path(CSV_FILENAME)) as f:
+        rows = list(csv.DictReader(f))
+    columns = {column: [row[column] for row in rows] for column in datasets.COLUMNS}
+    columns["trades"] = list(range(len(rows)))
+    pq.write_table(pa.table(columns), path, row_group_size=row_group_size)
+
+
+def csv_bars_between(start=None, end=None):
+    pair = Pair("BTC", "USD")
+    return [
+        (when, bar) for when, bar in load_bars(csv_bars.BarSource(pair, abs_data_path(CSV_FILENAME), "1m"))
+        if (start is None or bar.datetime >= start) and (end is None or bar.datetime < end)
+    ]
+
+
+@pytest.mark.parametrize("filename", ["bars.parquet", "bars.arrow"])
+def test_bars_match_csv_bar_source(filename, tmp_path):
+    path = os.path.join(tmp_path, filename)
+    parquet.write(datasets.load_csv(abs_data_path(CSV_FILENAME)), path, row_group_size=100)
+    pair = Pair("BTC", "USD")
+    assert_same_bars(load_bars(parquet.BarSource(pair, path, "1m")), csv_bars_between())
+
+    dataset = parquet.load(path)
+    expected = datasets.load_csv(abs_data_path(CSV_FILENAME))
+    for column in datasets.COLUMNS:
+        assert np.array_equal(getattr(dataset, column), getattr(expected, column))
+
+
+def test_string_columns(tmp_path):
+    path = os.path.join(tmp_path, "bars.parquet")
+    write_string_parquet(path)
+    pair = Pair("BTC", "USD")
+    assert_same_bars(load_bars(parquet.BarSource(pair, path, "1m")), csv_bars_between())
+    assert len(datasets.load_file(path)) == len(datasets.load_csv(abs_data_path(CSV_FILENAME)))
+
+
+def test_naive_timestamp_and_decimal_columns(tmp_path):
+    path = os.path.join(tmp_path, "bars.parquet")
+    with open(abs_data_path(CSV_FILENAME)) as f:
+        rows = list(csv.DictReader(f))
+    columns = {
+        "datetime": pa.array(
+            [datetime.datetime.strptime(row["datetime"], "%Y-%m-%d %H:%M:%S") for row in rows], type=pa.timestamp("s")
+        ),
+        **{
+            column: pa.array([Decimal(row[column]) for row in rows], type=pa.decimal128(18, 8))
+            for column in datasets.COLUMNS[1:]
+        }
+    }
+    pq.write_table(pa.table(columns), path, row_group_size=100)
+    pair = Pair("BTC", "USD")
+    assert_same_bars(load_bars(parquet.BarSource(pair, path, "1m")), csv_bars_between())
+
+
+@pytest.mark.parametrize("start, end", [
+    (datetime.datetime(2020, 1, 1, 3, 15, tzinfo=datetime.timezone.utc), None),
+    (None, datetime.datetime(2020, 1, 1, 3, 15, tzinfo=datetime.timezone.utc)),
+    (datetime.datetime(2020, 1, 1, 3, 15), datetime.datetime(2020, 1, 1, 9, 30)),
+    (datetime.datetime(2021, 1, 1), None),
+])
+@pytest.mark.parametrize("string_columns", [False, True])
+def test_date_range(start, end, string_columns, tmp_path):
+    path = os.path.join(tmp_path, "bars.parquet")
+    if string_columns:
+        write_string_parquet(path)
+    else:
+        parquet.write(datasets.load_csv(abs_data_path(CSV_FILENAME)), path, row_group_size=100)
+
+    pair = Pair("BTC", "USD")
+    utc = datetime.timezone.utc
+    expected = csv_bars_between(
+        None if start is None else start.replace(tzinfo=utc), None if end is None else end.replace(tzinfo=utc)
+    )
+    assert_same_bars(load_bars(parquet.BarSource(pair, path, "1m", start=start, end=end)), expected)
+    assert len(parquet.load(path, start=start, end=end)) == len(expected)
+
+
+def test_scan_reads_the_range_and_ohlcv_columns_only(tmp_path):
+    path = os.path.join(tmp_path, "bars.parquet")
+    write_string_parquet(path)
+    start = datetime.datetime(2020, 1, 1, 23, tzinfo=datetime.timezone.utc)
+    batches = list(parquet.scan(path, start=start))
+    assert sum(batch.num_rows for batch in batches) == 60
+    assert batches[0].schema.names == list(datasets.COLUMNS)
+
+
+def test_invalid_files(tmp_path):
+    with pytest.raises(errors.Error, match="not a Parquet or Arrow file"):
+        parquet.BarSource(Pair("BTC", "USD"), abs_data_path(CSV_FILENAME), "1m")
+    with pytest.raises(errors.Error, match="not a Parquet or Arrow file"):
+        parquet.write(datasets.load_bars([]), os.path.join(tmp_path, "bars.csv"))
+
+    path = os.path.join(tmp_path, "bars.parquet")
+    pq.write_table(pa.table({"datetime": ["2020-01-01 00:00:00"], "close": [1.0]}), path)
+    with pytest.raises(errors.Error, match="missing columns"):
+        parquet.load(path)
+
+
+def test_cost_model_counts_bars(tmp_path):
+    parquet.write(datasets.load_csv(abs_data_path(CSV_FILENAME)), os.path.join(tmp_path, "bars.parquet"))
+    assert scheduling.CostModel(tmp_path).bars("bars.parquet") == 1395
+
+
+def test_invalid_bars(tmp_path):
+    path = os.path.join(tmp_path, "bars.parquet")
+    pq.write_table(pa.table({
+        "datetime": ["2020-01-01 00:00:00"], "open": [1.0], "high": [0.5], "low": [1.0], "close": [1.0],
+        "volume": [1.0]
+    }), path)
+    with pytest.raises(bar.InvalidBar, match="high < low on 2020-01-01 00:00:00"):
+        parquet.load(path)
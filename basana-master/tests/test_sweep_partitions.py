@@ -0,0 +1,126 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from .test_sweep_datasets import assert_same_bars, load_bars
+from basana.core import errors
+from basana.core.pair import Pair
+from basana.sweep import datasets, partitions, resample
+
+
+def daily_partitions():
+    # Bars for 2015 and 2020, plus 2020 bars aggregated from minute bars, which overlap with the other ones.
+    return {
+        Pair("BTC", "USD"): datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv"), use_store=False),
+        Pair("BTC", "USDT"): datasets.load_csv(abs_data_path("binance_btcusdt_day_2020.csv"), use_store=False),
+        Pair("ETH", "USDT"): resample.resample(
+            datasets.load_csv(abs_data_path("bitstamp_btcusd_min_2020_01_01.csv"), use_store=False), "1d"
+        ),
+    }
+
+
+def expected_bars(partitions_by_pair, period):
+    ret = []
+    for p, dataset in partitions_by_pair.items():
+        ret.extend(load_bars(datasets.BarSource(p, dataset, period)))
+    # Stable, so bars with the same datetime stay in partition order.
+    ret.sort(key=lambda when_and_bar: when_and_bar[0])
+    return ret
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 100, partitions.BLOCK_SIZE])
+def test_merged_bar_source(block_size):
+    partitions_by_pair = daily_partitions()
+    bars = load_bars(partitions.MergedBarSource(partitions_by_pair, "1d", block_size=block_size))
+    assert len(bars) == sum(len(dataset) for dataset in partitions_by_pair.values())
+    assert_same_bars(bars, expected_bars(partitions_by_pair, "1d"))
+    # Bars with the same datetime are ordered by partition.
+    assert [bar.pair for _, bar in bars[362:364]] == [Pair("BTC", "USDT"), Pair("ETH", "USDT")]
+
+
+def test_merge_with_repeated_datetimes():
+    timestamps = np.array([10, 10, 10, 20, 20, 30], dtype=np.int64)
+    values = np.ones(len(timestamps))
+    dataset = datasets.Dataset(timestamps, values, values, values, values, values)
+    other = dataset.slice(2)
+
+    blocks = list(partitions.merge([dataset, other], block_size=1))
+    merged = np.concatenate([block_timestamps for block_timestamps, _, _ in blocks])
+    assert merged.tolist() == [10, 10, 10, 10, 20, 20, 20, 20, 30, 30]
+    partition_indices = np.concatenate([indices for _, indices, _ in blocks])
+    assert partition_indices.tolist() == [0, 0, 0, 1, 0, 0, 1, 1, 0, 1]
+
+
+def test_store(tmp_path):
+    path = os.path.join(tmp_path, "universe")
+    partitions_by_pair = daily_partitions()
+    partitions.write(partitions_by_pair, path, period="1d")
+    assert sorted(os.listdir(path)) == ["BTC-USD.bars", "BTC-USDT.bars", "ETH-USDT.bars"]
+    assert partitions.read_period(path) == "1d"
+
+    # Other files in the store are ignored.
+    with open(os.path.join(path, "README.txt"), "w") as f:
+        f.write("Daily bars")
+    loaded = partitions.load(path)
+    assert list(loaded.keys()) == list(partitions_by_pair.keys())
+    for p, dataset in partitions_by_pair.items():
+        assert np.array_equal(loaded[p].close, dataset.close)
+
+    assert_same_bars(load_bars(partitions.BarSource(path)), expected_bars(partitions_by_pair, "1d"))
+
+    pairs = [Pair("ETH", "USDT"), Pair("BTC", "USD")]
+    src = partitions.BarSource(path, pairs=pairs)
+    assert src.pairs == pairs
+    assert_same_bars(
+        load_bars(src), expected_bars({p: partitions_by_pair[p] for p in pairs}, "1d")
+    )
+
+    with pytest.raises(errors.Error, match="no partitions"):
+        partitions.BarSource(path, pairs=[Pair("SOL", "USDT")])
+
+
+def test_errors(tmp_path):
+    dataset = datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv"), use_store=False)
+    unsorted = datasets.Dataset(*[getattr(dataset, column)[::-1] for column in datasets.COLUMNS])
+    with pytest.raises(errors.Error, match="should be sorted"):
+        partitions.write({Pair("BTC", "USD"): unsorted}, tmp_path)
+    with pytest.raises(errors.Error, match="should be sorted"):
+        partitions.MergedBarSource({Pair("BTC", "USD"): unsorted}, "1d")
+
+    partitions.write({Pair("BTC", "USD"): dataset}, tmp_path)
+    with pytest.raises(errors.Error, match="period is not set"):
+        partitions.BarSource(tmp_path)
+    with pytest.raises(errors.Error, match="not a partitioned store"):
+        partitions.load(os.path.join(tmp_path, "missing"))
+
+
+def test_main(tmp_path, capsys):
+    path = os.path.join(tmp_path, "universe")
+    partitions.main([
+        "-o", path, "-p", "1d", f"BTC/USD={abs_data_path('bitstamp_btcusd_day_2015.csv')}",
+        f"BTC/USDT={abs_data_path('binance_btcusdt_day_2020.csv')}",
+    ])
+    assert "BTC/USD: 362 bars" in capsys.readouterr().out
+    assert list(partitions.load(path).keys()) == [Pair("BTC", "USD"), Pair("BTC", "USDT")]
+
+    with pytest.raises(SystemExit):
+        partitions.main(["-o", path, abs_data_path("bitstamp_btcusd_day_2015.csv")])
+    assert "Expected PAIR=FILE" in capsys.readouterr().err
@@ -0,0 +1,62 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import asyncio
+import datetime
+import os
+
+from . import helpers
+from basana.backtesting import exchange
+from basana.core.enums import OrderOperation
+from basana.core.pair import Pair
+from basana.external.yahoo import bars
+from basana.sweep import recording
+
+
+def test_record_and_save(backtesting_dispatcher):
+    pair = Pair("ORCL", "USD")
+    e = exchange.Exchange(backtesting_dispatcher, {"USD": Decimal("1e6")})
+    recorder = recording.Recorder(e, pair)
+
+    async def on_bar(bar_event):
+        if bar_event.when.date() == datetime.date(2000, 1, 4):
+            await e.create_market_order(OrderOperation.BUY, pair, Decimal("2"))
+        elif bar_event.when.date() == datetime.date(2000, 1, 14):
+            await e.create_market_order(OrderOperation.SELL, pair, Decimal("1"))
+
+    async def impl():
+        e.add_bar_source(bars.CSVBarSource(pair, helpers.abs_data_path("orcl-2000-yahoo-sorted.csv")))
+        e.subscribe_to_bar_events(pair, on_bar)
+        await backtesting_dispatcher.run()
+
+        assert len(recorder) == 252
+        assert len(recorder.closes) == 252
+        assert recorder.datetimes()[0].date() == datetime.date(2000, 1, 4)
+        assert recorder.portfolio_values[0] == 1e6
+        assert recorder.portfolio_values[-1] != 1e6
+
+        buy_dates, buy_prices = recorder.fills(OrderOperation.BUY)
+        sell_dates, sell_prices = recorder.fills(OrderOperation.SELL)
+        assert [when.date() for when in buy_dates] == [datetime.date(2000, 1, 5)]
+        assert [when.date() for when in sell_dates] == [datetime.date(2000, 1, 15)]
+        assert buy_prices[0] > 0 and sell_prices[0] > 0
+
+        with helpers.temp_file_name(suffix=".png") as tmp_file_name:
+            recorder.save(tmp_file_name)
+            assert os.stat(tmp_file_name).st_size > 100
+
+    asyncio.run(impl())
@@ -0,0 +1,49 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("plotly")
+
+from basana.sweep import report  # noqa: E402
+
+
+def test_visualize(monkeypatch):
+    figures = []
+    monkeypatch.setattr(report.go.Figure, "show", lambda self: figures.append(self))
+
+    results = [
+        {
+            "symbol": "BTC", "profit": Decimal(value), "sharpe": Decimal(value) / 10, "max_drawdown": Decimal("0.1"),
+            "value": value
+        }
+        for value in range(30)
+    ]
+    # Results without a sharpe ratio are skipped.
+    results.append({"symbol": "BTC", "profit": Decimal(0), "sharpe": Decimal("NaN"), "max_drawdown": 0, "value": 30})
+    results.append({"symbol": "BTC", "profit": Decimal(0), "sharpe": None, "max_drawdown": 0, "value": 31})
+    report.visualize(results, ["symbol", "timeframe", "sharpe", "value"], top=5)
+    assert len(figures) == 2
+
+    scatter, table = figures
+    histograms = [trace for trace in scatter.data if trace.type == "histogram"]
+    assert len(scatter.data) == 9 and len(histograms) == 3
+    assert len(histograms[0].x) == 30
+
+    assert list(table.data[0].header.values) == ["Symbol", "Sharpe", "Value"]
+    assert list(table.data[0].cells.values[2]) == ["29", "28", "27", "26", "25"]
@@ -0,0 +1,147 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from .test_sweep_datasets import load_bars
+from basana.core import dt, errors
+from basana.core.pair import Pair
+from basana.sweep import barstore, datasets, resample, scheduling
+
+
+def aggregate(bars, step):
+    # The straightforward version, one bar at a time.
+    ret = {}
+    for bar in bars:
+        timestamp = dt.to_utc_timestamp(bar.datetime)
+        begin = timestamp - timestamp % step
+        current = ret.get(begin)
+        if current is None:
+            ret[begin] = [bar.open, bar.high, bar.low, bar.close, bar.volume]
+        else:
+            current[1] = max(current[1], bar.high)
+            current[2] = min(current[2], bar.low)
+            current[3] = bar.close
+            current[4] += bar.volume
+    return ret
+
+
+@pytest.mark.parametrize("period, step", [("5m", 300), ("1h", 3600), ("1d", 86400)])
+def test_resample(period, step, csv_path):
+    source = datasets.load_csv(csv_path, use_store=False)
+    dataset = resample.resample(source, period)
+    base_bars = [bar for _, bar in load_bars(datasets.BarSource(Pair("BTC", "USD"), source, "1m"))]
+    expected = aggregate(base_bars, step)
+
+    assert list(dataset.datetime) == list(expected.keys())
+    for i, values in enumerate(expected.values()):
+        for column, value in zip(datasets.COLUMNS[1:], values):
+            assert getattr(dataset, column)[i] == pytest.approx(float(value))
+
+
+def test_resample_errors():
+    with pytest.raises(errors.Error, match="Invalid period"):
+        resample.resample(datasets.load_bars([]), "7m")
+
+    assert len(resample.resample(datasets.load_bars([]), "1h")) == 0
+
+    dataset = datasets.load_csv(abs_data_path("bitstamp_btcusd_day_2015.csv"), use_store=False)
+    unsorted = datasets.Dataset(*[getattr(dataset, column)[::-1] for column in datasets.COLUMNS])
+    with pytest.raises(errors.Error, match="sorted"):
+        resample.resample(unsorted, "3d")
+
+
+def test_split_path():
+    assert resample.split_path("data/BTCUSDT1M.csv@4h") == ("data/BTCUSDT1M.csv", "4h")
+    assert resample.split_path("data/BTCUSDT1M.csv") == ("data/BTCUSDT1M.csv", None)
+    assert resample.split_path("data/user@host.csv") == ("data/user@host.csv", None)
+    assert datasets.source_path("data/BTCUSDT1M.csv@1d") == "data/BTCUSDT1M.csv"
+
+
+def test_cache(csv_path):
+    path = resample.cache_path(csv_path, "1h")
+    assert os.path.dirname(path) == os.path.join(os.path.dirname(csv_path), resample.CACHE_DIRNAME)
+    assert not os.path.exists(path)
+
+    dataset = resample.load(csv_path, "1h")
+    assert os.path.exists(path)
+    assert len(dataset) == 24
+    assert isinstance(dataset.close, np.memmap)
+    assert resample.cache_path(csv_path, "4h") != path
+
+    # Sweeps load resampled datasets using the period in the filename.
+    same = datasets.load_file(f"{csv_path}@1h")
+    assert np.array_equal(same.close, dataset.close)
+
+    # Changes to the source file result in a different cache entry.
+    with open(csv_path, "a") as f:
+        f.write("2020-01-02 00:00:00,7200,7210,7190,7205,1.5\n")
+    assert resample.cache_path(csv_path, "1h") != path
+    dataset = resample.load(csv_path, "1h")
+    assert len(dataset) == 25
+    assert dataset.close[-1] == 7205
+
+
+def test_bar_source(csv_path):
+    bars = load_bars(resample.BarSource(Pair("BTC", "USD"), csv_path, "4h"))
+    assert len(bars) == 6
+    when, bar = bars[0]
+    assert bar.datetime == datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    assert when == datetime.datetime(2020, 1, 1, 4, tzinfo=datetime.timezone.utc)
+    assert bar.open == Decimal("7160.69")
+
+
+def test_cost_model(csv_path):
+    cost_model = scheduling.CostModel(os.path.dirname(csv_path))
+    filename = os.path.basename(csv_path)
+    assert cost_model.bars(f"{filename}@1h") == 24
+    with pytest.raises(errors.Error, match="not found"):
+        cost_model.bars("missing.csv@1h")
+
+
+def test_concurrent_writes(csv_path, monkeypatch):
+    write = barstore.write
+
+    def lose_the_race(dataset, path, **kwargs):
+        # Another process writes the store first, and the rename fails.
+        write(dataset, path, **kwargs)
+        raise OSError("Directory not empty")
+
+    monkeypatch.setattr(barstore, "write", lose_the_race)
+    assert len(resample.load(csv_path, "1h")) == 24
+
+    def fail(dataset, path, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(barstore, "write", fail)
+    with pytest.raises(OSError, match="No space left"):
+        resample.load(csv_path, "4h")
+
+
+def test_main(csv_path, capsys):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        resample.main(["-p", "1h", "-p", "4h", "-c", cache_dir, csv_path])
+        assert len(os.listdir(cache_dir)) == 2
+    out = capsys.readouterr().out
+    assert f"{csv_path}@1h: 24 bars" in out
+    assert f"{csv_path}@4h: 6 bars" in out
@@ -0,0 +1,63 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+
+import pytest
+
+from .helpers import temp_file_name
+from basana.sweep import results
+
+
+def test_params_key():
+    params = {"symbol": "BTC/USDT", "stop_loss": Decimal("2.5"), "oversold_level": Decimal("75")}
+    reordered = {"oversold_level": Decimal("75"), "symbol": "BTC/USDT", "stop_loss": Decimal("2.5")}
+
+    assert results.params_key(params) == results.params_key(reordered)
+    assert results.params_key(params) == results.params_key({**params, "dataset": "ignored"})
+    assert results.params_key(params) != results.params_key({**params, "stop_loss": Decimal("3")})
+
+
+def test_dumps_and_loads():
+    obj = {"sizing": Decimal("1500.50"), "name": "aspis1", "levels": [Decimal(1), 2]}
+    assert results.loads(results.dumps(obj)) == obj
+
+    with pytest.raises(TypeError):
+        results.dumps({"value": object()})
+
+
+def test_store_and_resume():
+    parameter_sets = [{"symbol": "BTC/USDT", "sizing": Decimal(sizing)} for sizing in (1000, 1500, 2000)]
+
+    with temp_file_name(suffix=".sqlite") as path:
+        with results.ResultsStore(path) as store:
+            assert len(store) == 0
+            store.add({**parameter_sets[1], "dataset": "ignored"}, {"profit": 1.5, "sharpe": Decimal("0.7")})
+            assert store.get(parameter_sets[1]) is not None
+            assert store.get(parameter_sets[0]) is None
+
+        # Results survive reopening the store.
+        with results.ResultsStore(path) as store:
+            assert len(store) == 1
+            assert list(store) == [
+                {"symbol": "BTC/USDT", "sizing": Decimal(1500), "profit": 1.5, "sharpe": Decimal("0.7")}
+            ]
+
+            assert store.get(parameter_sets[1]) == list(store)[0]
+            assert store.get(parameter_sets[0]) is None
+
+            store.clear()
+            assert len(store) == 0
@@ -0,0 +1,461 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from .helpers import abs_data_path, temp_file_name
+from basana.core import errors
+from basana.sweep import cache, daemon, executors, results, runner, scheduling, space, telemetry
+
+
+async def backtest(name, symbol, filename, value, scale=1, dataset=None, chart_path=None):
+    # No chart is saved for 0, as if it failed to render.
+    if chart_path is not None and value:
+        with open(chart_path, "w") as f:
+            f.write(str(value))
+    return {"profit": value * scale, "sharpe": Decimal(value), "max_drawdown": Decimal("0.5")}
+
+
+async def aspis_backtest(
+        symbol, filename, oversold_level, overbought_level, initial_capital, sizing, stop_loss, dataset=None
+):
+    return {"profit": Decimal(oversold_level), "sharpe": Decimal(1), "max_drawdown": Decimal(0)}
+
+
+def test_load_strategy():
+    assert runner.load_strategy("tests.test_sweep_runner").backtest is backtest
+    with pytest.raises(errors.Error, match="backtest function"):
+        runner.load_strategy("tests.helpers")
+
+
+def test_parameters():
+    assert runner.strategy_name("samples.aspis_1") == "aspis_1"
+    assert runner.parameters(backtest) == {"name": None, "symbol": None, "filename": None, "value": None, "scale": 1}
+    assert runner.report_columns(backtest) == [
+        "symbol", "timeframe", "profit", "sharpe", "max_drawdown", "value", "scale"
+    ]
+
+
+def test_validate():
+    params = {"name": "test", "symbol": "BTC", "filename": "btc.csv", "value": 1}
+    assert list(runner.validate([params, params], backtest)) == [params, params]
+    with pytest.raises(errors.Error, match="Unknown parameters \\['other'\\]"):
+        list(runner.validate([{**params, "other": 1}], backtest))
+    with pytest.raises(errors.Error, match="Missing parameters \\['value'\\]"):
+        list(runner.validate([{"name": "test", "symbol": "BTC", "filename": "btc.csv"}], backtest))
+
+
+def test_generate_parameter_sets():
+    with tempfile.TemporaryDirectory() as config_dir:
+        configs = {
+            "symbol_data_test.json": [{"symbol": "BTC", "filename": "btc.csv"}],
+            "constant_params_test.json": {"name": "test", "symbol": "default"},
+            "varying_params_test.json": {"value": {"start": 1, "stop": 3, "step": 1}, "__constraints__": ["value > 1"]},
+        }
+        for filename, config in configs.items():
+            with open(os.path.join(config_dir, filename), "w") as f:
+                json.dump(config, f)
+
+        parameter_sets = list(runner.generate_parameter_sets(config_dir, "test"))
+    assert parameter_sets == [
+        {"symbol": "BTC", "filename": "btc.csv", "name": "test", "value": Decimal(value)} for value in (2, 3)
+    ]
+
+
+def test_run():
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(10)
+    ]
+
+    with temp_file_name(suffix=".sqlite") as path:
+        with results.ResultsStore(path) as results_store:
+            sweep_telemetry = telemetry.Telemetry()
+            mass_backtest = runner.MassBacktest(
+                backtest, batched=True, results_store=results_store, telemetry=sweep_telemetry,
+                executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+            )
+            # Parameter sets are consumed lazily.
+            mass_backtest.run(params for params in parameter_sets)
+            assert sorted(result["profit"] for result in mass_backtest.results) == list(range(10))
+            assert mass_backtest.get_best_result()["value"] == 9
+            assert len(results_store) == 10
+            assert sweep_telemetry.summary()["backtests"] == 10
+
+            mass_backtest = runner.MassBacktest(
+                backtest, results_store=results_store,
+                executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+            )
+            mass_backtest.run(parameter_sets + [{**parameter_sets[0], "value": Decimal(10)}], resume=True)
+            assert len(mass_backtest.results) == 11
+            assert len(results_store) == 11
+
+
+def test_run_updates_the_expected_backtests_while_consuming_a_parameter_space():
+    parameter_space = space.ParameterSpace.from_config(
+        {"value": [Decimal(value) for value in range(10)], space.CONSTRAINTS_KEY: ["value % 3 == 0"]},
+        constants={"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv"},
+    )
+    sweep_telemetry = telemetry.Telemetry()
+    mass_backtest = runner.MassBacktest(
+        backtest, telemetry=sweep_telemetry,
+        executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+    )
+    mass_backtest.run(parameter_space)
+    assert len(mass_backtest.results) == 4
+    assert sweep_telemetry.summary()["backtests"] == 4
+    assert sweep_telemetry._expected == 4
+
+
+def test_render_charts():
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(5)
+    ]
+    mass_backtest = runner.MassBacktest(
+        backtest, executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+    )
+    mass_backtest.run(parameter_sets)
+
+    with tempfile.TemporaryDirectory() as chart_dir:
+        with executors.LocalExecutor(abs_data_path(""), max_workers=1) as executor:
+            paths = mass_backtest.render_charts(executor, os.path.join(chart_dir, "charts"), 3)
+        assert [os.path.basename(path)[:4] for path in paths] == ["001_", "002_", "003_"]
+        # Only the best results get charted, in rank order.
+        for path, value in zip(paths, ("4", "3", "2")):
+            with open(path) as f:
+                assert f.read() == value
+
+
+def test_run_scheduled():
+    parameter_sets = [
+        {"name": "test", "symbol": symbol, "filename": filename, "value": Decimal(value)}
+        for symbol, filename in (("BTC", "bitstamp_btcusd_day_2015.csv"), ("BTC", "bitstamp_btcusd_min_2020_01_01.csv"))
+        for value in range(10)
+    ]
+    sweep_telemetry = telemetry.Telemetry()
+    mass_backtest = runner.MassBacktest(
+        backtest, data_dir=abs_data_path(""), batched=True, telemetry=sweep_telemetry,
+        cost_model=scheduling.CostModel(abs_data_path("")),
+        executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+    )
+    mass_backtest.run(params for params in parameter_sets)
+    assert sorted(result["profit"] for result in mass_backtest.results) == sorted(list(range(10)) * 2)
+    assert sweep_telemetry.summary()["backtests"] == 20
+
+    mass_backtest.run_walk_forward(parameter_sets[:10], 100, 100)
+    assert mass_backtest.results
+
+
+def test_run_with_cache(capsys):
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(5)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "data")
+        os.makedirs(data_dir)
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), data_dir)
+        with cache.ResultCache(os.path.join(tmp_dir, "cache.sqlite"), backtest, data_dir) as result_cache:
+            for found in (0, 5):
+                sweep_telemetry = telemetry.Telemetry()
+                mass_backtest = runner.MassBacktest(
+                    backtest, data_dir=data_dir, result_cache=result_cache, telemetry=sweep_telemetry,
+                    executor_factory=lambda: executors.LocalExecutor(data_dir, max_workers=1)
+                )
+                mass_backtest.run(parameter_sets)
+                assert sorted(result["profit"] for result in mass_backtest.results) == list(range(5))
+                assert f"Found {found} results in the cache" in capsys.readouterr().out
+                assert sweep_telemetry.summary()["backtests"] == 5 - found
+                # Cached results are not expected to run.
+                assert sweep_telemetry._expected == 5 - found
+
+
+def test_run_prescreened(capsys):
+    parameter_sets = [
+        {
+            "symbol": "BTC", "filename": "binance_btcusdt_day_2020.csv", "oversold_level": oversold,
+            "overbought_level": 70, "initial_capital": 10000, "sizing": 1000, "stop_loss": 5,
+        }
+        for oversold in range(20, 45, 5)
+    ]
+    sweep_telemetry = telemetry.Telemetry()
+    mass_backtest = runner.MassBacktest(
+        aspis_backtest, strategy="aspis_1", data_dir=abs_data_path(""), telemetry=sweep_telemetry,
+        executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+    )
+    mass_backtest.run(parameter_sets, prescreen_top=2)
+    assert "Pre-screening kept 2 out of 5 parameter sets" in capsys.readouterr().out
+    assert len(mass_backtest.results) == 2
+    assert sweep_telemetry.summary()["backtests"] == 2
+    assert sweep_telemetry._expected == 2
+
+
+@pytest.mark.parametrize("cost_model", [None, scheduling.CostModel(abs_data_path(""), seconds_per_bar=0.001)])
+def test_run_successive_halving(cost_model, capsys):
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(9)
+    ]
+    with temp_file_name(suffix=".sqlite") as path:
+        with results.ResultsStore(path) as results_store:
+            sweep_telemetry = telemetry.Telemetry()
+            mass_backtest = runner.MassBacktest(
+                backtest, data_dir=abs_data_path(""), batched=True, results_store=results_store,
+                telemetry=sweep_telemetry, cost_model=cost_model,
+                executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+            )
+            mass_backtest.run_successive_halving(parameter_sets, rungs=2, eta=3)
+            assert sorted(result["value"] for result in mass_backtest.results) == [6, 7, 8]
+            assert len(results_store) == 3
+            assert sweep_telemetry.summary()["backtests"] == 12
+
+    output = capsys.readouterr().out
+    assert "Evaluating 9 parameter sets on 33.3% of the data" in output
+    assert "Evaluating 3 parameter sets on 100.0% of the data" in output
+    assert ("Estimated time" in output) == (cost_model is not None)
+
+
+def test_run_walk_forward_with_results_store():
+    parameter_sets = [
+        {"name": "test", "symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv", "value": Decimal(value)}
+        for value in range(3)
+    ]
+    with temp_file_name(suffix=".sqlite") as path:
+        with results.ResultsStore(path) as results_store:
+            mass_backtest = runner.MassBacktest(
+                backtest, data_dir=abs_data_path(""), results_store=results_store,
+                executor_factory=lambda: executors.LocalExecutor(abs_data_path(""), max_workers=1)
+            )
+            mass_backtest.run_walk_forward(parameter_sets, 100, 100)
+            # The best parameter set for each window.
+            assert [result["value"] for result in mass_backtest.results] == [2, 2, 2]
+            assert len(results_store) == 3
+
+
+def test_failed_backtests_are_skipped(capsys):
+    mass_backtest = runner.MassBacktest(backtest)
+    mass_backtest.add_result({"value": 1}, None)
+    assert mass_backtest.results == []
+    assert "Warning: backtest returned None for params: {'value': 1}" in capsys.readouterr().out
+
+
+def write_configs(config_dir, values, constraints=[]):
+    configs = {
+        "symbol_data_test_sweep_runner.json": [{"symbol": "BTC", "filename": "bitstamp_btcusd_day_2015.csv"}],
+        "constant_params_test_sweep_runner.json": {"name": "test"},
+        "varying_params_test_sweep_runner.json": {"value": values, "__constraints__": constraints},
+    }
+    for filename, config in configs.items():
+        with open(os.path.join(config_dir, filename), "w") as f:
+            json.dump(config, f)
+
+
+def main_args(tmp_dir, *args):
+    return [
+        "--strategy", "tests.test_sweep_runner", "--config-dir", tmp_dir, "--data-dir", abs_data_path(""),
+        "--results", os.path.join(tmp_dir, "results.sqlite"), "--telemetry", os.path.join(tmp_dir, "t.jsonl"),
+        "--workers", "1", *args
+    ]
+
+
+def test_main(monkeypatch, capsys):
+    batch_sizes = []
+    etas = []
+    batch_size = runner.MassBacktest._batch_size
+    record = telemetry.Telemetry.record
+
+    def spy_batch_size(self, executor, count):
+        batch_sizes.append(batch_size(self, executor, count))
+        return batch_sizes[-1]
+
+    def spy_record(self, parameter_sets, stats):
+        record(self, parameter_sets, stats)
+        etas.append(self.eta())
+
+    monkeypatch.setattr(runner.MassBacktest, "_batch_size", spy_batch_size)
+    monkeypatch.setattr(telemetry.Telemetry, "record", spy_record)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, {"start": 1, "stop": 40, "step": 1})
+        runner.main(main_args(tmp_dir, "--no-cache", "--no-schedule", "--no-report", "--charts", "0"))
+
+    assert "40 backtests" in capsys.readouterr().out
+    # Parameter sets are batched and the time left is estimated, even though they are generated lazily.
+    assert batch_sizes == [10]
+    assert etas and all(eta is not None for eta in etas)
+
+
+def test_main_module(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["basana.sweep", "--strategy", "tests.test_sweep_runner", "--describe"])
+    runpy.run_module("basana.sweep", run_name="__main__")
+    assert capsys.readouterr().out.splitlines() == ["name", "symbol", "filename", "value", "scale (default: 1)"]
+
+
+@pytest.mark.parametrize("search, extra_args, expected", [
+    ("halving", [], [2, 3, 4]),
+    ("walkforward", [], [4, 4, 4]),
+    ("walkforward", ["--step", "50"], [4, 4, 4, 4, 4, 4]),
+])
+def test_main_searches(search, extra_args, expected, capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [0, 1, 2, 3, 4])
+        args = main_args(
+            tmp_dir, "--no-cache", "--no-report", "--charts", "0", "--search", search, "--rungs", "2", "--eta", "2",
+            "--in-sample", "100", "--out-of-sample", "100", *extra_args
+        )
+        # The second time, the cost per bar is taken from the telemetry of the first run.
+        for _ in range(2):
+            runner.main(args)
+            with results.ResultsStore(os.path.join(tmp_dir, "results.sqlite")) as results_store:
+                assert sorted(result["value"] for result in results_store) == expected
+    assert "Estimated time" in capsys.readouterr().out
+
+
+def test_main_with_charts_and_report(monkeypatch, capsys):
+    reports = []
+
+    class Report:
+        # Plotting libraries are not required to run the tests.
+        @staticmethod
+        def visualize(results, columns):
+            reports.append((results, columns))
+
+    monkeypatch.setitem(sys.modules, "basana.sweep.report", Report)
+    monkeypatch.setattr("basana.sweep.report", Report, raising=False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [0, 1, 2])
+        chart_dir = os.path.join(tmp_dir, "charts")
+        runner.main(main_args(tmp_dir, "--no-cache", "--charts", "5", "--chart-dir", chart_dir))
+        # The chart for the third result was not saved.
+        assert sorted(filename[:4] for filename in os.listdir(chart_dir)) == ["001_", "002_"]
+
+    output = capsys.readouterr().out
+    assert "Warning: failed to save chart" in output
+    assert f"Saved 3 charts to {chart_dir}" in output
+    assert "Best result:" in output
+    results, columns = reports[0]
+    assert sorted(result["value"] for result in results) == [0, 1, 2]
+    assert columns == runner.report_columns(backtest)
+
+
+def test_main_cache_depends_on_the_strategy_settings(monkeypatch, capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [1, 2])
+        # Keys for CSV files are taken from their manifests, which get written next to them.
+        data_dir = os.path.join(tmp_dir, "data")
+        os.makedirs(data_dir)
+        shutil.copy(abs_data_path("bitstamp_btcusd_day_2015.csv"), data_dir)
+        args = main_args(
+            tmp_dir, "--data-dir", data_dir, "--cache", os.path.join(tmp_dir, "cache.sqlite"), "--no-report",
+            "--charts", "0"
+        )
+        runner.main(args)
+        assert "2 backtests" in capsys.readouterr().out
+        runner.main(args)
+        assert "0 backtests" in capsys.readouterr().out
+
+        monkeypatch.setattr(sys.modules[__name__], "SETTINGS", {"fee": Decimal("0.1")}, raising=False)
+        runner.main(args)
+        assert "2 backtests" in capsys.readouterr().out
+
+
+def test_main_adds_the_progress_handler_once(monkeypatch):
+    monkeypatch.setattr(telemetry.logger, "handlers", [])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [1])
+        for _ in range(2):
+            runner.main(main_args(tmp_dir, "--no-cache", "--no-report", "--charts", "0"))
+    assert len(telemetry.logger.handlers) == 1
+
+
+def test_main_without_results(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [1, 2], constraints=["value > 2"])
+        runner.main(main_args(tmp_dir, "--no-cache"))
+    assert "No results." in capsys.readouterr().out
+
+
+def test_main_requires_an_authkey(monkeypatch, capsys):
+    monkeypatch.delenv("BASANA_SWEEP_AUTHKEY", raising=False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [1, 2])
+        with pytest.raises(SystemExit):
+            runner.main(main_args(tmp_dir, "--no-cache", "--serve", "127.0.0.1:0", "--authkey", ""))
+    assert "An authentication key is required" in capsys.readouterr().err
+
+
+def test_main_serving_agents(monkeypatch, capsys):
+    stop_event = threading.Event()
+    agents = []
+
+    class QueueExecutor(executors.QueueExecutor):
+        # Starts an agent for the port that was picked.
+        def __init__(self, address, authkey, max_workers=None):
+            super().__init__(address, authkey, max_workers=max_workers)
+            agent = threading.Thread(
+                target=executors.run_agent, args=(self.address, authkey, abs_data_path("")),
+                kwargs={"max_workers": 1, "poll_interval": 0.1, "stop_event": stop_event},
+            )
+            agent.start()
+            agents.append(agent)
+
+        def close(self):
+            stop_event.set()
+            for agent in agents:
+                agent.join()
+            super().close()
+
+    monkeypatch.setattr(executors, "QueueExecutor", QueueExecutor)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_configs(tmp_dir, [1, 2, 3])
+        runner.main(main_args(
+            tmp_dir, "--no-cache", "--no-report", "--charts", "0", "--serve", "127.0.0.1:0", "--authkey", "secret"
+        ))
+    assert len(agents) == 1
+    assert "3 backtests" in capsys.readouterr().out
+
+
+def test_main_using_a_daemon(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        address = os.path.join(tmp_dir, "sweep.sock")
+        server = daemon.Server(
+            address, b"secret", abs_data_path(""), max_workers=1, preload=["tests.test_sweep_runner"]
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            write_configs(tmp_dir, [1, 2, 3])
+            chart_dir = os.path.join(tmp_dir, "charts")
+            runner.main(main_args(
+                tmp_dir, "--no-cache", "--no-report", "--charts", "1", "--chart-dir", chart_dir, "--daemon", address,
+                "--authkey", "secret"
+            ))
+        finally:
+            server.close()
+            thread.join()
+        # Charts are rendered by the daemon too.
+        assert len(os.listdir(chart_dir)) == 1
+    assert "3 backtests" in capsys.readouterr().out
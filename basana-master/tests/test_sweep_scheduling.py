@@ -0,0 +1,95 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import pytest
+
+from .helpers import abs_data_path, temp_file_name
+from basana.core import errors
+from basana.sweep import scheduling
+
+
+def test_cost_model():
+    cost_model = scheduling.CostModel(abs_data_path(""))
+    params = {"filename": "bitstamp_btcusd_day_2015.csv"}
+    assert cost_model.bars("bitstamp_btcusd_day_2015.csv") == 364
+    assert cost_model.cost(params) == 364
+    assert cost_model.cost(params, fraction=0.5) == 182
+    assert cost_model.cost(params, start=100, stop=200) == 100
+    assert cost_model.cost(params, start=300, stop=1000) == 64
+    assert cost_model.cost({}) == 1
+
+    with pytest.raises(errors.Error, match="not found"):
+        cost_model.bars("missing.csv")
+
+
+def test_cost_model_from_telemetry():
+    with temp_file_name(suffix=".jsonl") as path:
+        assert scheduling.CostModel.from_telemetry("data", path).seconds_per_bar is None
+
+        with open(path, "w") as f:
+            f.write(json.dumps({"type": "task", "bars": 1000, "wall_time": 1}) + "\n")
+            f.write(json.dumps({"type": "task", "bars": 3000, "wall_time": 1}) + "\n")
+            f.write(json.dumps({"type": "summary", "bars": 4000, "wall_time": 2}) + "\n")
+            f.write('{"type": "ta')
+        cost_model = scheduling.CostModel.from_telemetry(abs_data_path(""), path)
+        assert cost_model.seconds_per_bar == 0.0005
+        assert cost_model.cost({"filename": "bitstamp_btcusd_day_2015.csv"}) == pytest.approx(0.182)
+
+
+def test_schedule_longest_first():
+    bars = {"1m.csv": 60, "1h.csv": 1}
+    parameter_sets = [
+        {"symbol": "BTC", "filename": filename, "value": value} for filename in ("1h.csv", "1m.csv")
+        for value in range(20)
+    ]
+    scheduled = scheduling.schedule(parameter_sets, lambda params: bars[params["filename"]], 2, 256)
+
+    # Every parameter set is scheduled exactly once, in batches that share a dataset.
+    assert sorted(id(params) for _, batch in scheduled for params in batch) == sorted(map(id, parameter_sets))
+    for cost, batch in scheduled:
+        assert len(set(params["filename"] for params in batch)) == 1
+        assert cost == sum(bars[params["filename"]] for params in batch)
+    # Most expensive first, and batches get smaller towards the end.
+    costs = [cost for cost, _ in scheduled]
+    assert costs == sorted(costs, reverse=True)
+    assert scheduled[0][1][0]["filename"] == "1m.csv"
+    assert len(scheduled[0][1]) > 1
+    assert scheduled[-1][0] == 1
+
+
+def test_schedule_max_batch_size():
+    parameter_sets = [{"filename": "a.csv", "value": value} for value in range(10)]
+    scheduled = scheduling.schedule(parameter_sets, lambda params: params["value"], 1, 1)
+    assert [batch[0]["value"] for _, batch in scheduled] == list(range(9, -1, -1))
+    assert scheduling.schedule([], lambda params: 1, 4, 10) == []
+
+
+def test_schedule_windows():
+    consumed = []
+
+    def generate():
+        for value in range(10):
+            consumed.append(value)
+            yield {"filename": "a.csv", "value": value}
+
+    scheduled = scheduling.schedule_windows(generate(), lambda params: params["value"], 1, 1, window_size=4)
+    # Parameter sets are consumed one window at a time, and ordered within it.
+    assert next(scheduled)[1][0]["value"] == 3
+    assert consumed == [0, 1, 2, 3]
+    assert [batch[0]["value"] for _, batch in scheduled] == [2, 1, 0, 7, 6, 5, 4, 9, 8]
+    assert list(scheduling.schedule_windows([], lambda params: 1, 4, 10)) == []
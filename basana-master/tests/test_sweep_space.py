@@ -0,0 +1,160 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import operator
+
+import pytest
+
+from basana.core import errors
+from basana.sweep import space
+
+
+def values(spec):
+    return [str(value) for value in space.expand(spec)]
+
+
+def test_expand():
+    assert values([2.5, 3, "name"]) == ["2.5", "3", "name"]
+    assert values(10) == ["10"]
+    assert values({"start": 10, "stop": 30, "step": 10}) == ["10", "20", "30"]
+    assert values({"start": 10, "stop": 35, "step": 10}) == ["10", "20", "30"]
+    assert values({"start": 0.1, "stop": 0.3, "step": 0.1}) == ["0.1", "0.2", "0.3"]
+    assert values({"start": 0.5, "stop": 2, "num": 3}) == ["0.5", "1.25", "2"]
+    assert values({"start": 5, "stop": 200, "num": 5, "scale": "log"}) == ["5", "13", "32", "80", "200"]
+    assert values({"start": 1, "stop": 2, "num": 5, "scale": "log"}) == ["1", "2"]
+    assert values({"start": 1, "stop": 2, "num": 3, "scale": "log", "digits": 2}) == ["1", "1.41", "2"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"start": 1},
+    {"start": 1, "stop": 2},
+    {"start": 1, "stop": 2, "step": 0},
+    {"start": 1, "stop": 2, "step": 1, "scale": "log"},
+    {"start": 0, "stop": 2, "num": 3, "scale": "log"},
+    {"start": 1, "stop": 2, "num": 3, "scale": "quadratic"},
+    {"start": "a", "stop": 2, "step": 1},
+    {"start": 1, "stop": 2, "step": 1, "end": 3},
+])
+def test_invalid_ranges(spec):
+    with pytest.raises(errors.Error):
+        space.expand(spec)
+
+
+def test_constraint():
+    constraint = space.Constraint("ma_short * 2 <= ma_long < 100 and not stop_loss == -1")
+    assert constraint.names == {"ma_short", "ma_long", "stop_loss"}
+    assert constraint({"ma_short": Decimal(10), "ma_long": Decimal(20), "stop_loss": Decimal(1)})
+    assert not constraint({"ma_short": Decimal(10), "ma_long": Decimal(19), "stop_loss": Decimal(1)})
+    assert not constraint({"ma_short": Decimal(10), "ma_long": Decimal(100), "stop_loss": Decimal(1)})
+    assert not constraint({"ma_short": Decimal(10), "ma_long": Decimal(20), "stop_loss": Decimal(-1)})
+
+
+@pytest.mark.parametrize("expression", [
+    "ma_short <",
+    "__import__('os')",
+    "ma_short.real < 1",
+    "ma_short in [1, 2]",
+    "ma_short ** 2 < 1",
+])
+def test_invalid_constraints(expression):
+    with pytest.raises(errors.Error):
+        space.Constraint(expression)
+
+
+def test_parameter_space():
+    parameter_space = space.ParameterSpace.from_config(
+        {
+            "name": "test",
+            "ma_short": {"start": 10, "stop": 30, "step": 10},
+            "ma_long": [20, 30],
+            "stop_loss": [1, 2],
+            space.CONSTRAINTS_KEY: ["ma_short < ma_long", "symbol != 'ETH' or stop_loss == 1"],
+        },
+        groups=[{"symbol": "BTC"}, {"symbol": "ETH"}],
+    )
+    assert operator.length_hint(parameter_space) == 24
+    parameter_sets = list(parameter_space)
+    assert [
+        (params["symbol"], params["ma_short"], params["ma_long"], params["stop_loss"]) for params in parameter_sets
+    ] == [
+        ("BTC", 10, 20, 1), ("BTC", 10, 20, 2), ("BTC", 10, 30, 1), ("BTC", 10, 30, 2), ("BTC", 20, 30, 1),
+        ("BTC", 20, 30, 2),
+        ("ETH", 10, 20, 1), ("ETH", 10, 30, 1), ("ETH", 20, 30, 1),
+    ]
+    assert all(params["name"] == "test" for params in parameter_sets)
+    # Once generated, the length hint is exact.
+    assert operator.length_hint(parameter_space) == 9
+    # Iterating again yields the same combinations.
+    assert list(parameter_space) == parameter_sets
+
+
+def test_length_hint_is_estimated_while_iterating():
+    parameter_space = space.ParameterSpace.from_config(
+        {"a": [1, 2, 3, 4], "b": [1, 2, 3, 4], space.CONSTRAINTS_KEY: ["a <= b"]}
+    )
+    assert operator.length_hint(parameter_space) == 16
+    hints = []
+    for _ in parameter_space:
+        hints.append(operator.length_hint(parameter_space))
+    assert hints[-1] == 10
+    # The estimate is extrapolated from the combinations covered so far.
+    assert hints[0] == 16
+    assert hints[4] == 13
+
+    # Groups that don't satisfy the constraints are covered as a whole.
+    parameter_space = space.ParameterSpace.from_config(
+        {"a": [1, 2], space.CONSTRAINTS_KEY: ["symbol != 'ETH'"]}, groups=[{"symbol": "ETH"}, {"symbol": "BTC"}]
+    )
+    assert operator.length_hint(parameter_space) == 4
+    assert [operator.length_hint(parameter_space) for _ in parameter_space] == [1, 2]
+
+
+def test_precedence():
+    # Same as when constants, symbol data and combinations were merged in that order.
+    parameter_space = space.ParameterSpace.from_config(
+        {"fee": [3], "period": [1, 2]},
+        groups=[{"symbol": "BTC", "fee": 2, "period": 9}],
+        constants={"fee": 1, "timeframe": "1h", "symbol": "ETH", "sizes": [1, 2]},
+    )
+    assert list(parameter_space) == [
+        {"fee": 3, "timeframe": "1h", "symbol": "BTC", "sizes": [1, 2], "period": period} for period in (1, 2)
+    ]
+
+    parameter_space = space.ParameterSpace({}, constraints=["fee == 2"], groups=[{"fee": 2}], constants={"fee": 1})
+    assert list(parameter_space) == [{"fee": 2}]
+
+
+def test_constraints_prune_early():
+    calls = []
+
+    class Counting(space.Constraint):
+        def __call__(self, params):
+            calls.append(dict(params))
+            return super().__call__(params)
+
+    parameter_space = space.ParameterSpace({"a": [1, 2], "b": [1, 2, 3], "c": [1, 2, 3]}, constraints=["a > 1"])
+    parameter_space._constraints[1] = [Counting("a > 1")]
+    assert [(params["a"], params["b"], params["c"]) for params in parameter_space] == [
+        (2, b, c) for b in (1, 2, 3) for c in (1, 2, 3)
+    ]
+    # The constraint only depends on the first parameter so it is checked once per value.
+    assert len(calls) == 2
+
+
+def test_unknown_names_in_constraints():
+    with pytest.raises(errors.Error, match="Unknown parameters"):
+        space.ParameterSpace({"a": [1, 2]}, constraints=["a < b"])
@@ -0,0 +1,72 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import json
+
+import pytest
+
+from .helpers import temp_file_name
+from basana.sweep import telemetry
+
+
+def make_stats(durations, queue_wait=0.5, payload_size=100):
+    return telemetry.TaskStats(
+        queue_wait=queue_wait, wall_time=sum(durations), cpu_time=sum(durations) / 2, bars=100 * len(durations),
+        payload_size=payload_size, worker="host:1", durations=durations
+    )
+
+
+def test_bars_per_second():
+    assert make_stats([1, 1]).bars_per_second == 100
+    assert make_stats([]).bars_per_second == 0
+
+
+def test_telemetry():
+    with temp_file_name(suffix=".jsonl") as path:
+        with telemetry.Telemetry(path, report_interval=0, slowest=2) as sweep_telemetry:
+            sweep_telemetry.start(workers=2)
+            assert sweep_telemetry.eta() is None
+            sweep_telemetry.expect(4)
+            sweep_telemetry.record(
+                [{"value": 1, "dataset": "ignored"}, {"value": Decimal("2.5")}], make_stats([0.1, 0.3])
+            )
+            assert sweep_telemetry.eta() is not None
+            sweep_telemetry.record([{"value": 3}, {"value": 4}], make_stats([0.2, 0.05], 1.5, 300))
+
+            summary = sweep_telemetry.summary()
+            assert summary["tasks"] == 2
+            assert summary["backtests"] == 4
+            assert summary["bars"] == 400
+            assert summary["wall_time"] == pytest.approx(0.65)
+            assert summary["cpu_ratio"] == pytest.approx(0.5)
+            assert summary["avg_queue_wait"] == 1
+            assert summary["max_queue_wait"] == 1.5
+            assert summary["avg_payload_size"] == 200
+            assert summary["max_payload_size"] == 300
+            # The tasks took longer than the time that has elapsed, so workers were never idle.
+            assert summary["utilization"] > 1
+            assert summary["idle"] == 0
+            assert summary["slowest"] == [
+                {"params": {"value": "2.5"}, "duration": 0.3}, {"params": {"value": 3}, "duration": 0.2}
+            ]
+
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        assert [record["type"] for record in records] == ["task", "task", "summary"]
+        assert records[0]["durations"] == [0.1, 0.3]
+        assert records[1]["worker"] == "host:1"
+        assert records[2]["backtests"] == 4
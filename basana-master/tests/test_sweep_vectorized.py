@@ -0,0 +1,150 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+import asyncio
+
+from talipp.indicators import BB, RSI, SMA
+import numpy as np
+import pytest
+
+from .helpers import abs_data_path
+from basana.core import dispatcher
+from basana.core.enums import Position
+from basana.sweep import datasets, vectorized
+from samples.strategies import aspis_1, aspis_2, aspis_3
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return datasets.load_csv(abs_data_path("binance_btcusdt_day_2020.csv"))
+
+
+def talipp_values(indicator):
+    return np.array([np.nan if value is None else value for value in indicator], dtype=np.float64)
+
+
+def strategy_signals(dataset, strategy_factory):
+    ret = np.full(len(dataset), vectorized.NO_SIGNAL, dtype=np.int8)
+    bar_index = {}
+    backtesting_dispatcher = dispatcher.backtesting_dispatcher()
+    src = datasets.BarSource(aspis_1.bs.Pair("BTC", "USDT"), dataset, "1d")
+    strategy = strategy_factory(backtesting_dispatcher)
+
+    async def on_bar(bar_event):
+        bar_index[bar_event.when] = len(bar_index)
+
+    async def on_trading_signal(trading_signal):
+        ret[bar_index[trading_signal.when]] = 1 if trading_signal.position == Position.LONG else 0
+
+    backtesting_dispatcher.subscribe(src, on_bar)
+    backtesting_dispatcher.subscribe(src, strategy.on_bar_event)
+    strategy.subscribe_to_trading_signals(on_trading_signal)
+    asyncio.run(backtesting_dispatcher.run())
+    return ret
+
+
+def test_indicators_match_talipp(dataset):
+    close = list(dataset.close)
+
+    assert np.allclose(vectorized.rsi(dataset.close, 7), talipp_values(RSI(7, close)), equal_nan=True)
+    assert np.allclose(vectorized.sma(dataset.close, 20), talipp_values(SMA(20, close)), equal_nan=True)
+
+    bb = BB(20, 2, close)
+    lower = np.array([np.nan if value is None else value.lb for value in bb])
+    assert np.allclose(
+        vectorized.sma(dataset.close, 20) - 2 * vectorized.stddev(dataset.close, 20), lower, equal_nan=True
+    )
+    assert np.isnan(vectorized.rsi(dataset.close[:7], 7)).all()
+
+
+@pytest.mark.parametrize("strategy, params, strategy_factory", [
+    (
+        "aspis_1", {"oversold_level": 30, "overbought_level": 70},
+        lambda d: aspis_1.Strategy(d, 7, 30, 70),
+    ),
+    (
+        "aspis_2", {"rsi_threshold": 50, "ma_short": 10, "ma_long": 30},
+        lambda d: aspis_2.Strategy(d, 7, 10, 30, 50),
+    ),
+    (
+        "aspis_3", {"ma_short": 5, "ma_long": 20, "bb_period": 20, "bb_std_dev": 1.5},
+        lambda d: aspis_3.Strategy(d, 5, 20, 20, 1.5),
+    ),
+])
+def test_signals_match_strategies(dataset, strategy, params, strategy_factory):
+    signals_fun, _ = vectorized.STRATEGIES[strategy]
+    signals = signals_fun(dataset, {name: np.array([value], dtype=np.float64) for name, value in params.items()})
+
+    expected = strategy_signals(dataset, strategy_factory)
+    assert (expected != vectorized.NO_SIGNAL).any()
+    assert (signals[0] == expected).all()
+
+
+def test_simulate():
+    bars = datasets.Dataset(
+        datetime=np.arange(5, dtype=np.int64) * 86400,
+        open=np.array([10, 10, 20, 20, 40], dtype=np.float64),
+        high=np.array([10, 20, 20, 40, 40], dtype=np.float64),
+        low=np.array([10, 10, 20, 20, 40], dtype=np.float64),
+        close=np.array([10, 20, 20, 40, 40], dtype=np.float64),
+        volume=np.ones(5),
+    )
+    signals = np.array([
+        [vectorized.LONG, vectorized.NO_SIGNAL, vectorized.NEUTRAL, vectorized.NO_SIGNAL, vectorized.NO_SIGNAL],
+        [vectorized.NO_SIGNAL] * 5,
+    ], dtype=np.int8)
+
+    metrics = vectorized.simulate(
+        bars, signals, np.array([100.0, 100.0]), np.array([50.0, 50.0]), np.array([10.0, 10.0]), fee_pct=0
+    )
+    # Bought 5 units at 10 and sold them at 20.
+    assert metrics["profit"][0] == pytest.approx(50)
+    assert metrics["max_drawdown"][0] == pytest.approx(0)
+    assert metrics["profit"][1] == 0
+    assert np.isnan(metrics["sharpe"][1])
+
+
+def test_evaluate_is_independent_of_chunk_size(dataset):
+    parameter_sets = [
+        {
+            "oversold_level": oversold, "overbought_level": 70, "initial_capital": Decimal(10000),
+            "sizing": Decimal(1000), "stop_loss": Decimal(5),
+        }
+        for oversold in range(20, 45, 5)
+    ]
+    expected = vectorized.evaluate("aspis_1", dataset, parameter_sets)
+    assert len(expected) == len(parameter_sets)
+    for chunked, result in zip(vectorized.evaluate("aspis_1", dataset, parameter_sets, chunk_size=2), expected):
+        assert chunked == pytest.approx(result, nan_ok=True)
+
+
+def test_prescreen(dataset):
+    parameter_sets = [
+        {
+            "symbol": symbol, "filename": "binance_btcusdt_day_2020.csv", "oversold_level": oversold,
+            "overbought_level": 70, "initial_capital": 10000, "sizing": 1000, "stop_loss": 5,
+        }
+        for symbol in ("BTC", "ETH")
+        for oversold in range(20, 45, 5)
+    ]
+    metrics = vectorized.evaluate("aspis_1", dataset, parameter_sets[:5])
+    best = max(range(5), key=lambda i: (-np.inf if np.isnan(metrics[i]["sharpe"]) else metrics[i]["sharpe"], -i))
+
+    selected = vectorized.prescreen("aspis_1", parameter_sets, lambda filename: dataset, 1)
+    assert selected == [parameter_sets[best], parameter_sets[best + 5]]
+
+    assert vectorized.prescreen("aspis_1", parameter_sets, lambda filename: dataset, 10) == parameter_sets
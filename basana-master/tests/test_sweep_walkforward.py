@@ -0,0 +1,73 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from basana.sweep import walkforward
+from basana.sweep.walkforward import Window
+
+
+def test_windows():
+    assert walkforward.windows(10, 4, 2) == [Window(0, 4, 6), Window(2, 6, 8), Window(4, 8, 10)]
+    assert walkforward.windows(9, 4, 2) == [Window(0, 4, 6), Window(2, 6, 8), Window(4, 8, 9)]
+    assert walkforward.windows(10, 4, 2, step=3) == [Window(0, 4, 6), Window(3, 7, 9)]
+    assert walkforward.windows(10, 4, 3, anchored=True) == [Window(0, 4, 7), Window(0, 7, 10)]
+    assert walkforward.windows(4, 4, 2) == []
+
+
+def test_walk_forward():
+    parameter_sets = [
+        {"symbol": symbol, "filename": f"{symbol}.csv", "value": value}
+        for symbol in ("BTC", "ETH") for value in range(3)
+    ]
+    requests = []
+
+    def evaluate(windows):
+        requests.append(windows)
+        ret = []
+        for start, stop, candidates in windows:
+            # The best value changes with the window, and ETH has no results in its first window.
+            ret.append([
+                None if params["symbol"] == "ETH" and start == 0 else {
+                    "sharpe": -abs(params["value"] - start % 3), "profit": params["value"] * 10
+                }
+                for params in candidates
+            ])
+        return ret
+
+    window_results = walkforward.walk_forward(
+        parameter_sets, evaluate, lambda filename: 7, in_sample=3, out_of_sample=2
+    )
+    # All in-sample windows are evaluated together, and then all out-of-sample windows.
+    assert len(requests) == 2
+    assert [(start, stop, len(candidates)) for start, stop, candidates in requests[0]] == [
+        (0, 3, 3), (2, 5, 3), (0, 3, 3), (2, 5, 3)
+    ]
+    assert [(start, stop) for start, stop, _ in requests[1]] == [(3, 5), (5, 7), (5, 7)]
+
+    assert [window_result.group for window_result in window_results] == [
+        ("BTC", "BTC.csv"), ("BTC", "BTC.csv"), ("ETH", "ETH.csv"), ("ETH", "ETH.csv")
+    ]
+    assert [
+        None if window_result.params is None else window_result.params["value"] for window_result in window_results
+    ] == [0, 2, None, 2]
+    assert window_results[1].in_sample_result == {"sharpe": 0, "profit": 20}
+    assert window_results[1].out_of_sample_result == {"sharpe": 0, "profit": 20}
+    assert window_results[2].out_of_sample_result is None
+
+    equity = walkforward.stitch(window_results, initial_equity=100)
+    assert equity[("BTC", "BTC.csv")] == pytest.approx([100, 100, 120])
+    assert equity[("ETH", "ETH.csv")] == pytest.approx([100, 100, 120])
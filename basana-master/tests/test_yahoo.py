@@ -17,12 +17,16 @@
 from decimal import Decimal
 import asyncio
 import datetime
+import pickle
+import shutil
+import tempfile
 
 from dateutil import tz
 import pytest
 
 from . import helpers
 from basana.core import pair, bar
+from basana.core.event_sources import csv
 from basana.core.helpers import round_decimal
 from basana.external.yahoo import bars
 
@@ -130,3 +134,52 @@ def test_row_parser_sanitization(row_dict):
     row_parser = bars.RowParser(pair.Pair("ORCL", "USD"))
     row_parser.sanitize = True
     row_parser.parse_row(row_dict)
+
+
+@pytest.mark.parametrize("filename", ["orcl-2000-yahoo.csv", "orcl-2000-yahoo-sorted.csv"])
+@pytest.mark.parametrize("max_events_in_memory", [1, 10, 100, 1000])
+def test_load_sort_and_yield(filename, max_events_in_memory):
+    row_parser = bars.RowParser(pair.Pair("ORCL", "USD"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = shutil.copy(helpers.abs_data_path(filename), tmp_dir)
+        expected = sorted(csv.load_and_yield(path, row_parser), key=lambda ev: ev.when)
+
+        for _ in range(2):
+            events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=max_events_in_memory))
+            assert [ev.when for ev in events] == [ev.when for ev in expected]
+            assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+
+
+@pytest.mark.parametrize("max_events_in_memory", [1, 7, 100, 1000])
+def test_load_sort_and_yield_partially_sorted(max_events_in_memory):
+    with open(helpers.abs_data_path("orcl-2000-yahoo-sorted.csv")) as f:
+        header, *rows = f.readlines()
+    # Move a few rows towards the end of the file.
+    rows = rows[:100] + rows[110:200] + rows[100:110] + rows[200:]
+    row_parser = bars.RowParser(pair.Pair("ORCL", "USD"))
+
+    with helpers.temp_file_name(suffix=".csv") as path:
+        with open(path, "w") as f:
+            f.writelines([header] + rows)
+        events = list(csv.load_sort_and_yield(path, row_parser, max_events_in_memory=max_events_in_memory))
+        expected = list(csv.load_and_yield(helpers.abs_data_path("orcl-2000-yahoo-sorted.csv"), row_parser))
+
+    assert len(events) == 252
+    assert [ev.when for ev in events] == [ev.when for ev in expected]
+    assert [ev.bar.close for ev in events] == [ev.bar.close for ev in expected]
+    assert helpers.is_sorted([ev.when for ev in events])
+
+
+def test_spilled_events_are_removed_on_errors(monkeypatch):
+    spilled = []
+    temporary_file = tempfile.TemporaryFile
+
+    def spy_temporary_file():
+        spilled.append(temporary_file())
+        return spilled[-1]
+
+    monkeypatch.setattr(tempfile, "TemporaryFile", spy_temporary_file)
+    # Functions defined locally can't be pickled.
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        csv._spill([lambda: None])
+    assert spilled[0].closed
@@ -0,0 +1,53 @@
+# Basana
+#
+# Copyright 2022 Gabriel Martin Becedillas Ruiz
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the time it takes to parse CSV files with bars, using rows as dicts and as lists of values.
+
+Usage, from the root of the repository: ``python -m tools.benchmarks.csvbench tests/data/*.csv``
+"""
+
+from typing import List, Optional
+import argparse
+import datetime
+import time
+
+from basana.core import pair
+from basana.core.event_sources import csv
+from basana.external.common.csv import bars
+
+
+def _parse(csv_path: str, dict_reader_kwargs: dict) -> float:
+    row_parser = bars.RowParser(pair.Pair("BASE", "QUOTE"), datetime.timezone.utc, datetime.timedelta(minutes=1))
+    begin = time.perf_counter()
+    for _ in csv.load_and_yield(csv_path, row_parser, dict_reader_kwargs=dict_reader_kwargs):
+        pass
+    return time.perf_counter() - begin
+
+
+def main(params: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks parsing CSV files with bars.")
+    parser.add_argument("csv_files", nargs="+", help="CSV files with datetime,open,high,low,close,volume columns.")
+    args = parser.parse_args(args=params)
+
+    for csv_path in args.csv_files:
+        # Passing arguments to the DictReader disables the fast path.
+        dicts = _parse(csv_path, {"delimiter": ","})
+        values = _parse(csv_path, {})
+        print(f"{csv_path}: dicts {dicts:.2f}s, values {values:.2f}s, {dicts / values:.1f}x")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()